@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""插件正则分发基准测试：对比前缀字典树索引与全量扫描的匹配耗时
+
+用法: python bench/dispatch_bench.py [--handlers 2000] [--messages 20000]
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import web.app  # noqa: F401  与 main.py 保持一致的导入顺序，避免循环导入
+from core.plugin.PluginManager import PluginManager
+
+_COMMAND_WORDS = ['签到', '查询', '抽卡', '帮助', '菜单', '天气', '点歌', '商店', '背包', '排行']
+
+
+def _build_patterns(count):
+    patterns = []
+    for i in range(count):
+        word = _COMMAND_WORDS[i % len(_COMMAND_WORDS)]
+        kind = i % 50
+        if kind < 30:
+            patterns.append(f"^{word}{i}$")
+        elif kind < 40:
+            patterns.append(f"^{word}{i}\\s*(\\d+)$")
+        elif kind < 49:
+            patterns.append(f"^(?:{word}|cmd){i}(.*)$")
+        else:
+            # 少量无字面量前缀的正则，每条消息都需要尝试
+            patterns.append(f".*关键词{i}.*")
+    return patterns
+
+
+def _make_plugin(patterns):
+    def handler(event):
+        return True
+
+    attrs = {'priority': 10, 'handle': staticmethod(handler)}
+    attrs['get_regex_handlers'] = staticmethod(lambda: {p: 'handle' for p in patterns})
+    return type('BenchPlugin', (object,), attrs)
+
+
+def _linear_scan(content):
+    matched = []
+    for handler_cache in PluginManager._handler_index[0]:
+        match = handler_cache['regex'].search(content)
+        if match:
+            matched.append(handler_cache['pattern'])
+    return matched
+
+
+def _indexed_scan(content):
+    return [h['pattern'] for h in PluginManager._find_matched_handlers(content, None, True, True)]
+
+
+def _run(func, messages):
+    start = time.perf_counter()
+    for content in messages:
+        func(content)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description='插件正则分发基准测试')
+    parser.add_argument('--handlers', type=int, default=2000)
+    parser.add_argument('--messages', type=int, default=20000)
+    args = parser.parse_args()
+
+    patterns = _build_patterns(args.handlers)
+    PluginManager.register_plugin(_make_plugin(patterns))
+    PluginManager._rebuild_handler_index()
+
+    rng = random.Random(0)
+    messages = []
+    for _ in range(args.messages):
+        i = rng.randrange(args.handlers)
+        word = _COMMAND_WORDS[i % len(_COMMAND_WORDS)]
+        messages.append(rng.choice([f"{word}{i}", f"{word}{i} 42", f"随便聊聊{i}", "含有关键词49的消息"]))
+
+    for content in messages[:1000]:
+        assert _linear_scan(content) == _indexed_scan(content), content
+
+    linear = _run(_linear_scan, messages)
+    indexed = _run(_indexed_scan, messages)
+    per_msg = lambda total: total / len(messages) * 1e6
+    print(f"处理器数量: {args.handlers}, 消息数量: {len(messages)}")
+    print(f"全量扫描: {linear:.3f}s ({per_msg(linear):.1f}us/条)")
+    print(f"前缀索引: {indexed:.3f}s ({per_msg(indexed):.1f}us/条)")
+    print(f"加速比: {linear / indexed:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
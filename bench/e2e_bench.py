@@ -0,0 +1,377 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""端到端基准：按指定速率回放 op0 事件，测量 webhook -> 插件 -> BOTAPI 回复的完整链路
+
+被测进程与生产一致：eventlet monkey_patch、main.py 中的 webhook 路由与 process_message_event、
+plugins/ 下的插件与基准回复插件一起参与分发，入库流水线 / 日志库均为真实实现。外部依赖全部换成本地替身：
+  - QQ 开放平台：子进程中的本地 HTTP 服务，应答取 Token 与发消息接口，记录回复到达时间
+  - MySQL：默认使用 bench/sqlite_mysql.py 的 SQLite 文件库替身，--mysql 时使用 config.py 中的真实库
+压测端与假 API 同在子进程，按计划时间开环发送（延迟从计划发送时刻算起，不受协调遗漏影响），
+被测进程只运行机器人本身，线程数与 RSS 采样不受压测端干扰。
+
+回放数据: --payloads 指定 JSONL 文件，每行一条录制的 webhook 请求体（{"op": 0, "t": ..., "d": {...}}），
+循环回放并把 d.id 改写为唯一值以关联回复；不指定时生成群聊/私聊 @ 消息，
+其中 --reply-ratio 比例的消息命中基准插件并回复 pong。
+
+用法: python bench/e2e_bench.py [--rate 200] [--duration 20] [--payloads op0.jsonl] [--api-latency 0.02] [--mysql]
+"""
+
+import os
+import sys
+import time
+import json
+import argparse
+import threading
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_MAIN_FUNCTIONS = ('create_app', 'process_message_event', 'log_error', 'log_to_console', 'cleanup_gc')
+_ECHO_PATTERN = r'^/?ping'
+
+
+def _percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+# ==================== 压测端（子进程：假 QQ API + 负载生成） ====================
+
+class _Peer:
+    def __init__(self, api_latency):
+        self.api_latency = api_latency
+        self.lock = threading.Lock()
+        self.replies = {}        # msg_id -> 回复到达时间
+        self.api_calls = 0
+        self.result = None
+        self.done = threading.Event()
+
+    def _synthetic_payloads(self, groups, users, reply_ratio):
+        step = max(1, round(1 / reply_ratio)) if reply_ratio > 0 else 0
+        for n in range(groups * 4):
+            group, user = f'BENCHGROUP{n % groups:04d}', f'BENCHUSER{n % users:05d}'
+            content = f' ping {n}' if step and n % step == 0 else f' 闲聊 {n}'
+            if n % 4 == 3:
+                yield {'op': 0, 't': 'C2C_MESSAGE_CREATE', 'd': {
+                    'id': '', 'content': content, 'timestamp': '', 'author': {'id': user, 'union_openid': user}}}
+            else:
+                yield {'op': 0, 't': 'GROUP_AT_MESSAGE_CREATE', 'd': {
+                    'id': '', 'content': content, 'timestamp': '', 'group_id': group, 'group_openid': group,
+                    'author': {'id': user, 'member_openid': user, 'union_openid': user}}}
+
+    def _load_payloads(self, spec):
+        if spec['payloads']:
+            with open(spec['payloads'], encoding='utf-8') as f:
+                templates = [p for p in (json.loads(line) for line in f if line.strip()) if p.get('op') == 0]
+            if not templates:
+                raise SystemExit(f"{spec['payloads']} 中没有 op0 事件")
+            return templates
+        return list(self._synthetic_payloads(spec['groups'], spec['users'], spec['reply_ratio']))
+
+    def run_load(self, spec):
+        import http.client
+        from urllib.parse import urlsplit
+
+        templates = self._load_payloads(spec)
+        url = urlsplit(spec['webhook'])
+        rate, total = spec['rate'], int(spec['rate'] * spec['duration']) if spec['rate'] > 0 else None
+        deadline_run = time.time() + spec['duration']
+        counter = iter(range(10 ** 12))
+        counter_lock = threading.Lock()
+        sent, acks, errors = {}, [], [0]
+
+        def worker():
+            conn = http.client.HTTPConnection(url.hostname, url.port, timeout=30)
+            while True:
+                with counter_lock:
+                    n = next(counter)
+                if total is not None and n >= total:
+                    break
+                scheduled = t0 + n / rate if rate > 0 else time.time()
+                if rate <= 0 and scheduled >= deadline_run:
+                    break
+                delay = scheduled - time.time()
+                if delay > 0:
+                    time.sleep(delay)
+                payload = dict(templates[n % len(templates)])
+                payload['d'] = dict(payload['d'], id=f'BENCH-{n}')
+                body = json.dumps(payload, ensure_ascii=False).encode()
+                with self.lock:
+                    sent[payload['d']['id']] = scheduled
+                try:
+                    conn.request('POST', url.path or '/', body, {'Content-Type': 'application/json'})
+                    resp = conn.getresponse()
+                    resp.read()
+                    if resp.status != 200:
+                        errors[0] += 1
+                    acks.append(time.time() - scheduled)
+                except Exception:
+                    errors[0] += 1
+                    conn.close()
+                    conn = http.client.HTTPConnection(url.hostname, url.port, timeout=30)
+            conn.close()
+
+        t0 = time.time() + 0.1
+        threads = [threading.Thread(target=worker, daemon=True) for _ in range(spec['concurrency'])]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        send_end = time.time()
+
+        # 等待回复排空：连续 drain 秒没有新回复即结束
+        last_count, last_change = -1, time.time()
+        while time.time() - last_change < spec['drain']:
+            with self.lock:
+                count = len(self.replies)
+            if count != last_count:
+                last_count, last_change = count, time.time()
+            time.sleep(0.1)
+
+        with self.lock:
+            latencies = [self.replies[k] - sent[k] for k in self.replies if k in sent]
+            last_reply = max(self.replies.values()) if self.replies else send_end
+            api_calls = self.api_calls
+        self.result = {
+            'sent': len(sent), 'errors': errors[0], 'send_seconds': send_end - t0,
+            'replies': len(latencies), 'reply_seconds': max(last_reply - t0, 1e-9), 'api_calls': api_calls,
+            'ack_p50': _percentile(acks, 50), 'ack_p99': _percentile(acks, 99),
+            'e2e_p50': _percentile(latencies, 50), 'e2e_p99': _percentile(latencies, 99),
+            'e2e_max': max(latencies) if latencies else 0.0,
+        }
+        self.done.set()
+
+    def make_handler(self):
+        from http.server import BaseHTTPRequestHandler
+        peer = self
+
+        class ApiHandler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def _reply(self, obj):
+                body = json.dumps(obj).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _body(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                raw = self.rfile.read(length) if length else b''
+                try:
+                    return json.loads(raw) if raw else {}
+                except ValueError:
+                    return {}
+
+            def do_POST(self):
+                data = self._body()
+                arrived = time.time()
+                if self.path == '/__bench/start':
+                    threading.Thread(target=peer.run_load, args=(data,), daemon=True).start()
+                    return self._reply({})
+                if self.path.endswith('/getAppAccessToken'):
+                    return self._reply({'access_token': 'bench-token', 'expires_in': '7200'})
+                time.sleep(peer.api_latency)
+                with peer.lock:
+                    peer.api_calls += 1
+                    if self.path.endswith('/messages') and data.get('msg_id'):
+                        peer.replies.setdefault(data['msg_id'], arrived)
+                self._reply({'id': f'REPLY-{data.get("msg_id", "")}', 'timestamp': int(arrived)})
+
+            def do_GET(self):
+                if self.path == '/__bench/result':
+                    peer.done.wait()
+                    return self._reply(peer.result)
+                self._reply({})
+
+            def do_DELETE(self):
+                self._reply({})
+
+            def log_message(self, *args):
+                pass
+        return ApiHandler
+
+
+def _run_peer(api_latency):
+    from http.server import ThreadingHTTPServer
+    peer = _Peer(api_latency)
+    server = ThreadingHTTPServer(('127.0.0.1', 0), peer.make_handler())
+    server.daemon_threads = True
+    print(server.server_address[1], flush=True)
+    server.serve_forever()
+
+
+# ==================== 被测进程 ====================
+
+def _load_main_functions(namespace):
+    """从 main.py 取出 webhook 路由与消息处理函数定义，避免 import main 触发配置向导与完整启动流程"""
+    import ast
+    path = os.path.join(_ROOT, 'main.py')
+    with open(path, encoding='utf-8') as f:
+        tree = ast.parse(f.read(), path)
+    nodes = [n for n in tree.body if isinstance(n, ast.FunctionDef) and n.name in _MAIN_FUNCTIONS]
+    exec(compile(ast.Module(body=nodes, type_ignores=[]), path, 'exec'), namespace)
+    return namespace
+
+
+def _make_echo_plugin():
+    def handle(event):
+        event.reply('pong')
+        return True
+
+    return type('BenchEchoPlugin', (object,), {
+        'priority': 10, 'handle': staticmethod(handle),
+        'get_regex_handlers': staticmethod(lambda: {_ECHO_PATTERN: 'handle'}),
+    })
+
+
+class _Sampler:
+    def __init__(self, interval=0.5):
+        import psutil
+        self.process = psutil.Process()
+        self.interval = interval
+        self.samples = []
+        self._stop = False
+
+    def sample(self):
+        self.samples.append((self.process.num_threads(), threading.active_count(), self.process.memory_info().rss))
+
+    def run(self):
+        while not self._stop:
+            self.sample()
+            time.sleep(self.interval)
+
+    def stop(self):
+        self._stop = True
+        self.sample()
+
+
+def _run_bench(args):
+    import eventlet
+    eventlet.monkey_patch(all=True, thread=True, socket=True, select=True, time=True)
+    # httpcore 会探测可选依赖 trio，而 eventlet 打补丁后的 select 没有 epoll，环境里装了 trio 时按未安装处理
+    sys.modules.setdefault('trio', None)
+    import subprocess
+    import tempfile
+    import requests
+
+    sys.path.insert(0, _ROOT)
+    db_file = None
+    if not args.mysql:
+        from bench import sqlite_mysql
+        db_file = args.db_file or os.path.join(tempfile.mkdtemp(prefix='e2e_bench_'), 'bench.db')
+        sqlite_mysql.install(db_file)
+
+    peer_proc = subprocess.Popen([sys.executable, os.path.abspath(__file__), '--peer', '--api-latency', str(args.api_latency)],
+                                 stdout=subprocess.PIPE, text=True)
+    api_base = f"http://127.0.0.1:{int(peer_proc.stdout.readline())}"
+
+    import web.app  # noqa: F401  与 main.py 保持一致的导入顺序，避免循环导入
+    import function.Access as access
+    access._API_BASE = access._SANDBOX_API_BASE = api_base
+    access._TOKEN_URL = f"{api_base}/app/getAppAccessToken"
+    access.获取新Token()
+
+    import gc
+    import logging
+    import traceback
+    from flask import Flask, request, jsonify
+    from flask_socketio import SocketIO
+    from function.ingest_pipeline import submit_ingest_task, get_ingest_stats
+    from function.log_db import add_framework_log, add_error_log, log_db_manager
+    from function.database import Database
+    from function.dau_analytics import start_dau_analytics, stop_dau_analytics
+    from core.plugin.PluginManager import PluginManager
+
+    ready = threading.Event()
+    ready.set()
+    main_ns = _load_main_functions({
+        '__name__': 'main', 'json': json, 'gc': gc, 'threading': threading, 'traceback': traceback, 'logger': logging.getLogger('ElainaBot'),
+        'Flask': Flask, 'request': request, 'jsonify': jsonify, 'SocketIO': SocketIO,
+        'submit_ingest_task': submit_ingest_task, 'add_framework_log': add_framework_log, 'add_error_log': add_error_log,
+        '_gc_counter': 0, '_message_handler_ready': ready, '_plugins_preloaded': True, '_message_executor': None,
+    })
+
+    # 与 main.init_systems 相同：先初始化数据库与插件，再开始接收消息
+    Database()
+    PluginManager.load_plugins()
+    PluginManager.register_plugin(_make_echo_plugin(), skip_log=True)
+    PluginManager._rebuild_handler_index()
+    start_dau_analytics()
+
+    import eventlet.wsgi
+    app = main_ns['create_app']()
+    listener = eventlet.listen(('127.0.0.1', 0))
+    eventlet.spawn(eventlet.wsgi.server, listener, app, log_output=False)
+    webhook = f"http://127.0.0.1:{listener.getsockname()[1]}/"
+
+    sampler = _Sampler()
+    sampler.sample()
+    eventlet.spawn(sampler.run)
+
+    spec = {'webhook': webhook, 'rate': args.rate, 'duration': args.duration, 'concurrency': args.concurrency,
+            'payloads': os.path.abspath(args.payloads) if args.payloads else None, 'reply_ratio': args.reply_ratio,
+            'groups': args.groups, 'users': args.users, 'drain': args.drain}
+    requests.post(f"{api_base}/__bench/start", json=spec, timeout=10)
+    result = requests.get(f"{api_base}/__bench/result", timeout=args.duration + 600).json()
+    sampler.stop()
+
+    flush_start = time.perf_counter()
+    log_db_manager._save_logs_to_db()
+    flush_ms = (time.perf_counter() - flush_start) * 1000
+    ingest = get_ingest_stats()
+    stop_dau_analytics()
+    peer_proc.kill()
+
+    os_threads = [s[0] for s in sampler.samples]
+    py_threads = [s[1] for s in sampler.samples]
+    rss = [s[2] / 1024 / 1024 for s in sampler.samples]
+    print(f"数据库: {'MySQL (config.py)' if args.mysql else 'SQLite 替身 ' + db_file}"
+          f"{' (降级为文本日志)' if log_db_manager._fallback_mode else ''}")
+    print(f"发送: {result['sent']} 条 / {result['send_seconds']:.1f}s, 失败 {result['errors']}, "
+          f"webhook 应答 p50 {result['ack_p50'] * 1000:.1f}ms p99 {result['ack_p99'] * 1000:.1f}ms")
+    print(f"回复: {result['replies']} 条, 吞吐 {result['replies'] / result['reply_seconds']:.1f} 条/s, "
+          f"端到端 p50 {result['e2e_p50'] * 1000:.1f}ms p99 {result['e2e_p99'] * 1000:.1f}ms "
+          f"max {result['e2e_max'] * 1000:.1f}ms, API 调用 {result['api_calls']}")
+    print(f"线程: OS {os_threads[0]} -> 峰值 {max(os_threads)}, threading/绿色线程 {py_threads[0]} -> 峰值 {max(py_threads)}")
+    print(f"RSS: {rss[0]:.1f}MB -> 峰值 {max(rss):.1f}MB, 结束 {rss[-1]:.1f}MB")
+    print(f"入库流水线: 处理 {ingest.get('processed', 0)}, 失败 {ingest.get('failed', 0)}, "
+          f"丢弃 {ingest.get('dropped', 0)}, 最大积压 {ingest.get('max_depth', 0)}; 日志库收尾写入 {flush_ms:.1f}ms")
+    if not args.mysql:
+        stats = sqlite_mysql.get_stats()
+        print(f"SQLite 替身: 执行 {stats['statements']} 条语句, 失败 {sum(stats['errors'].values())} 条")
+        for key, count in sorted(stats['errors'].items(), key=lambda x: -x[1])[:10]:
+            print(f"  {count:>6} × {key}")
+    if args.json:
+        result.update({'os_threads_peak': max(os_threads), 'threads_peak': max(py_threads), 'rss_peak_mb': max(rss),
+                       'ingest': ingest, 'log_flush_ms': flush_ms})
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rate', type=float, default=200, help='每秒发送事件数，0 表示闭环尽力发送')
+    parser.add_argument('--duration', type=float, default=20, help='发送持续时间(秒)')
+    parser.add_argument('--concurrency', type=int, default=32, help='压测端并发连接数')
+    parser.add_argument('--payloads', help='录制的 op0 事件 JSONL 文件')
+    parser.add_argument('--reply-ratio', type=float, default=0.5, help='生成事件中命中回复插件的比例')
+    parser.add_argument('--groups', type=int, default=200)
+    parser.add_argument('--users', type=int, default=5000)
+    parser.add_argument('--api-latency', type=float, default=0.02, help='假 API 每次调用的模拟延迟(秒)')
+    parser.add_argument('--drain', type=float, default=3, help='发送结束后等待回复的静默时间(秒)')
+    parser.add_argument('--mysql', action='store_true', help='使用 config.py 中的 MySQL 而非 SQLite 替身')
+    parser.add_argument('--db-file', help='SQLite 替身的数据库文件路径，默认使用临时目录')
+    parser.add_argument('--json', help='把结果另存为 JSON 文件')
+    parser.add_argument('--peer', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.peer:
+        _run_peer(args.api_latency)
+    else:
+        _run_bench(args)
+
+
+if __name__ == '__main__':
+    main()
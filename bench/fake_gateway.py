@@ -0,0 +1,183 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""本地模拟 QQ 机器人网关，用于验证 WebSocketClient 的 RESUME / RECONNECT / INVALID_SESSION 及多分片
+
+网关为每个分片维护会话与事件序列号，断线期间产生的事件缓存在会话中，客户端 RESUME 后按 seq 补发。
+运行时按顺序注入故障：异常断开(4009) -> op7 RECONNECT -> op9 INVALID_SESSION(可恢复)。
+
+用法: python bench/fake_gateway.py [--shards 2] [--events 60] [--interval 0.02]
+"""
+
+import os
+import sys
+import json
+import uuid
+import asyncio
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import web.app  # noqa: F401  与 main.py 保持一致的导入顺序，避免循环导入
+import websockets
+from function.ws_client import WebSocketClient, _OP_DISPATCH, _OP_HEARTBEAT, _OP_IDENTIFY, _OP_RESUME, \
+    _OP_RECONNECT, _OP_INVALID_SESSION, _OP_HELLO, _OP_HEARTBEAT_ACK
+
+_FAULTS = ('drop', 'reconnect', 'invalid_session')
+
+
+class _Session:
+    __slots__ = ('session_id', 'shard', 'events', 'ws')
+
+    def __init__(self, shard):
+        self.session_id = uuid.uuid4().hex
+        self.shard = shard
+        self.events = []   # (seq, payload)
+        self.ws = None
+
+
+class FakeGateway:
+    def __init__(self, shards, heartbeat_interval=1000):
+        self.shards = shards
+        self.heartbeat_interval = heartbeat_interval
+        self.sessions = {}          # session_id -> _Session
+        self.by_shard = {}          # shard_id -> _Session
+        self.stats = {'identify': 0, 'resume': 0, 'resume_replayed': 0, 'heartbeat': 0, 'shards_seen': set()}
+
+    async def handler(self, ws):
+        await ws.send(json.dumps({'op': _OP_HELLO, 'd': {'heartbeat_interval': self.heartbeat_interval}}))
+        session = None
+        try:
+            async for raw in ws:
+                data = json.loads(raw)
+                op, d = data.get('op'), data.get('d')
+                if op == _OP_HEARTBEAT:
+                    self.stats['heartbeat'] += 1
+                    await ws.send(json.dumps({'op': _OP_HEARTBEAT_ACK}))
+                elif op == _OP_IDENTIFY:
+                    self.stats['identify'] += 1
+                    shard_id, total = d['shard']
+                    assert total == self.shards, f"分片总数不一致: {d['shard']}"
+                    self.stats['shards_seen'].add(shard_id)
+                    session = _Session(shard_id)
+                    self.sessions[session.session_id] = session
+                    self.by_shard[shard_id] = session
+                    session.ws = ws
+                    await self._dispatch(session, 'READY', {'session_id': session.session_id, 'user': {'username': f'fake-shard-{shard_id}'}, 'shard': d['shard']})
+                elif op == _OP_RESUME:
+                    session = self.sessions.get(d.get('session_id'))
+                    if not session:
+                        await ws.send(json.dumps({'op': _OP_INVALID_SESSION, 'd': False}))
+                        continue
+                    self.stats['resume'] += 1
+                    session.ws = ws
+                    missed = [p for seq, p in session.events if seq > d.get('seq', 0)]
+                    self.stats['resume_replayed'] += len(missed)
+                    for payload in missed:
+                        await ws.send(payload)
+                    await ws.send(json.dumps({'op': _OP_DISPATCH, 't': 'RESUMED', 'd': {}}))
+        except websockets.exceptions.ConnectionClosed:
+            pass
+        finally:
+            if session and session.ws is ws:
+                session.ws = None
+
+    async def _dispatch(self, session, event_type, event_data):
+        seq = len(session.events) + 1
+        payload = json.dumps({'op': _OP_DISPATCH, 's': seq, 't': event_type, 'd': event_data}, ensure_ascii=False)
+        session.events.append((seq, payload))
+        if session.ws:
+            try:
+                await session.ws.send(payload)
+            except websockets.exceptions.ConnectionClosed:
+                session.ws = None
+
+    async def produce(self, count, interval):
+        """向每个分片推送 count 条群消息，并在 1/4、2/4、3/4 处依次注入故障"""
+        while len(self.by_shard) < self.shards:
+            await asyncio.sleep(0.01)
+        fault_points = {count * (i + 1) // 4: fault for i, fault in enumerate(_FAULTS)}
+        burst = 0
+        for n in range(1, count + 1):
+            for shard_id, session in list(self.by_shard.items()):
+                await self._dispatch(session, 'GROUP_AT_MESSAGE_CREATE', {
+                    'id': f'msg-{shard_id}-{n}', 'group_id': f'group-{shard_id}', 'content': f'事件{n}',
+                    'author': {'id': f'user-{n}'}, 'index': n})
+            fault = fault_points.get(n)
+            if fault:
+                await self._inject(fault)
+                # 故障后立即连发几条，确保有事件落在断线窗口内，需要靠 RESUME 补发
+                burst = 5
+            if burst:
+                burst -= 1
+                await asyncio.sleep(0)
+            else:
+                await asyncio.sleep(interval)
+
+    async def _inject(self, fault):
+        for session in list(self.by_shard.values()):
+            ws = session.ws
+            if not ws:
+                continue
+            if fault == 'drop':
+                await ws.close(code=4009, reason='session timed out')
+            elif fault == 'reconnect':
+                await ws.send(json.dumps({'op': _OP_RECONNECT}))
+            elif fault == 'invalid_session':
+                await ws.send(json.dumps({'op': _OP_INVALID_SESSION, 'd': True}))
+
+
+async def _run(args):
+    gateway = FakeGateway(args.shards)
+    server = await websockets.serve(gateway.handler, '127.0.0.1', 0)
+    port = server.sockets[0].getsockname()[1]
+    url = f'ws://127.0.0.1:{port}'
+
+    received = {i: [] for i in range(args.shards)}
+    clients = []
+    for i in range(args.shards):
+        client = WebSocketClient(f'fake#{i}', {
+            'url': url, 'shard': [i, args.shards], 'token': 'fake-token',
+            'reconnect_interval': 0.1, 'invalid_session_delay': 0,
+        })
+        client.add_handler('message', lambda data, i=i: received[i].append(data['d']['index']))
+        clients.append(client)
+
+    tasks = [asyncio.create_task(c.start()) for c in clients]
+    await gateway.produce(args.events, args.interval)
+    await asyncio.sleep(0.5)
+    for c in clients:
+        await c.stop()
+    for t in tasks:
+        t.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    server.close()
+    await server.wait_closed()
+
+    ok = True
+    for i, indexes in received.items():
+        missing = sorted(set(range(1, args.events + 1)) - set(indexes))
+        duplicates = len(indexes) - len(set(indexes))
+        stats = clients[i].get_stats()
+        print(f"分片 {i}: 收到 {len(set(indexes))}/{args.events} 条, 缺失 {len(missing)}, 重复 {duplicates}, "
+              f"identify={stats['identify_count']} resume={stats['resume_count']} invalid_session={stats['invalid_session_count']}")
+        ok &= not missing and not duplicates
+    print(f"网关: identify={gateway.stats['identify']} resume={gateway.stats['resume']} "
+          f"补发事件={gateway.stats['resume_replayed']} 分片={sorted(gateway.stats['shards_seen'])}")
+    ok &= gateway.stats['shards_seen'] == set(range(args.shards)) and gateway.stats['identify'] == args.shards
+    ok &= gateway.stats['resume_replayed'] > 0
+    print("结果: " + ("通过" if ok else "失败"))
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--shards', type=int, default=2)
+    parser.add_argument('--events', type=int, default=60)
+    parser.add_argument('--interval', type=float, default=0.02)
+    args = parser.parse_args()
+    sys.exit(0 if asyncio.run(_run(args)) else 1)
+
+
+if __name__ == '__main__':
+    main()
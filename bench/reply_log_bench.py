@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""插件回复埋点开销基准：测量 _call_plugin_handler_with_logging 单次调用耗时
+
+发送接口由本地桩替代（只记录本线程已发送的 payload，不发请求），分别测量不回复、回复一次、
+回复三次（含 reply_md -> reply_markdown 嵌套调用）的处理器，差值即为埋点与日志记录的开销。
+
+用法: python bench/reply_log_bench.py [--calls 20000] [--payload-kb 4]
+"""
+
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import web.app  # noqa: F401  与 main.py 保持一致的导入顺序，避免循环导入
+from core.event.MessageEvent import MessageEvent, _reply_guard
+from core.plugin.PluginManager import PluginManager
+from function.log_db import log_db_manager
+
+
+def _make_event():
+    return MessageEvent({'op': 0, 't': 'GROUP_AT_MESSAGE_CREATE', 'd': {
+        'id': 'BENCH-MSG', 'content': ' ping', 'group_id': 'BENCHGROUP', 'group_openid': 'BENCHGROUP',
+        'author': {'id': 'BENCHUSER', 'member_openid': 'BENCHUSER'}}}, skip_recording=True)
+
+
+class BenchPlugin:
+    @staticmethod
+    def silent(event):
+        return True
+
+    @staticmethod
+    def reply_once(event):
+        event.reply('pong')
+        return True
+
+    @staticmethod
+    def reply_three(event):
+        event.reply('pong')
+        event.reply_ark(23, ('desc', 'prompt'))
+        event.reply_md('tpl', {'a': 'b'})
+        return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--calls', type=int, default=20000)
+    parser.add_argument('--payload-kb', type=int, default=4)
+    args = parser.parse_args()
+
+    filler = 'x' * (args.payload_kb * 1024)
+
+    def fake_send(self, payload, endpoint, content_type="消息", extra_info="", proactive_group_id=None, wait=True):
+        _reply_guard.sent_payload = dict(payload, filler=filler)
+        return 'BENCH-REPLY'
+
+    MessageEvent._send_with_error_handling = fake_send
+    MessageEvent._build_markdown_template_data = lambda self, template, params: {'custom_template_id': template}
+    event = _make_event()
+    baseline = None
+    for handler_name in ('silent', 'reply_once', 'reply_three'):
+        for _ in range(200):
+            PluginManager._call_plugin_handler_with_logging(BenchPlugin, handler_name, event, 'BenchPlugin')
+        start = time.perf_counter()
+        for _ in range(args.calls):
+            PluginManager._call_plugin_handler_with_logging(BenchPlugin, handler_name, event, 'BenchPlugin')
+        per_call = (time.perf_counter() - start) / args.calls * 1e6
+        # 日志队列只用于计数，清空避免内存增长影响后续测量
+        for q in log_db_manager.log_queues.values():
+            with q.mutex:
+                q.queue.clear()
+        baseline = per_call if baseline is None else baseline
+        print(f"{handler_name:<12} {per_call:8.1f} µs/次  (相对不回复 +{per_call - baseline:.1f} µs)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""出站发送队列基准：对照直接调用 BOTAPI 与经发送队列调用时的限流命中、吞吐与被动回复延迟
+
+本地假 QQ API 按群令牌桶限流（超限返回 22009 错误），每次请求固定延迟 --api-latency 秒。
+  - direct: --threads 个线程直接调用 BOTAPI 向 --groups 个群突发发送，统计被平台限流的条数
+  - queue:  同样的负载经发送队列以主动消息提交，队列限速为假 API 的 --headroom 倍（留余量吸收网络抖动），
+            统计被限流条数与总耗时；积压期间再向其中一个积压的群提交一条被动回复，测量其从提交到完成的延迟
+最后经 MessageEvent.send_to_group(wait=False) 发送一条，校验 Future 返回消息ID。
+
+用法: python bench/send_queue_bench.py [--messages 200] [--groups 4] [--rate 5] [--burst 5] [--threads 16] [--api-latency 0.02] [--headroom 0.9]
+"""
+
+import os
+import sys
+import time
+import json
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class _FakeApi:
+    def __init__(self, rate, burst, latency):
+        self.rate, self.burst, self.latency = rate, burst, latency
+        self.lock = threading.Lock()
+        self.buckets = {}        # 群ID -> [令牌数, 上次补充时间]
+        self.accepted = self.rejected = 0
+
+    def take(self, group_id):
+        now = time.time()
+        with self.lock:
+            tokens, last = self.buckets.get(group_id, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - last) * self.rate)
+            ok = tokens >= 1
+            self.buckets[group_id] = [tokens - 1 if ok else tokens, now]
+            if ok:
+                self.accepted += 1
+            else:
+                self.rejected += 1
+            return ok
+
+    def make_handler(self):
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                if length:
+                    self.rfile.read(length)
+                if self.path.endswith('/getAppAccessToken'):
+                    return self._reply({'access_token': 'bench-token', 'expires_in': '7200'})
+                time.sleep(api.latency)
+                parts = self.path.split('/')
+                group_id = parts[3] if len(parts) > 3 and parts[2] == 'groups' else ''
+                if api.take(group_id):
+                    return self._reply({'id': f'MSG-{time.time_ns()}', 'timestamp': int(time.time())})
+                self._reply({'message': '消息发送频率超限', 'code': 22009, 'trace_id': 'bench'})
+
+            def _reply(self, obj):
+                body = json.dumps(obj).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+        return Handler
+
+
+def _is_rejected(response):
+    try:
+        return json.loads(response).get('code') == 22009
+    except (ValueError, TypeError, AttributeError):
+        return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--messages', type=int, default=200)
+    parser.add_argument('--groups', type=int, default=4)
+    parser.add_argument('--rate', type=float, default=5)
+    parser.add_argument('--burst', type=int, default=5)
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--api-latency', type=float, default=0.02)
+    parser.add_argument('--headroom', type=float, default=0.9)
+    args = parser.parse_args()
+
+    api = _FakeApi(args.rate, args.burst, args.api_latency)
+    server = ThreadingHTTPServer(('127.0.0.1', 0), api.make_handler())
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    api_base = f"http://127.0.0.1:{server.server_address[1]}"
+
+    import web.app  # noqa: F401  与 main.py 保持一致的导入顺序，避免循环导入
+    import function.Access as access
+    access._API_BASE = access._SANDBOX_API_BASE = api_base
+    access._TOKEN_URL = f"{api_base}/app/getAppAccessToken"
+    access.获取新Token()
+
+    import function.send_dispatcher as dispatcher
+    dispatcher._CONFIG.update(enabled=True, max_concurrency=args.threads, group_rate=args.rate * args.headroom, group_burst=args.burst)
+    from function.Access import BOTAPI, Json
+
+    jobs = [(f"/v2/groups/BENCHGROUP{n % args.groups}/messages", Json({'content': f'msg {n}', 'msg_type': 0})) for n in range(args.messages)]
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.threads) as pool:
+        results = list(pool.map(lambda job: BOTAPI(job[0], 'POST', job[1]), jobs))
+    elapsed = time.perf_counter() - start
+    rejected = sum(map(_is_rejected, results))
+    print(f"direct  {elapsed:6.2f}s  被限流 {rejected}/{len(jobs)}")
+
+    time.sleep(args.burst / args.rate + 1)  # 等假 API 令牌桶回满
+    start = time.perf_counter()
+    futures = [dispatcher.submit_api(endpoint, 'POST', data, priority=dispatcher.PRIORITY_PROACTIVE) for endpoint, data in jobs]
+    time.sleep(0.5)
+    reply_start = time.perf_counter()
+    dispatcher.submit_api(jobs[0][0], 'POST', Json({'content': 'pong', 'msg_id': 'BENCH'})).result()
+    reply_ms = (time.perf_counter() - reply_start) * 1000
+    results = [f.result() for f in futures]
+    elapsed = time.perf_counter() - start
+    rejected = sum(map(_is_rejected, results))
+    ideal = max(0.0, (args.messages / args.groups - args.burst) / (args.rate * args.headroom))
+    print(f"queue   {elapsed:6.2f}s  被限流 {rejected}/{len(jobs)}  (理论最短 {ideal:.2f}s)  积压中被动回复延迟 {reply_ms:.1f}ms")
+    print(f"队列统计: {dispatcher.get_send_queue_stats()}")
+
+    from core.event.MessageEvent import MessageEvent
+    future = MessageEvent.send_to_group('BENCHGROUP-FUTURE', 'hello', wait=False)
+    print(f"send_to_group(wait=False) -> {type(future).__name__}, 消息ID {future.result(timeout=5)}")
+    from function.httpx_pool import get_http_pool_stats
+    print(f"HTTP 连接池: {get_http_pool_stats()}")
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,276 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""基准测试用的 MySQL 替身：把 pymysql.connect 替换为基于 SQLite 文件库的兼容连接
+
+只覆盖本项目实际用到的语法（建表 DDL、INSERT IGNORE、ON DUPLICATE KEY UPDATE、
+information_schema 查询、ALTER TABLE 多子句等），无法翻译或执行失败的语句计入统计，
+在基准报告中输出，便于判断替身是否影响了测量结果。
+
+用法: 在导入任何项目模块之前调用 install(path)
+"""
+
+import re
+import sqlite3
+import threading
+from collections import Counter
+
+import pymysql
+import pymysql.cursors
+
+_stats = {'statements': 0, 'errors': Counter()}
+_stats_lock = threading.Lock()
+
+_RE_PARAM = re.compile(r'%(s|%)')
+_RE_TABLE_OPTIONS = re.compile(r'\)\s*ENGINE\s*=.*$', re.I | re.S)
+_RE_COMMENT = re.compile(r"\s+COMMENT\s+'(?:[^'\\]|\\.)*'", re.I)
+_RE_ON_UPDATE = re.compile(r'\s+ON\s+UPDATE\s+CURRENT_TIMESTAMP', re.I)
+_RE_UNSIGNED = re.compile(r'\s+UNSIGNED\b', re.I)
+_RE_AUTO_INCREMENT = re.compile(r'(`?\w+`?)\s+\w+(?:\(\d+\))?\s+NOT\s+NULL\s+AUTO_INCREMENT', re.I)
+_RE_INDEX_DEF = re.compile(r'^(PRIMARY\s+KEY|UNIQUE(?:\s+KEY|\s+INDEX)?|KEY|INDEX)\s*`?(\w*)`?\s*(\([^)]*\))$', re.I)
+_RE_CREATE_TABLE = re.compile(r'CREATE\s+TABLE\s+(?:IF\s+NOT\s+EXISTS\s+)?`?(\w+)`?', re.I)
+_RE_ALTER_TABLE = re.compile(r'^\s*ALTER\s+TABLE\s+`?(\w+)`?\s+(.*)$', re.I | re.S)
+_RE_ADD_INDEX = re.compile(r'^ADD\s+(UNIQUE\s+)?(?:INDEX|KEY)\s+`?(\w+)`?\s*(\([^)]*\))$', re.I)
+_RE_SCHEMA_TABLES = re.compile(
+    r'SELECT\s+(.+?)\s+FROM\s+information_schema\.tables\s+WHERE\s+table_schema\s*=\s*(DATABASE\(\)|%s)\s+AND\s+table_name\s+(=|LIKE)\s+%s',
+    re.I | re.S)
+_RE_SCHEMA_COLUMNS = re.compile(
+    r'SELECT\s+(.+?)\s+FROM\s+information_schema\.columns\s+WHERE\s+table_schema\s*=\s*(DATABASE\(\)|%s)\s+AND\s+table_name\s*=\s*%s\s+AND\s+column_name\s*=\s*(\'\w+\')',
+    re.I | re.S)
+_RE_SCHEMA_PARTITIONS = re.compile(r'FROM\s+information_schema\.partitions\b', re.I)
+_RE_SCHEMA_STATISTICS = re.compile(r'FROM\s+information_schema\.statistics\b', re.I)
+_RE_ALTER_PARTITION = re.compile(r'^(REORGANIZE|DROP|ADD)\s+PARTITION\b', re.I)
+_RE_VALUES_REF = re.compile(r'VALUES\s*\(\s*(`?\w+`?)\s*\)', re.I)
+_RE_ON_DUPLICATE = re.compile(r'\s+ON\s+DUPLICATE\s+KEY\s+UPDATE\s+', re.I)
+_RE_FUNCTIONS = ((re.compile(r'\bNOW\(\)', re.I), "datetime('now', 'localtime')"),
+                 (re.compile(r'\bCURDATE\(\)', re.I), "date('now', 'localtime')"),
+                 (re.compile(r'\bHOUR\((\w+)\)', re.I), r"CAST(strftime('%H', \1) AS INTEGER)"),
+                 (re.compile(r'\bLEAST\(', re.I), 'MIN('),
+                 (re.compile(r'\s+FOR\s+UPDATE\s*$', re.I), ''))
+
+
+def _split_top_level(clause):
+    """按顶层逗号切分 ALTER TABLE 子句，忽略括号内的逗号"""
+    parts, depth, start = [], 0, 0
+    for i, ch in enumerate(clause):
+        if ch == '(':
+            depth += 1
+        elif ch == ')':
+            depth -= 1
+        elif ch == ',' and depth == 0:
+            parts.append(clause[start:i].strip())
+            start = i + 1
+    parts.append(clause[start:].strip())
+    return [p for p in parts if p]
+
+
+def _translate_ddl(sql):
+    table = _RE_CREATE_TABLE.search(sql).group(1)
+    sql = _RE_TABLE_OPTIONS.sub(')', sql)
+    sql = _RE_COMMENT.sub('', sql)
+    sql = _RE_ON_UPDATE.sub('', sql)
+    sql = _RE_UNSIGNED.sub('', sql)
+    head, body = sql.split('(', 1)
+    columns, constraints, extra = [], [], []
+    auto_increment = bool(_RE_AUTO_INCREMENT.search(body))
+    # MySQL 允许表约束与列定义交错，SQLite 要求约束全部位于列定义之后
+    for part in _split_top_level(body[:body.rindex(')')]):
+        key = _RE_INDEX_DEF.match(part)
+        if key:
+            if key.group(1).upper().startswith('UNIQUE'):
+                constraints.append(f"UNIQUE {key.group(3)}")
+            elif key.group(1).upper().startswith('PRIMARY'):
+                if not auto_increment:
+                    constraints.append(f"PRIMARY KEY {key.group(3)}")
+            else:
+                extra.append(f"CREATE INDEX IF NOT EXISTS `{table}_{key.group(2)}` ON `{table}` {key.group(3)}")
+        else:
+            columns.append(_RE_AUTO_INCREMENT.sub(r'\1 INTEGER PRIMARY KEY AUTOINCREMENT', part))
+    return [f"{head}({', '.join(columns + constraints)})"] + extra
+
+
+def _translate_alter(match):
+    table, clause = match.group(1), match.group(2)
+    statements = []
+    if _RE_ALTER_PARTITION.match(clause):
+        # SQLite 没有分区，分区维护语句视为成功
+        return []
+    for part in _split_top_level(clause):
+        index = _RE_ADD_INDEX.match(part)
+        if index:
+            unique = 'UNIQUE ' if index.group(1) else ''
+            statements.append(f"CREATE {unique}INDEX IF NOT EXISTS `{table}_{index.group(2)}` ON `{table}` {index.group(3)}")
+        else:
+            statements.append(f"ALTER TABLE `{table}` {_RE_UNSIGNED.sub('', part)}")
+    return statements
+
+
+def _translate(sql, args):
+    """把一条 MySQL 语句翻译为 (SQLite 语句列表, 参数, 是否 upsert)"""
+    stripped = sql.strip()
+    upper = stripped[:32].upper()
+    if upper.startswith('SET ') or upper.startswith('SHOW '):
+        return [], args, False
+    if upper.startswith('CREATE TABLE'):
+        return _translate_ddl(stripped), args, False
+    alter = _RE_ALTER_TABLE.match(stripped)
+    if alter:
+        return _translate_alter(alter), args, False
+
+    if _RE_SCHEMA_STATISTICS.search(stripped):
+        return ["SELECT name FROM pragma_index_list(?)"], args, False
+    if _RE_SCHEMA_PARTITIONS.search(stripped):
+        # 替身中的表都不分区，与 MySQL 对未分区表的返回一致
+        return ["SELECT NULL AS name WHERE 0"], None, False
+    schema = _RE_SCHEMA_TABLES.search(stripped)
+    if schema:
+        select = re.sub(r'^TABLE_NAME\b', 'name', schema.group(1), flags=re.I)
+        stripped = f"SELECT {select} FROM sqlite_master WHERE type = 'table' AND name {schema.group(3)} %s"
+        if schema.group(2) == '%s' and args:
+            args = tuple(args)[1:]
+    schema = _RE_SCHEMA_COLUMNS.search(stripped)
+    if schema:
+        stripped = f"SELECT {schema.group(1)} FROM pragma_table_info(%s) WHERE name = {schema.group(3)}"
+        if schema.group(2) == '%s' and args:
+            args = tuple(args)[1:]
+
+    upsert = False
+    if upper.startswith('INSERT IGNORE'):
+        stripped = 'INSERT OR IGNORE' + stripped[len('INSERT IGNORE'):]
+    elif _RE_ON_DUPLICATE.search(stripped):
+        head, tail = _RE_ON_DUPLICATE.split(stripped, 1)
+        stripped = f"{head} ON CONFLICT DO UPDATE SET " + _RE_VALUES_REF.sub(r'excluded.\1', tail)
+        upsert = True
+    for pattern, repl in _RE_FUNCTIONS:
+        stripped = pattern.sub(repl, stripped)
+    if args is not None:
+        stripped = _RE_PARAM.sub(lambda m: '?' if m.group(1) == 's' else '%', stripped)
+    return [stripped], args, upsert
+
+
+def _record_error(sql, exc):
+    key = f"{type(exc).__name__}: {exc} | {' '.join(sql.split())[:120]}"
+    with _stats_lock:
+        _stats['errors'][key] += 1
+
+
+class _Cursor:
+    def __init__(self, connection, dict_rows):
+        self.connection = connection
+        self._dict_rows = dict_rows
+        self._cursor = connection._db.cursor()
+        self.rowcount = -1
+        self.lastrowid = None
+        self.description = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _run(self, sql, args, many=False):
+        with _stats_lock:
+            _stats['statements'] += 1
+        if isinstance(args, dict):
+            raise pymysql.err.ProgrammingError("替身不支持命名参数")
+        statements, args, upsert = _translate(sql, args)
+        db = self.connection._db
+        try:
+            before = db.execute('SELECT last_insert_rowid()').fetchone()[0] if upsert and not many else None
+            for statement in statements:
+                if many:
+                    self._cursor.executemany(statement, [tuple(a) for a in args])
+                elif args is None:
+                    self._cursor.execute(statement)
+                else:
+                    self._cursor.execute(statement, tuple(args) if isinstance(args, (list, tuple)) else (args,))
+        except sqlite3.IntegrityError as e:
+            _record_error(sql, e)
+            raise pymysql.err.IntegrityError(1062, str(e))
+        except sqlite3.Error as e:
+            _record_error(sql, e)
+            raise pymysql.err.ProgrammingError(1064, str(e))
+        self.description = self._cursor.description
+        self.lastrowid = self._cursor.lastrowid
+        self.rowcount = self._cursor.rowcount
+        if before is not None and self.rowcount == 1 and self.lastrowid == before:
+            # 与 MySQL 一致：ON DUPLICATE KEY UPDATE 命中已有行时 rowcount 为 2
+            self.rowcount = 2
+        return self.rowcount
+
+    def execute(self, sql, args=None):
+        return self._run(sql, args)
+
+    def executemany(self, sql, args):
+        if not args:
+            return 0
+        return self._run(sql, list(args), many=True)
+
+    def _convert(self, row):
+        if row is None or not self._dict_rows:
+            return row
+        return {col[0]: value for col, value in zip(self.description, row)}
+
+    def fetchone(self):
+        return self._convert(self._cursor.fetchone())
+
+    def fetchall(self):
+        rows = self._cursor.fetchall()
+        return [self._convert(r) for r in rows] if self._dict_rows else tuple(rows)
+
+    def fetchmany(self, size=None):
+        return [self._convert(r) for r in self._cursor.fetchmany(size or 1)]
+
+    def close(self):
+        try:
+            self._cursor.close()
+        except sqlite3.Error:
+            pass
+
+
+class _Connection:
+    def __init__(self, path, cursorclass=None, autocommit=False, **kwargs):
+        self._db = sqlite3.connect(path, timeout=10, check_same_thread=False,
+                                   isolation_level=None if autocommit else '')
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._cursorclass = cursorclass or pymysql.cursors.Cursor
+        self.open = True
+
+    def cursor(self, cursor=None):
+        cls = cursor or self._cursorclass
+        return _Cursor(self, issubclass(cls, pymysql.cursors.DictCursorMixin))
+
+    def commit(self):
+        self._db.commit()
+
+    def rollback(self):
+        self._db.rollback()
+
+    def ping(self, reconnect=True):
+        if not self.open:
+            raise pymysql.err.InterfaceError(0, '连接已关闭')
+
+    def begin(self):
+        pass
+
+    def autocommit(self, value):
+        self._db.isolation_level = None if value else ''
+
+    def close(self):
+        if self.open:
+            self.open = False
+            self._db.close()
+
+
+def install(path):
+    """把 pymysql.connect 指向 SQLite 文件库，需在导入项目模块之前调用"""
+    def connect(*args, **kwargs):
+        return _Connection(path, kwargs.get('cursorclass'), kwargs.get('autocommit', False))
+    pymysql.connect = pymysql.Connect = connect
+
+
+def get_stats():
+    with _stats_lock:
+        return {'statements': _stats['statements'], 'errors': dict(_stats['errors'])}
@@ -49,6 +49,7 @@ WEBSOCKET_CONFIG = {
     'custom_url': None,  # 自定义WebSocket连接地址，如果设置则直接连接，不懂不要填写
     'log_level': "INFO",  # WebSocket专用日志级别
     'log_message_content': False,  # 是否记录消息内容(调试模式)
+    'shards': 1,  # 分片连接数，填 "auto" 使用网关推荐的分片数
 }
 
 # Web面板配置 - 安全控制和界面外观设置
@@ -77,6 +78,7 @@ LOG_DB_CONFIG = {
     'batch_size': 1000,  # 每批次最大写入日志记录数
     'table_prefix': f"{appid}_",  # 日志表名前缀，使用机器人appid作为前缀
     'retention_days': 5,  # 日志保留天数，0表示永久保留
+    'partitioned': False,  # 分区单表模式：每种日志一张按日期RANGE分区的表（需MySQL分区支持），开启后自动迁移已有的按天日志表
     'max_retry': 3,  # 写入失败最大重试次数
     'retry_interval': 2,  # 重试间隔时间(秒)
     
@@ -84,6 +86,65 @@ LOG_DB_CONFIG = {
     'initial_load_count': 50,  # 进入日志界面时自动加载的今日日志条数
 }
 
+# 消息入库流水线配置 - 用户/群记录、消息入库等旁路任务的工作线程与队列
+INGEST_CONFIG = {
+    'workers': 4,  # 工作线程数，同一群/用户的消息固定由同一线程按序处理
+    'queue_size': 2000,  # 每个工作线程的队列上限
+    'overflow_policy': "drop_oldest",  # 队列满时的策略：block(阻塞等待) / drop_newest(丢弃新任务) / drop_oldest(丢弃最旧任务)
+    'block_timeout': 0.5,  # block策略下的最长等待时间(秒)，超时后丢弃新任务
+}
+
+# HTTP连接池配置 - 开放平台接口、Token刷新、媒体下载与分片上传共用的 httpx 连接池
+HTTP_POOL_CONFIG = {
+    'http2': True,  # 对开放平台主机启用HTTP/2多路复用（需要安装h2模块: pip install httpx[http2]，未安装时自动使用HTTP/1.1）
+    'timeout': 30,  # 请求超时时间(秒)
+    'max_connections': 200,  # 通用连接池最大连接数（媒体下载、分片上传等其它主机）
+    'max_keepalive': 75,  # 通用连接池最大空闲长连接数
+    'keepalive_expiry': 30,  # 空闲长连接保留时间(秒)
+    'host_limits': {  # 独立连接池的主机及其最大连接数
+        'api.sgroup.qq.com': 20,
+        'sandbox.api.sgroup.qq.com': 10,
+        'bots.qq.com': 4,
+    },
+}
+
+# 出站发送队列配置 - 发消息接口统一经队列调用：按群/用户令牌桶限速，被动回复优先于主动消息
+SEND_QUEUE_CONFIG = {
+    'enabled': True,  # 是否启用发送队列，关闭后在调用线程直接请求接口
+    'max_concurrency': 16,  # 同时进行中的发送请求上限
+    'group_rate': 5,  # 每个群(频道)每秒最多发送条数
+    'group_burst': 5,  # 每个群(频道)允许的突发条数
+    'user_rate': 2,  # 每个用户私聊每秒最多发送条数
+    'user_burst': 3,  # 每个用户私聊允许的突发条数
+}
+
+# 进程内缓存配置 - 有界LRU缓存，超出容量淘汰最久未用的条目，TTL为0表示不过期
+CACHE_CONFIG = {
+    'nickname_size': 50000,  # 用户昵称缓存最大条目数
+    'nickname_ttl': 86400,  # 用户昵称缓存有效期(秒)
+    'last_active_size': 200000,  # 群成员今日活跃标记缓存最大条目数
+    'last_active_ttl': 86400,  # 群成员今日活跃标记缓存有效期(秒)
+    'markdown_template_size': 256,  # Markdown模板查找缓存最大条目数
+    'markdown_template_ttl': 0,  # Markdown模板查找缓存有效期(秒)
+}
+
+# 昵称补全任务配置 - 后台批量为无昵称用户查询昵称，中断后再次发起会从检查点继续
+NICKNAME_BACKFILL_CONFIG = {
+    'api_url': '',  # 昵称查询接口，支持 {user_id} {appid} 占位符，返回JSON；留空则无法补全
+    'name_field': 'nickname',  # 返回JSON中的昵称字段，支持 data.nickname 形式的嵌套路径
+    'concurrency': 8,  # 同时进行中的查询数
+    'rate': 20,  # 全局每秒最多查询次数
+    'batch_size': 200,  # 每批读取的用户数，每批昵称合并为一条UPDATE写入
+    'timeout': 5,  # 单次查询超时时间(秒)
+}
+
+# 分片上传配置 - 大于5MB的媒体文件走分片上传
+UPLOAD_CONFIG = {
+    'part_concurrency': 4,  # 分片并发上传数
+    'part_retries': 3,  # 单个分片最大尝试次数
+    'part_timeout': 300,  # 单个分片上传超时时间(秒)
+}
+
 # 主数据库配置 - 业务数据存储设置
 DB_CONFIG = {
     'enabled': True,  # 是否启用主数据库（线程池供插件使用，如不需要可设为False）
@@ -95,6 +156,8 @@ DB_CONFIG = {
     
     # 连接池基础设置
     'min_pool_size': 5,  # 连接池最小保持连接数
+    'max_pool_size': 50,  # 连接池最大连接数，连接全部借出时后续请求按先后顺序排队等待
+    'health_check_idle': 30,  # 连接空闲超过该时间(秒)后再次借出前才做 ping 检查
     'connect_timeout': 5,  # 数据库连接超时时间(秒)
     'read_timeout': 3,  # 数据读取超时时间(秒)
     'write_timeout': 3,  # 数据写入超时时间(秒)
@@ -1,18 +1,24 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
-import json, random, tempfile, hashlib, datetime, time, re, base64, os, logging, html
-from function.Access import BOT凭证, BOTAPI, Json, Json取
+import json, random, tempfile, hashlib, datetime, time, re, base64, os, logging, html, threading
+from functools import lru_cache, wraps
+from concurrent.futures import Future
+from function.Access import BOT凭证, BOTAPI, Json
 from function.database import Database
 from config import USE_MARKDOWN, IMAGE_BED_CHANNEL_ID, ENABLE_NEW_USER_WELCOME, ENABLE_WELCOME_MESSAGE, ENABLE_FRIEND_ADD_MESSAGE, HIDE_AVATAR_GLOBAL, BILIBILI_IMAGE_BED_CONFIG, MARKDOWN_SUFFIX
 from function.log_db import add_log_to_db, record_last_message_id
 from core.plugin.message_templates import MessageTemplate, MSG_TYPE_WELCOME, MSG_TYPE_USER_WELCOME, MSG_TYPE_FRIEND_ADD, MSG_TYPE_API_ERROR
-from function.httpx_pool import sync_post, get_binary_content
+from function.httpx_pool import sync_post, sync_put, sync_get, get_binary_content
+from function.delayed_tasks import schedule_recall
+from function.send_dispatcher import submit_api, in_send_worker, PRIORITY_REPLY, PRIORITY_PROACTIVE
+from function.bounded_cache import get_cache
 
 try:
     from web.app import add_error_log
 except:
     add_error_log = lambda *a, **k: None
+from web.tools.log_handler import add_plugin_log
 
 _image_upload_counter = 0
 _image_upload_msgid = 0
@@ -27,6 +33,23 @@ try:
 except ImportError:
     BUTTON_ENTER_TO_SEND = False
 
+try:
+    from config import UPLOAD_CONFIG
+except ImportError:
+    UPLOAD_CONFIG = {}
+
+_UPLOAD_CONCURRENCY = max(1, int(UPLOAD_CONFIG.get('part_concurrency', 4)))
+_UPLOAD_PART_RETRIES = max(1, int(UPLOAD_CONFIG.get('part_retries', 3)))
+_UPLOAD_PART_TIMEOUT = UPLOAD_CONFIG.get('part_timeout', 300)
+_HASH_BUFFER_SIZE = 1024 * 1024
+_MD5_10M_SIZE = 10_002_432
+_template_id_cache = get_cache('markdown_template')
+_RETRY_SEND = object()
+
+@lru_cache(maxsize=256)
+def _split_path(path):
+    return tuple(path.split('/'))
+
 def _swap_ids(uid, unid, should_swap):
     return (unid, uid, uid) if should_swap and unid else (uid, unid or uid, uid)
 
@@ -83,6 +106,7 @@ class MessageEvent:
     _LINK_PATTERN = re.compile(r'\[([^\]]*)\]\(([^\)]*)\)')
     _FACE_PATTERN = re.compile(r'<faceType=\d+,faceId="[^"]+",ext="[^"]+">')
     _plugin_manager = None
+    _reply_plugin = None        # 插件处理器执行期间由 PluginManager 设置，回复埋点据此记录日志
     
     @classmethod
     def _init_type_sets(cls):
@@ -110,11 +134,22 @@ class MessageEvent:
                 pass
         return cls._plugin_manager
 
-    def __init__(self, data, skip_recording=False, http_context=None):
+    def __init__(self, data, skip_recording=False, http_context=None, raw_text=None):
         if self._MSG_TYPES_NEED_MSG_ID is None:
             self._init_type_sets()
         self.is_private = self.is_group = False
-        self.raw_data = data
+        # 事件数据只解析一次，raw_text 仅用于 SAVE_RAW_MESSAGE_TO_DB 原样入库
+        if isinstance(data, (bytes, bytearray)):
+            data = data.decode('utf-8')
+        if isinstance(data, str):
+            if raw_text is None:
+                raw_text = data
+            try:
+                data = json.loads(data)
+            except ValueError:
+                data = {}
+        self.raw_data = data if isinstance(data, dict) else {}
+        self.raw_text = raw_text
         self.user_id = self.group_id = None
         self.content = ""
         self.author_username = None
@@ -337,11 +372,7 @@ class MessageEvent:
     
     def _prepare_media_data(self, data):
         if isinstance(data, str):
-            try:
-                return get_binary_content(data)
-            except:
-                import requests
-                return requests.get(data).content
+            return get_binary_content(data)
         return data
     
     def _set_message_id_in_payload(self, payload):
@@ -352,9 +383,19 @@ class MessageEvent:
         return payload
     
     def _handle_auto_recall(self, message_id, auto_delete_time):
+        if isinstance(message_id, Future):
+            if auto_delete_time:
+                message_id.add_done_callback(lambda f: f.exception() is None and self._handle_auto_recall(f.result(), auto_delete_time))
+            return
         if message_id and auto_delete_time:
-            import threading
-            threading.Timer(auto_delete_time, self.recall_message, args=[message_id]).start()
+            # 交给统一的延时任务调度器，不再为每条消息单独起一个 Timer 线程
+            try:
+                endpoint = self._get_endpoint('recall').replace('{message_id}', str(message_id))
+            except:
+                return
+            group_id = self.group_id if getattr(self, 'group_id', None) and self.is_group else None
+            target = f"群 {self.group_id}" if group_id else f"用户 {getattr(self, 'user_id', '') or ''}"
+            schedule_recall(auto_delete_time, endpoint, group_id=group_id, target=target)
     
     def _send_media_message(self, data, content, file_type, content_type, auto_delete_time=None, converter=None, target_user_id=None, target_group_id=None):
         proactive = bool(target_user_id or target_group_id)
@@ -381,7 +422,8 @@ class MessageEvent:
         self._handle_auto_recall(message_id, auto_delete_time)
         return message_id
 
-    def reply(self, content='', buttons=None, media=None, hide_avatar_and_center=None, auto_delete_time=None, use_markdown=None, prompt_buttons=None, target_user_id=None, target_group_id=None):
+    def reply(self, content='', buttons=None, media=None, hide_avatar_and_center=None, auto_delete_time=None, use_markdown=None, prompt_buttons=None, target_user_id=None, target_group_id=None, wait=None):
+        """发送消息，返回消息ID；插件处理器内（或 wait=False）不等待发送完成，立即返回结果为消息ID的 Future"""
         proactive = bool(target_user_id or target_group_id)
         if not proactive:
             if not self._check_send_conditions() or self.message_type not in self._MESSAGE_TYPE_TO_ENDPOINT:
@@ -403,7 +445,7 @@ class MessageEvent:
         else:
             endpoint = self._get_endpoint('reply')
 
-        message_id = self._send_with_error_handling(payload, endpoint, "主动消息" if proactive else "消息", f"content: {content}", proactive_group_id=target_group_id if proactive else None)
+        message_id = self._send_with_error_handling(payload, endpoint, "主动消息" if proactive else "消息", f"content: {content}", proactive_group_id=target_group_id if proactive else None, wait=wait)
         self._handle_auto_recall(message_id, auto_delete_time)
         return message_id
 
@@ -651,7 +693,7 @@ class MessageEvent:
         except:
             return None
     
-    def _send_with_error_handling(self, payload, endpoint, content_type="消息", extra_info="", proactive_group_id=None):
+    def _send_with_error_handling(self, payload, endpoint, content_type="消息", extra_info="", proactive_group_id=None, wait=None):
         pm = self._get_plugin_manager()
         if pm and pm.has_message_interceptors():
             try:
@@ -667,26 +709,63 @@ class MessageEvent:
             group_id = None
         else:
             group_id = self.group_id if hasattr(self, 'group_id') and self.is_group else None
+        # 带 msg_id / event_id 的是被动回复，走高优先级通道
+        priority = PRIORITY_REPLY if ('msg_id' in payload or 'event_id' in payload) else PRIORITY_PROACTIVE
+        data = Json(payload)
+        # 插件处理器内默认不等待：限速排队期间不占住插件工作线程，需要消息ID时由调用方对 Future 调用 result()
+        if wait is None:
+            wait = self._reply_plugin is None
+        # 发送工作线程内（如发送失败回调里的错误提示）不能同步等待，否则可能占满并发槽互相等待
+        if not wait or in_send_worker():
+            return self._send_async(payload, endpoint, content_type, data, group_id, priority)
         for retry_count in range(2):
-            response = BOTAPI(endpoint, "POST", Json(payload), group_id=group_id)
-            resp_obj = self._parse_response(response)
-            if resp_obj and all(k in resp_obj for k in ("message", "code", "trace_id")):
-                error_code = resp_obj.get('code')
-                if error_code in self._IGNORE_ERROR_CODES:
-                    return None
-                if error_code == 11244 and retry_count < 1:
+            response = submit_api(endpoint, "POST", data, group_id, priority).result()
+            result = self._handle_send_response(response, payload, endpoint, content_type, retry_count)
+            if result is _RETRY_SEND:
+                from function.Access import 获取新Token
+                获取新Token()
+                time.sleep(1)
+                continue
+            return result
+        return None
+
+    def _send_async(self, payload, endpoint, content_type, data, group_id, priority, retry_count=0, result=None):
+        """经发送队列异步发送，返回结果为消息ID的 Future，响应处理在发送工作线程的回调中完成"""
+        result = result or Future()
+
+        def on_done(future):
+            try:
+                outcome = self._handle_send_response(future.result(), payload, endpoint, content_type, retry_count)
+                if outcome is _RETRY_SEND:
                     from function.Access import 获取新Token
                     获取新Token()
-                    time.sleep(1)
-                    continue
-                self._log_error(f"发送{content_type}失败：{resp_obj.get('message')} code：{error_code}", resp_obj=resp_obj, send_payload=payload, raw_message=self.raw_data)
-                MessageTemplate.send(self, MSG_TYPE_API_ERROR, error_code=error_code, error_message=resp_obj.get('message', ''), trace_id=resp_obj.get('trace_id'), endpoint=endpoint)
-                return json.dumps({'error': True, 'message': resp_obj.get('message', '未知错误'), 'code': error_code})
-            msg_id = self._extract_message_id(response)
-            if msg_id:
-                self._last_sent_payload = payload
-            return msg_id
-        return None
+                    self._send_async(payload, endpoint, content_type, data, group_id, priority, retry_count + 1, result)
+                    return
+            except Exception as e:
+                result.set_exception(e)
+                return
+            # 回调在发送工作线程执行，已发送的 payload 随 Future 交给调用方，不经由事件对象在线程间共享
+            result.sent_payload = _take_sent_payload()
+            result.set_result(outcome)
+
+        submit_api(endpoint, "POST", data, group_id, priority).add_done_callback(on_done)
+        return result
+
+    def _handle_send_response(self, response, payload, endpoint, content_type, retry_count):
+        resp_obj = self._parse_response(response)
+        if resp_obj and all(k in resp_obj for k in ("message", "code", "trace_id")):
+            error_code = resp_obj.get('code')
+            if error_code in self._IGNORE_ERROR_CODES:
+                return None
+            if error_code == 11244 and retry_count < 1:
+                return _RETRY_SEND
+            self._log_error(f"发送{content_type}失败：{resp_obj.get('message')} code：{error_code}", resp_obj=resp_obj, send_payload=payload, raw_message=self.raw_data)
+            MessageTemplate.send(self, MSG_TYPE_API_ERROR, error_code=error_code, error_message=resp_obj.get('message', ''), trace_id=resp_obj.get('trace_id'), endpoint=endpoint)
+            return json.dumps({'error': True, 'message': resp_obj.get('message', '未知错误'), 'code': error_code})
+        msg_id = self._extract_message_id(response)
+        if msg_id:
+            _reply_guard.sent_payload = payload
+        return msg_id
 
     def _send_simple_message(self, payload_builder, content_type, auto_delete_time=None, **kwargs):
         if not self._check_send_conditions():
@@ -764,18 +843,16 @@ class MessageEvent:
     def _build_markdown_template_data(self, template, params):
         try:
             from core.event.markdown_templates import get_template, MARKDOWN_TEMPLATES
-            if not hasattr(self, '_template_id_cache'):
-                self._template_id_cache = {}
-            if template in self._template_id_cache:
-                template_config = self._template_id_cache[template]
-            else:
+            template_config = _template_id_cache.get(template)
+            if template_config is None:
                 template_config = get_template(template)
                 if not template_config:
                     for name, config in MARKDOWN_TEMPLATES.items():
                         if config['id'] == template:
                             template_config = config
                             break
-                self._template_id_cache[template] = template_config
+                if template_config:
+                    _template_id_cache.set(template, template_config)
             if not template_config:
                 return None
             template_id = template_config['id']
@@ -905,19 +982,37 @@ class MessageEvent:
     # ==================== 分片上传 ====================
 
     @staticmethod
-    def _compute_file_hashes(file_path, file_size):
-        md5_h, sha1_h, md5_10m_h = hashlib.md5(), hashlib.sha1(), hashlib.md5()
-        _10M = 10_002_432
-        need_10m, bytes_read = file_size > _10M, 0
-        with open(file_path, 'rb') as f:
-            while chunk := f.read(65536):
+    def _iter_source_chunks(source):
+        """按块迭代文件路径或内存数据，内存数据使用 memoryview 切片避免复制"""
+        if isinstance(source, str):
+            buf = bytearray(_HASH_BUFFER_SIZE)
+            view = memoryview(buf)
+            with open(source, 'rb', buffering=0) as f:
+                while n := f.readinto(buf):
+                    yield view[:n]
+        else:
+            view = memoryview(source)
+            for offset in range(0, len(view), _HASH_BUFFER_SIZE):
+                yield view[offset:offset + _HASH_BUFFER_SIZE]
+
+    @classmethod
+    def _compute_file_hashes(cls, source, file_size):
+        """单次流式读取计算 md5/sha1/md5_10m，md5_10m 在前 10M 边界处复制 md5 状态得到"""
+        md5_h, sha1_h = hashlib.md5(), hashlib.sha1()
+        md5_10m, bytes_read = None, 0
+        need_10m = file_size > _MD5_10M_SIZE
+        for chunk in cls._iter_source_chunks(source):
+            sha1_h.update(chunk)
+            if need_10m and md5_10m is None and bytes_read + len(chunk) >= _MD5_10M_SIZE:
+                split = _MD5_10M_SIZE - bytes_read
+                md5_h.update(chunk[:split])
+                md5_10m = md5_h.copy().hexdigest()
+                md5_h.update(chunk[split:])
+            else:
                 md5_h.update(chunk)
-                sha1_h.update(chunk)
-                if need_10m and (remaining := _10M - bytes_read) > 0:
-                    md5_10m_h.update(chunk[:remaining] if remaining < len(chunk) else chunk)
-                bytes_read += len(chunk)
+            bytes_read += len(chunk)
         md5 = md5_h.hexdigest()
-        return {'md5': md5, 'sha1': sha1_h.hexdigest(), 'md5_10m': md5_10m_h.hexdigest() if need_10m else md5}
+        return {'md5': md5, 'sha1': sha1_h.hexdigest(), 'md5_10m': md5_10m if need_10m else md5}
 
     @staticmethod
     def _api_with_retry(endpoint, data, max_retries=2, base_delay=1.0):
@@ -935,12 +1030,39 @@ class MessageEvent:
                     time.sleep(base_delay * (2 ** attempt))
         raise last_err
 
-    def _chunked_upload(self, file_path, file_type, is_group, target_id):
-        """分片上传本地文件，返回 file_info"""
-        import requests as _req
-        file_size = os.path.getsize(file_path)
-        file_name = os.path.basename(file_path)
-        hashes = self._compute_file_hashes(file_path, file_size)
+    @staticmethod
+    def _read_part(source, offset, size):
+        if isinstance(source, str):
+            with open(source, 'rb') as f:
+                f.seek(offset)
+                return f.read(size)
+        return memoryview(source)[offset:offset + size]
+
+    @classmethod
+    def _upload_part(cls, source, part, offset, size, upload_id, scope, target_id):
+        """上传单个分片：PUT 预签名 URL 后通知平台分片完成，失败按指数退避重试"""
+        chunk = cls._read_part(source, offset, size)
+        for attempt in range(_UPLOAD_PART_RETRIES):
+            try:
+                r = sync_put(part['presigned_url'], content=bytes(chunk), timeout=_UPLOAD_PART_TIMEOUT)
+                if not r.is_success:
+                    raise Exception(f"PUT {r.status_code}")
+                break
+            except Exception:
+                if attempt >= _UPLOAD_PART_RETRIES - 1:
+                    raise
+                time.sleep(2 ** attempt)
+        cls._api_with_retry(f"/v2/{scope}/{target_id}/upload_part_finish", {
+            'upload_id': upload_id, 'part_index': part['index'], 'block_size': len(chunk), 'md5': hashlib.md5(chunk).hexdigest()})
+        return len(chunk)
+
+    def _chunked_upload(self, source, file_type, is_group, target_id, file_name=None):
+        """分片上传本地文件路径或内存数据，分片并发上传，返回 file_info"""
+        from concurrent.futures import ThreadPoolExecutor, FIRST_EXCEPTION, wait
+        is_path = isinstance(source, str)
+        file_size = os.path.getsize(source) if is_path else len(source)
+        hashes = self._compute_file_hashes(source, file_size)
+        file_name = file_name or (os.path.basename(source) if is_path else hashes['md5'])
         scope = 'groups' if is_group else 'users'
 
         # 1. 申请上传
@@ -948,43 +1070,24 @@ class MessageEvent:
             'file_type': file_type, 'file_name': file_name, 'file_size': file_size, **hashes})
         upload_id, block_size, parts = prep['upload_id'], int(prep['block_size']), prep['parts']
 
-        # 2. 逐片上传
-        for part in parts:
-            idx = part['index']
-            offset = (idx - 1) * block_size
-            with open(file_path, 'rb') as f:
-                f.seek(offset)
-                chunk = f.read(min(block_size, file_size - offset))
-            # PUT 到预签名 URL（带重试）
-            for attempt in range(3):
-                try:
-                    r = _req.put(part['presigned_url'], data=chunk, headers={'Content-Length': str(len(chunk))}, timeout=300)
-                    if not r.ok:
-                        raise Exception(f"PUT {r.status_code}")
-                    break
-                except Exception:
-                    if attempt >= 2: raise
-                    time.sleep(1 * (2 ** attempt))
-            # 通知平台分片完成
-            self._api_with_retry(f"/v2/{scope}/{target_id}/upload_part_finish", {
-                'upload_id': upload_id, 'part_index': idx, 'block_size': len(chunk), 'md5': hashlib.md5(chunk).hexdigest()})
+        # 2. 并发上传分片，任一分片重试耗尽即中止
+        with ThreadPoolExecutor(max_workers=min(_UPLOAD_CONCURRENCY, len(parts)) or 1, thread_name_prefix="ChunkUpload") as executor:
+            futures = []
+            for part in parts:
+                offset = (part['index'] - 1) * block_size
+                futures.append(executor.submit(self._upload_part, source, part, offset, min(block_size, file_size - offset), upload_id, scope, target_id))
+            done, pending = wait(futures, return_when=FIRST_EXCEPTION)
+            for future in pending:
+                future.cancel()
+            for future in done:
+                future.result()
 
         # 3. 完成上传
         return self._api_with_retry(f"/v2/{scope}/{target_id}/files", {'upload_id': upload_id}, base_delay=2.0).get('file_info')
 
     def _chunked_upload_from_bytes(self, file_bytes, file_type, is_group, target_id, file_name=None):
-        """从内存数据分片上传（写临时文件）"""
-        suffix = os.path.splitext(file_name)[1] if file_name else ''
-        tmp_path = None
-        try:
-            with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as f:
-                f.write(file_bytes)
-                tmp_path = f.name
-            return self._chunked_upload(tmp_path, file_type, is_group, target_id)
-        finally:
-            if tmp_path and os.path.exists(tmp_path):
-                try: os.remove(tmp_path)
-                except OSError: pass
+        """从内存数据分片上传，直接切片内存数据，不写临时文件"""
+        return self._chunked_upload(file_bytes, file_type, is_group, target_id, file_name=file_name)
 
     def _upload_media_via_url(self, url, file_type, srv_send_msg=False, file_name=None):
         """通过 URL 上传媒体，返回 file_info 或 None"""
@@ -1089,7 +1192,12 @@ class MessageEvent:
             'timestamp': timestamp, 'type': 'received', 'content': self.content or "", 
             'user_id': self.user_id or "未知用户", 'group_id': self.group_id or "c2c", 'plugin_name': ''
         }
-        db_entry['raw_message'] = json.dumps(self.raw_data, ensure_ascii=False, indent=2) if SAVE_RAW_MESSAGE_TO_DB and isinstance(self.raw_data, dict) else str(self.raw_data) if SAVE_RAW_MESSAGE_TO_DB else ''
+        if not SAVE_RAW_MESSAGE_TO_DB:
+            db_entry['raw_message'] = ''
+        elif self.raw_text is not None:
+            db_entry['raw_message'] = self.raw_text
+        else:
+            db_entry['raw_message'] = json.dumps(self.raw_data, ensure_ascii=False, indent=2)
         add_log_to_db('message', db_entry)
 
     def _notify_web_display(self, timestamp):
@@ -1153,7 +1261,14 @@ class MessageEvent:
         add_error_log(msg, tb or "")
 
     def get(self, path):
-        return Json取(self.raw_data, path)
+        data = self.raw_data
+        for key in _split_path(path):
+            if not isinstance(data, dict):
+                return None
+            data = data.get(key)
+            if data is None:
+                return None
+        return data
     
     def sanitize_content(self, content):
         if not content:
@@ -1206,8 +1321,7 @@ class MessageEvent:
                     return {'width': width, 'height': height, 'px': f'#{width}px #{height}px'}
             elif isinstance(image_input, str):
                 if image_input.startswith(('http://', 'https://')):
-                    import requests
-                    response = requests.get(image_input, headers={'Range': 'bytes=0-65535'}, stream=True, timeout=10)
+                    response = sync_get(image_input, headers={'Range': 'bytes=0-65535'}, timeout=10, follow_redirects=True)
                     if response.status_code in [206, 200]:
                         with Image.open(io.BytesIO(response.content)) as img:
                             width, height = img.size
@@ -1299,28 +1413,30 @@ class MessageEvent:
     # ==================== 主动消息静态方法 ====================
 
     @staticmethod
-    def send_to_user(user_id, content='', buttons=None, use_markdown=None):
+    def send_to_user(user_id, content='', buttons=None, use_markdown=None, wait=True):
         """无需 event 上下文的主动私聊消息
 
         用法:
             MessageEvent.send_to_user("用户OpenID", "你好")
             MessageEvent.send_to_user("用户OpenID", "你好", use_markdown=True)
+            future = MessageEvent.send_to_user("用户OpenID", "你好", wait=False)  # 立即返回，future.result() 为消息ID
         """
         e = MessageEvent.__new__(MessageEvent)
         e._init_minimal()
-        return e.reply(content, buttons=buttons, use_markdown=use_markdown, target_user_id=user_id)
+        return e.reply(content, buttons=buttons, use_markdown=use_markdown, target_user_id=user_id, wait=wait)
 
     @staticmethod
-    def send_to_group(group_id, content='', buttons=None, use_markdown=None):
+    def send_to_group(group_id, content='', buttons=None, use_markdown=None, wait=True):
         """无需 event 上下文的主动群消息
 
         用法:
             MessageEvent.send_to_group("群OpenID", "你好")
             MessageEvent.send_to_group("群OpenID", "你好", use_markdown=True)
+            future = MessageEvent.send_to_group("群OpenID", "你好", wait=False)  # 立即返回，future.result() 为消息ID
         """
         e = MessageEvent.__new__(MessageEvent)
         e._init_minimal()
-        return e.reply(content, buttons=buttons, use_markdown=use_markdown, target_group_id=group_id)
+        return e.reply(content, buttons=buttons, use_markdown=use_markdown, target_group_id=group_id, wait=wait)
 
     @staticmethod
     def send_image_to_user(user_id, image_data, content=''):
@@ -1344,6 +1460,7 @@ class MessageEvent:
             self._init_type_sets()
         self.is_private = self.is_group = False
         self.raw_data = {}
+        self.raw_text = None
         self.user_id = self.group_id = self.guild_id = self.union_openid = None
         self.content = ""
         self.message_type = self.UNKNOWN_MESSAGE
@@ -1372,4 +1489,79 @@ class MessageEvent:
             add_log_to_db('message', db_entry)
         except:
             pass
-            
\ No newline at end of file
+            
+
+
+# ==================== 回复方法埋点 ====================
+# 在类上安装一次，插件处理器执行期间（_reply_plugin 非空）的每次回复写入面板与消息日志；
+# payload 原样交给日志接收方，仅在面板读取或 SAVE_RAW_MESSAGE_TO_DB 入库时才序列化
+
+_REPLY_LOG_DESCRIBERS = {
+    'reply': lambda a, k: a[0] if a else k.get('content', ''),
+    'reply_image': lambda a, k: f"[图片] {a[1] if len(a) > 1 else k.get('content', '')}".strip(),
+    'reply_voice': lambda a, k: f"[语音] {a[1] if len(a) > 1 else k.get('content', '')}".strip(),
+    'reply_video': lambda a, k: f"[视频] {a[1] if len(a) > 1 else k.get('content', '')}".strip(),
+    'reply_ark': lambda a, k: f"[ARK] {a[0] if a else k.get('template_id', '')}",
+    'reply_markdown': lambda a, k: f"[MD] {a[0] if a else k.get('template', '')}",
+    'reply_md': lambda a, k: f"[MD] {a[0] if a else k.get('template', '')}",
+    'reply_markdown_aj': lambda a, k: f"[MD_AJ] {a[0] if a else k.get('text', '')}",
+}
+
+# 当前线程是否已处于某个回复方法内，reply_md -> reply_markdown 这类嵌套调用只记录最外层；
+# sent_payload 为本线程最近一次发送成功的 payload，供回复日志记录原始消息
+_reply_guard = threading.local()
+
+def _take_sent_payload():
+    payload = getattr(_reply_guard, 'sent_payload', None)
+    _reply_guard.sent_payload = None
+    return payload
+
+def _log_plugin_reply(event, plugin_name, method_name, args, kwargs, payload):
+    text_content = _REPLY_LOG_DESCRIBERS[method_name](args, kwargs)
+    if not isinstance(text_content, str):
+        text_content = "[非文本内容]"
+    user_id = getattr(event, 'user_id', '')
+    group_id = getattr(event, 'group_id', None) or 'c2c'
+
+    add_plugin_log(text_content, user_id=user_id, group_id=group_id, plugin_name=plugin_name, raw_message=payload)
+
+    from config import SAVE_RAW_MESSAGE_TO_DB
+    add_log_to_db('message', {
+        'timestamp': time.strftime(MessageEvent._TIMESTAMP_FORMAT), 'type': 'plugin', 'content': text_content,
+        'user_id': user_id, 'group_id': group_id, 'plugin_name': plugin_name,
+        'raw_message': payload if SAVE_RAW_MESSAGE_TO_DB else ''
+    })
+
+def _instrument_reply_method(method_name):
+    original = getattr(MessageEvent, method_name)
+
+    @wraps(original)
+    def instrumented(self, *args, **kwargs):
+        plugin_name = self._reply_plugin
+        if plugin_name is None or getattr(_reply_guard, 'active', False):
+            return original(self, *args, **kwargs)
+        _reply_guard.active = True
+        _reply_guard.sent_payload = None
+        try:
+            result = original(self, *args, **kwargs)
+        finally:
+            _reply_guard.active = False
+        if isinstance(result, Future):
+            # 未等待发送完成时（插件处理器内或 wait=False），payload 由发送回调附在 Future 上，完成后再记录
+            def log_when_sent(future):
+                try:
+                    _log_plugin_reply(self, plugin_name, method_name, args, kwargs, getattr(future, 'sent_payload', None))
+                except:
+                    pass
+            result.add_done_callback(log_when_sent)
+            return result
+        try:
+            _log_plugin_reply(self, plugin_name, method_name, args, kwargs, _take_sent_payload())
+        except:
+            pass
+        return result
+
+    setattr(MessageEvent, method_name, instrumented)
+
+for _method_name in _REPLY_LOG_DESCRIBERS:
+    _instrument_reply_method(_method_name)
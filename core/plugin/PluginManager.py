@@ -14,15 +14,19 @@ import json
 import logging
 import threading
 from functools import lru_cache
+from types import MappingProxyType
 from concurrent.futures import ThreadPoolExecutor
 
-from config import (
-    SEND_DEFAULT_RESPONSE, OWNER_IDS, MAINTENANCE_MODE,
-    DEFAULT_RESPONSE_EXCLUDED_REGEX
-)
+try:
+    from re import _parser as _sre_parse, _constants as _sre_constants
+except ImportError:
+    import sre_parse as _sre_parse, sre_constants as _sre_constants
+
+import config as _config_module
+from config import DEFAULT_RESPONSE_EXCLUDED_REGEX
 from core.plugin.message_templates import MessageTemplate, MSG_TYPE_MAINTENANCE, MSG_TYPE_GROUP_ONLY, MSG_TYPE_OWNER_ONLY, MSG_TYPE_DEFAULT, MSG_TYPE_BLACKLIST, MSG_TYPE_GROUP_BLACKLIST
-from web.app import add_plugin_log
 from function.log_db import add_log_to_db, add_framework_log, add_error_log
+from function.dau_rollup import record_command_rollup
 
 _logger = logging.getLogger('ElainaBot.core.PluginManager')
 
@@ -32,23 +36,7 @@ _LOG_TYPE_ERROR = 'error'
 _GROUP_EVENT_TYPES = frozenset(['GROUP_AT_MESSAGE_CREATE', 'AT_MESSAGE_CREATE'])
 _INTERACTION_EVENT = 'INTERACTION_CREATE'
 _DEFAULT_GROUP_ID = 'c2c'
-_BLACKLIST_RELOAD_INTERVAL = 60
-_OWNER_IDS_SET = frozenset(OWNER_IDS)
-
-_maintenance_mode_enabled = MAINTENANCE_MODE
-_send_default_response = SEND_DEFAULT_RESPONSE
-
-try:
-    from config import BLACKLIST_ENABLED
-    _blacklist_enabled = BLACKLIST_ENABLED
-except ImportError:
-    _blacklist_enabled = False
-
-try:
-    from config import GROUP_BLACKLIST_ENABLED
-    _group_blacklist_enabled = GROUP_BLACKLIST_ENABLED
-except ImportError:
-    _group_blacklist_enabled = False
+_FILTER_WATCH_INTERVAL = 5
 
 def _log_error(error_msg, error_trace=None):
     if error_trace:
@@ -65,16 +53,68 @@ _data_dir = os.path.join(_base_dir, "data")
 _blacklist_file = os.path.join(_data_dir, "blacklist.json")
 _group_blacklist_file = os.path.join(_data_dir, "group_blacklist.json")
 
-_blacklist_cache = {}
-_blacklist_last_load = 0
-_group_blacklist_cache = {}
-_group_blacklist_last_load = 0
+
+class _DispatchFilter:
+    """分发前过滤条件的不可变快照：黑名单、维护模式与主人豁免、默认回复开关
+
+    配置或黑名单文件变化时整体重建并替换模块级引用，分发热路径只做集合查找，不访问文件系统。
+    """
+    __slots__ = ('maintenance', 'owner_ids', 'user_blacklist', 'group_blacklist', 'send_default_response',
+                 'blacklist_enabled', 'group_blacklist_enabled', 'file_mtimes')
+
+    def __init__(self, config_module, user_blacklist, group_blacklist, file_mtimes):
+        self.maintenance = bool(getattr(config_module, 'MAINTENANCE_MODE', False))
+        self.owner_ids = frozenset(getattr(config_module, 'OWNER_IDS', ()))
+        self.send_default_response = bool(getattr(config_module, 'SEND_DEFAULT_RESPONSE', False))
+        self.blacklist_enabled = bool(getattr(config_module, 'BLACKLIST_ENABLED', False))
+        self.group_blacklist_enabled = bool(getattr(config_module, 'GROUP_BLACKLIST_ENABLED', False))
+        # 功能关闭时对应名单为空，热路径无需再判断开关
+        self.user_blacklist = MappingProxyType(user_blacklist if self.blacklist_enabled else {})
+        self.group_blacklist = MappingProxyType(group_blacklist if self.group_blacklist_enabled else {})
+        self.file_mtimes = file_mtimes
+
+def _file_mtime(file_path):
+    try:
+        return os.stat(file_path).st_mtime
+    except OSError:
+        return None
+
+def _read_blacklist_file(file_path, enabled):
+    if not enabled:
+        return {}
+    try:
+        if not os.path.exists(file_path):
+            os.makedirs(_data_dir, exist_ok=True)
+            with open(file_path, 'w', encoding='utf-8') as f:
+                json.dump({}, f)
+        with open(file_path, 'r', encoding='utf-8') as f:
+            return {str(k): v for k, v in json.load(f).items()}
+    except Exception as e:
+        # 文件写到一半或格式错误时沿用旧名单，等待下次变化再重建
+        _log_error(f"加载缓存文件失败 {file_path}: {str(e)}")
+        if _dispatch_filter is None:
+            return {}
+        return dict(_dispatch_filter.user_blacklist if file_path == _blacklist_file else _dispatch_filter.group_blacklist)
+
+def _build_dispatch_filter(config_module):
+    # 先记录 mtime 再读取，读取期间发生的修改会在下一轮监视时被发现
+    mtimes = (_file_mtime(_blacklist_file), _file_mtime(_group_blacklist_file))
+    return _DispatchFilter(
+        config_module,
+        _read_blacklist_file(_blacklist_file, getattr(config_module, 'BLACKLIST_ENABLED', False)),
+        _read_blacklist_file(_group_blacklist_file, getattr(config_module, 'GROUP_BLACKLIST_ENABLED', False)),
+        mtimes
+    )
+
+_dispatch_filter = None
+_dispatch_filter = _build_dispatch_filter(_config_module)
+_dispatch_filter_lock = threading.Lock()
+_dispatch_filter_watcher = None
 
 _last_plugin_gc_time = 0
 _plugin_gc_interval = 30
 _last_quick_check_time = 0
 _plugins_loaded = False
-_last_cache_cleanup = 0
 _plugin_executor = ThreadPoolExecutor(max_workers=100, thread_name_prefix="PluginWorker")
 
 _SOFT_TIMEOUT = 3.0
@@ -98,13 +138,59 @@ def _compile_regex_cached(pattern):
     except Exception:
         return None
 
+_PREFIX_ANCHORS = frozenset([_sre_constants.AT_BEGINNING, _sre_constants.AT_BEGINNING_STRING])
+_PREFIX_UNSAFE_FLAGS = re.IGNORECASE | re.MULTILINE
+_PREFIX_MAX_ALTERNATIVES = 64
+
+def _literal_prefixes(items):
+    """返回 (可能的字面量前缀列表, 是否整段均为字面量)"""
+    prefixes = ['']
+    for op, av in items:
+        if op is _sre_constants.LITERAL:
+            prefixes = [p + chr(av) for p in prefixes]
+            continue
+        if op is _sre_constants.SUBPATTERN:
+            if av[1] & _PREFIX_UNSAFE_FLAGS:
+                return prefixes, False
+            sub_prefixes, complete = _literal_prefixes(av[-1])
+        elif op is _sre_constants.BRANCH:
+            sub_prefixes, complete = [], True
+            for branch in av[1]:
+                branch_prefixes, branch_complete = _literal_prefixes(branch)
+                sub_prefixes.extend(branch_prefixes)
+                complete = complete and branch_complete
+        elif op is _sre_constants.IN and all(item_op is _sre_constants.LITERAL for item_op, _ in av):
+            sub_prefixes, complete = [chr(item_av) for _, item_av in av], True
+        else:
+            return prefixes, False
+        if len(prefixes) * len(sub_prefixes) > _PREFIX_MAX_ALTERNATIVES:
+            return prefixes, False
+        prefixes = [p + s for p in prefixes for s in sub_prefixes]
+        if not complete:
+            return prefixes, False
+    return prefixes, True
+
+@lru_cache(maxsize=4096)
+def _extract_literal_prefixes(pattern):
+    """提取 ^ 锚定正则的固定字面量前缀，无法提取时返回 ('',)"""
+    try:
+        parsed = _sre_parse.parse(pattern, re.DOTALL)
+    except Exception:
+        return ('',)
+    items = list(parsed)
+    if (parsed.state.flags & _PREFIX_UNSAFE_FLAGS or not items
+            or items[0][0] is not _sre_constants.AT or items[0][1] not in _PREFIX_ANCHORS):
+        return ('',)
+    prefixes, _ = _literal_prefixes(items[1:])
+    return tuple(sorted(set(prefixes)))
+
 class PluginManager:
     _regex_handlers = {}
     _plugins = {}
     _file_last_modified = {}
     _unloaded_modules = []
     _sorted_handlers = []
-    _handler_patterns_cache = {}
+    _handler_index = None  # (按优先级排列的处理器列表, 字面量前缀字典树)
     _web_routes = {}
     _api_routes = {}
     _csp_domains = {}  # 存储插件的CSP域名配置
@@ -175,58 +261,55 @@ class PluginManager:
         return compiled_regex
 
     @classmethod
-    def _load_json_cache(cls, file_path, cache, last_load, enabled):
-        if not enabled:
-            return {}, last_load
-        
-        if not os.path.exists(_data_dir):
-            os.makedirs(_data_dir, exist_ok=True)
-        if not os.path.exists(file_path):
-            with open(file_path, 'w', encoding='utf-8') as f:
-                json.dump({}, f)
-        
-        current_time = time.time()
-        if last_load == 0 or (current_time - last_load > _BLACKLIST_RELOAD_INTERVAL):
+    def refresh_dispatch_filter(cls):
+        """按当前配置重新读取黑名单文件，生成新的过滤快照并原子替换"""
+        global _dispatch_filter
+        with _dispatch_filter_lock:
+            _dispatch_filter = _build_dispatch_filter(_config_module)
+        return _dispatch_filter
+
+    @classmethod
+    def _start_dispatch_filter_watcher(cls):
+        global _dispatch_filter_watcher
+        if _dispatch_filter_watcher is not None:
+            return
+        with _dispatch_filter_lock:
+            if _dispatch_filter_watcher is not None:
+                return
+            _dispatch_filter_watcher = threading.Thread(target=cls._watch_dispatch_filter, daemon=True, name="DispatchFilterWatcher")
+        _dispatch_filter_watcher.start()
+
+    @classmethod
+    def _watch_dispatch_filter(cls):
+        """后台检查黑名单文件 mtime，变化时重建快照"""
+        while True:
+            time.sleep(_FILTER_WATCH_INTERVAL)
             try:
-                mtime = os.path.getmtime(file_path)
-                if not cache or mtime > last_load:
-                    with open(file_path, 'r', encoding='utf-8') as f:
-                        return json.load(f), current_time
+                current = (_file_mtime(_blacklist_file), _file_mtime(_group_blacklist_file))
+                if current != _dispatch_filter.file_mtimes:
+                    cls.refresh_dispatch_filter()
             except Exception as e:
-                _log_error(f"加载缓存文件失败 {file_path}: {str(e)}")
-        return cache, last_load
-    
+                _log_error(f"黑名单文件监视失败: {str(e)}")
+
     @classmethod
     def load_blacklist(cls):
-        global _blacklist_cache, _blacklist_last_load
-        _blacklist_cache, _blacklist_last_load = cls._load_json_cache(
-            _blacklist_file, _blacklist_cache, _blacklist_last_load, _blacklist_enabled
-        )
-        return _blacklist_cache
+        return _dispatch_filter.user_blacklist
     
     @classmethod
     def load_group_blacklist(cls):
-        global _group_blacklist_cache, _group_blacklist_last_load
-        _group_blacklist_cache, _group_blacklist_last_load = cls._load_json_cache(
-            _group_blacklist_file, _group_blacklist_cache, _group_blacklist_last_load, _group_blacklist_enabled
-        )
-        return _group_blacklist_cache
+        return _dispatch_filter.group_blacklist
     
     @classmethod
     def is_group_blacklisted(cls, group_id):
-        if not _group_blacklist_enabled or not group_id:
-            return False, ""
-        blacklist = cls.load_group_blacklist()
-        if group_id in blacklist:
-            return True, blacklist.get(group_id, "未指明原因")
+        blacklist = _dispatch_filter.group_blacklist
+        if group_id and group_id in blacklist:
+            return True, blacklist.get(group_id) or "未指明原因"
         return False, ""
     
     @classmethod
     def is_blacklisted(cls, user_id):
-        if not _blacklist_enabled or not user_id:
-            return False, ""
-        blacklist = cls.load_blacklist()
-        if str(user_id) in blacklist:
+        blacklist = _dispatch_filter.user_blacklist
+        if user_id and str(user_id) in blacklist:
             return True, blacklist[str(user_id)]
         return False, ""
 
@@ -255,13 +338,14 @@ class PluginManager:
     
     @classmethod
     def load_plugins(cls):
-        global _last_plugin_gc_time, _last_quick_check_time, _plugins_loaded, _last_cache_cleanup
+        global _last_plugin_gc_time, _last_quick_check_time, _plugins_loaded
         
         current_time = time.time()
         if _plugins_loaded and current_time - _last_quick_check_time < 2:
             return len(cls._plugins)
         
         _last_quick_check_time = current_time
+        cls._start_dispatch_filter_watcher()
         
         script_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
         plugins_dir = os.path.join(script_dir, 'plugins')
@@ -281,11 +365,6 @@ class PluginManager:
         main_module_loaded = cls._import_main_module_instances()
         cls._periodic_gc()
         
-        if current_time - _last_cache_cleanup > 300:
-            if len(cls._handler_patterns_cache) > 200:
-                cls._handler_patterns_cache.clear()
-            _last_cache_cleanup = current_time
-        
         _plugins_loaded = True
         return loaded_count + main_module_loaded
     
@@ -634,7 +713,7 @@ class PluginManager:
         
         if removed:
             cls._rebuild_sorted_handlers()
-            cls._handler_patterns_cache.clear()
+            cls._handler_index = None
             
         return len(removed)
     
@@ -699,26 +778,49 @@ class PluginManager:
         cls._sorted_handlers = sorted(handlers_with_priority, key=lambda x: x['priority'])
     
     @classmethod
-    def _rebuild_handler_patterns_cache(cls):
-        cls._handler_patterns_cache.clear()
+    def _rebuild_handler_index(cls):
+        handler_patterns = []
+        prefix_trie = {}
         
-        for i, handler_data in enumerate(cls._sorted_handlers):
+        for handler_data in cls._sorted_handlers:
             pattern = handler_data['pattern']
-            handler_info = handler_data['handler_info']
-            priority = handler_data['priority']
             
             # 直接使用 LRU 缓存编译
             compiled_regex = cls._compile_and_cache_regex(pattern)
             if not compiled_regex:
                 continue
             
-            handler_key = f"{priority}_{i}_{pattern}"
-            cls._handler_patterns_cache[handler_key] = {
+            index = len(handler_patterns)
+            handler_patterns.append({
                 'regex': compiled_regex,
-                'handler_info': handler_info,
-                'priority': priority,
+                'handler_info': handler_data['handler_info'],
+                'priority': handler_data['priority'],
                 'pattern': pattern
-            }
+            })
+            
+            # 无字面量前缀的正则挂在根节点，对所有消息都进行匹配
+            for prefix in _extract_literal_prefixes(pattern):
+                node = prefix_trie
+                for char in prefix:
+                    node = node.setdefault(char, {})
+                node.setdefault(None, []).append(index)
+        
+        cls._handler_index = (handler_patterns, prefix_trie)
+        return cls._handler_index
+    
+    @classmethod
+    def _get_candidate_handlers(cls, event_content):
+        handler_patterns, node = cls._handler_index or cls._rebuild_handler_index()
+        
+        candidates = list(node.get(None, ()))
+        for char in event_content:
+            node = node.get(char)
+            if node is None:
+                break
+            candidates.extend(node.get(None, ()))
+        
+        # 下标即优先级顺序，排序后与全量扫描的匹配顺序一致
+        return [handler_patterns[i] for i in sorted(set(candidates))]
 
     @classmethod
     def register_plugin(cls, plugin_class, skip_log=False):
@@ -795,7 +897,7 @@ class PluginManager:
                 _log_error(f"注册Web路由失败: {plugin_class.__name__} - {str(e)}", traceback.format_exc())
         
         cls._rebuild_sorted_handlers()
-        cls._handler_patterns_cache.clear()
+        cls._handler_index = None
         return handlers_count
 
     @classmethod
@@ -849,31 +951,19 @@ class PluginManager:
 
     @classmethod
     def is_maintenance_mode(cls):
-        global _maintenance_mode_enabled
-        return _maintenance_mode_enabled
+        return _dispatch_filter.maintenance
 
     @classmethod
     def can_user_bypass_maintenance(cls, user_id):
-        return user_id in _OWNER_IDS_SET
+        return user_id in _dispatch_filter.owner_ids
     
     @classmethod
     def reload_config_status(cls):
-        global _maintenance_mode_enabled, _blacklist_enabled, _group_blacklist_enabled, _send_default_response, _OWNER_IDS_SET
+        """重新加载 config.py 并重建过滤快照，仅在面板或插件修改配置时调用，不在消息热路径上"""
         try:
-            import importlib
-            import config as config_module
-            importlib.reload(config_module)
-            
-            _maintenance_mode_enabled = config_module.MAINTENANCE_MODE
-            _send_default_response = config_module.SEND_DEFAULT_RESPONSE
-            _OWNER_IDS_SET = frozenset(config_module.OWNER_IDS)
-            _blacklist_enabled = getattr(config_module, 'BLACKLIST_ENABLED', False)
-            _group_blacklist_enabled = getattr(config_module, 'GROUP_BLACKLIST_ENABLED', False)
-            
-            if _group_blacklist_enabled:
-                cls.load_group_blacklist()
-            
-            add_framework_log(f"配置已更新 - 维护:{_maintenance_mode_enabled}, 黑名单:{_blacklist_enabled}, 群黑名单:{_group_blacklist_enabled}")
+            importlib.reload(_config_module)
+            snapshot = cls.refresh_dispatch_filter()
+            add_framework_log(f"配置已更新 - 维护:{snapshot.maintenance}, 黑名单:{snapshot.blacklist_enabled}, 群黑名单:{snapshot.group_blacklist_enabled}")
             return True
         except Exception as e:
             _log_error(f"重新加载配置失败: {str(e)}", traceback.format_exc())
@@ -882,7 +972,7 @@ class PluginManager:
     @classmethod
     def dispatch_message(cls, event):
         try:
-            global _maintenance_mode_enabled, _blacklist_enabled, _group_blacklist_enabled, _last_background_cleanup
+            global _last_background_cleanup
             
             cls.load_plugins()
             
@@ -894,27 +984,25 @@ class PluginManager:
             if getattr(event, 'handled', False):
                 return True
             
+            # 取一次快照引用，本条消息的所有判断基于同一份配置
+            snapshot = _dispatch_filter
             group_id = getattr(event, 'group_id', None)
-            if _group_blacklist_enabled and group_id:
-                is_blocked, _ = cls.is_group_blacklisted(group_id)
-                if is_blocked:
-                    MessageTemplate.send(event, MSG_TYPE_GROUP_BLACKLIST, group_id=group_id)
-                    return True
+            if group_id and group_id in snapshot.group_blacklist:
+                MessageTemplate.send(event, MSG_TYPE_GROUP_BLACKLIST, group_id=group_id)
+                return True
             
             user_id = getattr(event, 'user_id', None)
-            if _blacklist_enabled and user_id:
-                is_blocked, reason = cls.is_blacklisted(user_id)
-                if is_blocked:
-                    content = getattr(event, 'content', '')
-                    if not (content and _ID_COMMAND_PATTERN.match(content.strip())):
-                        MessageTemplate.send(event, MSG_TYPE_BLACKLIST, reason=reason)
-                        return True
+            if user_id and str(user_id) in snapshot.user_blacklist:
+                content = getattr(event, 'content', '')
+                if not (content and _ID_COMMAND_PATTERN.match(content.strip())):
+                    MessageTemplate.send(event, MSG_TYPE_BLACKLIST, reason=snapshot.user_blacklist[str(user_id)])
+                    return True
             
-            if _maintenance_mode_enabled and not cls.can_user_bypass_maintenance(user_id):
+            is_owner = user_id in snapshot.owner_ids
+            if snapshot.maintenance and not is_owner:
                 MessageTemplate.send(event, MSG_TYPE_MAINTENANCE)
                 return True
                 
-            is_owner = user_id in _OWNER_IDS_SET
             is_group = cls._is_group_chat(event)
             
             return cls._process_message(event, is_owner, is_group)
@@ -978,7 +1066,7 @@ class PluginManager:
         elif permission_denied['owner_denied']:
             MessageTemplate.send(event, MSG_TYPE_OWNER_ONLY)
             return True
-        elif _send_default_response:
+        elif _dispatch_filter.send_default_response:
             should_exclude = cls._should_exclude_default_response(event.content)
             if not should_exclude:
                 cls.send_default_response(event)
@@ -989,10 +1077,7 @@ class PluginManager:
     def _find_matched_handlers(cls, event_content, event, is_owner, is_group, permission_denied=None):
         matched_handlers = []
         
-        if not cls._handler_patterns_cache:
-            cls._rebuild_handler_patterns_cache()
-        
-        for handler_key, handler_cache in cls._handler_patterns_cache.items():
+        for handler_cache in cls._get_candidate_handlers(event_content or ''):
             compiled_regex = handler_cache['regex']
             handler_info = handler_cache['handler_info']
             priority = handler_cache['priority']
@@ -1031,6 +1116,7 @@ class PluginManager:
             
             try:
                 event.matches = match.groups()
+                record_command_rollup(handler['pattern'])
                 result = cls._call_plugin_handler_with_logging(plugin_class, handler_name, event, plugin_name)
                 matched = True
                 
@@ -1083,23 +1169,9 @@ class PluginManager:
     def _call_plugin_handler_with_logging(cls, plugin_class, handler_name, event, plugin_name):
         global _plugin_executor
         
-        original_methods = {
-            'reply': event.reply,
-            'reply_image': getattr(event, 'reply_image', None),
-            'reply_voice': getattr(event, 'reply_voice', None),
-            'reply_video': getattr(event, 'reply_video', None),
-            'reply_ark': getattr(event, 'reply_ark', None),
-            'reply_markdown': getattr(event, 'reply_markdown', None),
-            'reply_md': getattr(event, 'reply_md', None),
-            'reply_markdown_aj': getattr(event, 'reply_markdown_aj', None)
-        }
-        
-        is_first_reply = [True]
-        wrapped_methods = cls._create_method_logger(original_methods, plugin_name, is_first_reply, event)
-        
-        for method_name, wrapped_method in wrapped_methods.items():
-            if wrapped_method:
-                setattr(event, method_name, wrapped_method)
+        # 回复日志由 MessageEvent 的类级埋点记录，这里只标记当前处理器所属插件
+        previous_plugin = event._reply_plugin
+        event._reply_plugin = plugin_name
         
         try:
             handler = getattr(plugin_class, handler_name)
@@ -1173,9 +1245,7 @@ class PluginManager:
                 return True
                 
         finally:
-            for method_name, original_method in original_methods.items():
-                if original_method:
-                    setattr(event, method_name, original_method)
+            event._reply_plugin = previous_plugin
     
     @classmethod
     def _cleanup_background_tasks(cls):
@@ -1209,72 +1279,6 @@ class PluginManager:
                 'is_running': not task_info['future'].done()
             } for task_info in _background_tasks.values()]
     
-    @classmethod
-    def _create_method_logger(cls, original_methods_dict, plugin_name, is_first_reply, event):
-        def _create_logged_method(original_method, method_name):
-            def logged_method(*args, **kwargs):
-                # 先调用原方法
-                result = original_method(*args, **kwargs)
-                
-                # 提取内容信息
-                content_extractors = {
-                    'reply': lambda a, k: a[0] if a else k.get('content', ''),
-                    'reply_image': lambda a, k: f"[图片] {a[1] if len(a) > 1 else k.get('content', '')}".strip(),
-                    'reply_voice': lambda a, k: f"[语音] {a[1] if len(a) > 1 else k.get('content', '')}".strip(),
-                    'reply_video': lambda a, k: f"[视频] {a[1] if len(a) > 1 else k.get('content', '')}".strip(),
-                    'reply_ark': lambda a, k: f"[ARK] {a[0] if a else k.get('template_id', '')}",
-                    'reply_markdown': lambda a, k: f"[MD] {a[0] if a else k.get('template', '')}",
-                    'reply_md': lambda a, k: f"[MD] {a[0] if a else k.get('template', '')}",
-                    'reply_markdown_aj': lambda a, k: f"[MD_AJ] {a[0] if a else k.get('text', '')}"
-                }
-                
-                extractor = content_extractors.get(method_name)
-                text_content = extractor(args, kwargs) if extractor else f"[{method_name}]"
-                if method_name == 'reply' and not isinstance(text_content, str):
-                    text_content = "[非文本内容]"
-                
-                user_id = getattr(event, 'user_id', '')
-                group_id = getattr(event, 'group_id', None) or _DEFAULT_GROUP_ID
-                
-                # 获取最后发送的payload
-                raw_message = ''
-                payload = getattr(event, '_last_sent_payload', None)
-                if payload:
-                    try:
-                        raw_message = json.dumps(payload, ensure_ascii=False)
-                    except:
-                        raw_message = str(payload)
-                    event._last_sent_payload = None
-                
-                # 记录到web面板
-                add_plugin_log(text_content, user_id=user_id, group_id=group_id, plugin_name=plugin_name, raw_message=raw_message)
-                
-                # 记录到数据库
-                from config import SAVE_RAW_MESSAGE_TO_DB
-                db_entry = {
-                    'timestamp': time.strftime(_TIMESTAMP_FORMAT),
-                    'type': 'plugin',
-                    'content': text_content,
-                    'user_id': user_id,
-                    'group_id': group_id,
-                    'plugin_name': plugin_name,
-                    'raw_message': raw_message if SAVE_RAW_MESSAGE_TO_DB else ''
-                }
-                add_log_to_db('message', db_entry)
-                
-                if is_first_reply[0]:
-                    is_first_reply[0] = False
-                
-                return result
-            return logged_method
-        
-        wrapped_methods = {}
-        for method_name, original_method in original_methods_dict.items():
-            if original_method:
-                wrapped_methods[method_name] = _create_logged_method(original_method, method_name)
-        
-        return wrapped_methods
-
     # === 默认回复 ===
     @classmethod
     def _get_exclude_patterns(cls):
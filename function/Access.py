@@ -1,9 +1,10 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
-import json, requests, os, sys, time, threading
+import json, os, sys, time, threading
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from config import appid, secret
+from function.httpx_pool import sync_request, sync_post
 
 try:
     from config import SANDBOX_MODE
@@ -11,7 +12,6 @@ except ImportError:
     SANDBOX_MODE = False
 
 _token_info = {'access_token': None, 'expires_in': 0, 'last_update': 0}
-_session = requests.Session()
 _TOKEN_URL = "https://bots.qq.com/app/getAppAccessToken"
 _API_BASE = "https://api.sgroup.qq.com"
 _SANDBOX_API_BASE = "https://sandbox.api.sgroup.qq.com"
@@ -27,16 +27,17 @@ def curl(url, method="POST", headers=None, params=None):
     headers = headers or _DEFAULT_HEADERS
     params = json.loads(params) if isinstance(params, str) else params
     
+    # 与令牌刷新、媒体下载、分片上传共用 httpx 连接池，开放平台主机走独立的 HTTP/2 连接池
     if method == "GET":
-        return _session.get(url, headers=headers, params=params).text
-    return _session.request(method, url, headers=headers, json=params).text
+        return sync_request("GET", url, headers=headers, params=params).text
+    return sync_request(method, url, headers=headers, json=params).text
 
 def 获取新Token():
     global _token_info, _last_token_error
     _last_token_error = None
     for i in range(3):
         try:
-            resp = _session.post(_TOKEN_URL, headers=_DEFAULT_HEADERS, json=_TOKEN_PAYLOAD)
+            resp = sync_post(_TOKEN_URL, headers=_DEFAULT_HEADERS, json=_TOKEN_PAYLOAD)
             try:
                 response = resp.json()
             except Exception:
@@ -75,6 +76,40 @@ def BOT凭证():
 
 threading.Thread(target=定时更新Token, daemon=True).start()
 
+_SANDBOX_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'sandbox.json')
+_SANDBOX_CHECK_INTERVAL = 5
+_sandbox_groups = frozenset()
+_sandbox_mtime = None
+_sandbox_checked_at = 0
+_sandbox_lock = threading.Lock()
+
+def _load_sandbox_groups():
+    """读取 data/sandbox.json 并返回沙盒群集合"""
+    try:
+        with open(_SANDBOX_FILE, 'r', encoding='utf-8') as f:
+            sandbox_group = json.load(f).get('sandbox_group', '')
+    except:
+        return frozenset()
+    if isinstance(sandbox_group, (list, tuple)):
+        return frozenset(str(g) for g in sandbox_group if g)
+    return frozenset((str(sandbox_group),)) if sandbox_group else frozenset()
+
+def reload_sandbox_groups(force=True):
+    """刷新内存中的沙盒群表（文件 mtime 变化或 force=True 时重新读取）"""
+    global _sandbox_groups, _sandbox_mtime, _sandbox_checked_at
+    with _sandbox_lock:
+        _sandbox_checked_at = time.time()
+        try:
+            mtime = os.stat(_SANDBOX_FILE).st_mtime
+        except OSError:
+            mtime = None
+        if not force and mtime == _sandbox_mtime:
+            return _sandbox_groups
+        _sandbox_mtime = mtime
+        # 整体替换为新的 frozenset，读取方无需加锁
+        _sandbox_groups = _load_sandbox_groups() if mtime is not None else frozenset()
+        return _sandbox_groups
+
 def is_sandbox_group(group_id):
     """检查是否为沙盒群
     - 如果 SANDBOX_MODE = True，所有群都是沙盒群
@@ -84,21 +119,10 @@ def is_sandbox_group(group_id):
     if SANDBOX_MODE:
         return True
     
-    # 否则只检查是否在沙盒群列表中（只会有一个群）
-    try:
-        import os
-        base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-        sandbox_file = os.path.join(base_dir, 'data', 'sandbox.json')
-        
-        if not os.path.exists(sandbox_file):
-            return False
-        
-        with open(sandbox_file, 'r', encoding='utf-8') as f:
-            sandbox_data = json.load(f)
-            sandbox_group = sandbox_data.get('sandbox_group', '')  # 改为单个群ID
-            return str(group_id) == str(sandbox_group) if sandbox_group else False
-    except:
-        return False
+    # 沙盒群表常驻内存，每隔 _SANDBOX_CHECK_INTERVAL 秒检查一次文件 mtime
+    if time.time() - _sandbox_checked_at >= _SANDBOX_CHECK_INTERVAL:
+        reload_sandbox_groups(force=False)
+    return str(group_id) in _sandbox_groups
 
 def get_api_base(group_id=None):
     """根据群ID获取API基础地址"""
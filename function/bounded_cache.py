@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import time, threading
+from collections import OrderedDict
+
+try:
+    from config import CACHE_CONFIG
+except ImportError:
+    CACHE_CONFIG = {}
+
+_DEFAULT_CACHE_CONFIG = {
+    'nickname_size': 50000, 'nickname_ttl': 86400,
+    'last_active_size': 200000, 'last_active_ttl': 86400,
+    'markdown_template_size': 256, 'markdown_template_ttl': 0,
+}
+_CONFIG = {**_DEFAULT_CACHE_CONFIG, **CACHE_CONFIG}
+
+_caches = {}
+_registry_lock = threading.Lock()
+
+class BoundedCache:
+    """线程安全的有界 LRU 缓存，可选 TTL（秒，0 表示不过期）
+
+    超过容量时淘汰最久未访问的条目，过期条目在读取时惰性删除。
+    """
+    __slots__ = ('name', 'maxsize', 'ttl', '_data', '_lock', '_hits', '_misses', '_evictions', '_expired')
+
+    def __init__(self, name, maxsize, ttl=0):
+        self.name = name
+        self.maxsize = max(1, int(maxsize))
+        self.ttl = float(ttl or 0)
+        self._data = OrderedDict()   # key -> (value, expires_at)
+        self._lock = threading.Lock()
+        self._hits = self._misses = self._evictions = self._expired = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self._misses += 1
+                return default
+            if entry[1] and entry[1] <= time.time():
+                del self._data[key]
+                self._expired += 1
+                self._misses += 1
+                return default
+            self._data.move_to_end(key)
+            self._hits += 1
+            return entry[0]
+
+    def set(self, key, value):
+        expires_at = time.time() + self.ttl if self.ttl else 0
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self._evictions += 1
+
+    def pop(self, key, default=None):
+        with self._lock:
+            entry = self._data.pop(key, None)
+        return default if entry is None else entry[0]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get_stats(self):
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {'size': len(self._data), 'maxsize': self.maxsize, 'ttl': self.ttl,
+                    'hits': self._hits, 'misses': self._misses, 'evictions': self._evictions, 'expired': self._expired,
+                    'hit_rate': round(self._hits / lookups * 100, 1) if lookups else 0.0}
+
+def get_cache(name, maxsize=None, ttl=None):
+    """按名称获取共享缓存，容量与 TTL 优先取 CACHE_CONFIG 中的 {name}_size / {name}_ttl"""
+    cache = _caches.get(name)
+    if cache is None:
+        with _registry_lock:
+            cache = _caches.get(name)
+            if cache is None:
+                cache = BoundedCache(name, _CONFIG.get(f'{name}_size', maxsize or 10000),
+                                     _CONFIG.get(f'{name}_ttl', ttl or 0))
+                _caches[name] = cache
+    return cache
+
+def get_cache_stats():
+    return {name: cache.get_stats() for name, cache in list(_caches.items())}
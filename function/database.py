@@ -1,15 +1,22 @@
-import json, logging, threading, pymysql
+import json, logging, threading, atexit, pymysql
 from datetime import date
 from concurrent.futures import ThreadPoolExecutor
 from contextlib import contextmanager
 from config import LOG_DB_CONFIG, DB_CONFIG
 
+try:
+    from config import NICKNAME_BACKFILL_CONFIG as _NICKNAME_API_CONFIG
+except ImportError:
+    _NICKNAME_API_CONFIG = {}
+from function.bounded_cache import get_cache
+
 logger = logging.getLogger('ElainaBot.function.database')
 
 _TABLE_PREFIX = LOG_DB_CONFIG['table_prefix']
 _USERS_TABLE = f"{_TABLE_PREFIX}users"
 _GROUPS_USERS_TABLE = f"{_TABLE_PREFIX}groups_users"
 _MEMBERS_TABLE = f"{_TABLE_PREFIX}members"
+_GROUP_MEMBERS_TABLE = f"{_TABLE_PREFIX}group_members"
 _DATABASE_NAME = LOG_DB_CONFIG.get('database', 'log')
 # 数据库连接配置
 _DB_HOST = LOG_DB_CONFIG.get('host', 'localhost')
@@ -22,12 +29,17 @@ _SQL_INSERT_USER = f"INSERT IGNORE INTO {_USERS_TABLE} (user_id) VALUES (%s)"
 _SQL_COUNT_USERS = f"SELECT COUNT(*) AS count FROM {_USERS_TABLE}"
 _SQL_SELECT_USER = f"SELECT user_id FROM {_USERS_TABLE} WHERE user_id = %s"
 _SQL_SELECT_USER_NAME = f"SELECT name FROM {_USERS_TABLE} WHERE user_id = %s"
+_SQL_SELECT_UNNAMED_USERS = f"SELECT user_id FROM {_USERS_TABLE} WHERE user_id > %s AND (name IS NULL OR name = '') ORDER BY user_id LIMIT %s"
+_SQL_COUNT_UNNAMED_USERS = f"SELECT COUNT(*) AS count FROM {_USERS_TABLE} WHERE user_id > %s AND (name IS NULL OR name = '')"
 _SQL_UPSERT_USER_NAME = f"INSERT INTO {_USERS_TABLE} (user_id, name) VALUES (%s, %s) ON DUPLICATE KEY UPDATE name = %s"
 _SQL_COUNT_GROUPS = f"SELECT COUNT(*) AS count FROM {_GROUPS_USERS_TABLE}"
-_SQL_SELECT_GROUP_USERS = f"SELECT users FROM {_GROUPS_USERS_TABLE} WHERE group_id = %s"
-_SQL_UPSERT_GROUP_USERS = f"INSERT INTO {_GROUPS_USERS_TABLE} (group_id, users) VALUES (%s, %s) ON DUPLICATE KEY UPDATE users = %s"
+_SQL_SELECT_GROUP_MEMBER_COUNT = f"SELECT member_count FROM {_GROUPS_USERS_TABLE} WHERE group_id = %s"
+_SQL_UPSERT_GROUP_MEMBER = f"INSERT INTO {_GROUP_MEMBERS_TABLE} (group_id, user_id, first_seen, last_active) VALUES (%s, %s, %s, %s) ON DUPLICATE KEY UPDATE last_active = VALUES(last_active)"
+_SQL_INCR_GROUP_MEMBER_COUNT = f"INSERT INTO {_GROUPS_USERS_TABLE} (group_id, member_count) VALUES (%s, 1) ON DUPLICATE KEY UPDATE member_count = member_count + 1"
+_SQL_ENSURE_GROUP = f"INSERT IGNORE INTO {_GROUPS_USERS_TABLE} (group_id, member_count) VALUES (%s, 0)"
 _SQL_INSERT_MEMBER = f"INSERT IGNORE INTO {_MEMBERS_TABLE} (user_id) VALUES (%s)"
 _SQL_COUNT_MEMBERS = f"SELECT COUNT(*) AS count FROM {_MEMBERS_TABLE}"
+_MIGRATE_BATCH_SIZE = 50
 
 class Database:
     _instance = None
@@ -36,7 +48,8 @@ class Database:
     _table_cache = {
         'users': _USERS_TABLE,
         'groups_users': _GROUPS_USERS_TABLE,
-        'members': _MEMBERS_TABLE
+        'members': _MEMBERS_TABLE,
+        'group_members': _GROUP_MEMBERS_TABLE
     }
 
     def __new__(cls):
@@ -55,6 +68,7 @@ class Database:
     def _init_database(self):
         if self._thread_pool is None:
             self._thread_pool = ThreadPoolExecutor(max_workers=None, thread_name_prefix="Database")
+            atexit.register(self.shutdown)
         self._db_pool = None
         self._initialize_tables()
     
@@ -105,7 +119,8 @@ class Database:
             tables_sql = [
                 f"CREATE TABLE IF NOT EXISTS {_USERS_TABLE} (user_id VARCHAR(128) NOT NULL UNIQUE, name VARCHAR(255) DEFAULT NULL) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci",
                 f"CREATE TABLE IF NOT EXISTS {_GROUPS_USERS_TABLE} (group_id VARCHAR(128) NOT NULL UNIQUE, users MEDIUMTEXT DEFAULT NULL, PRIMARY KEY (group_id)) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci",
-                f"CREATE TABLE IF NOT EXISTS {_MEMBERS_TABLE} (user_id VARCHAR(128) NOT NULL UNIQUE, PRIMARY KEY (user_id)) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci"
+                f"CREATE TABLE IF NOT EXISTS {_MEMBERS_TABLE} (user_id VARCHAR(128) NOT NULL UNIQUE, PRIMARY KEY (user_id)) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci",
+                f"CREATE TABLE IF NOT EXISTS {_GROUP_MEMBERS_TABLE} (group_id VARCHAR(128) NOT NULL, user_id VARCHAR(128) NOT NULL, first_seen DATE NOT NULL, last_active DATE NOT NULL, PRIMARY KEY (group_id, user_id), KEY idx_user_id (user_id)) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci"
             ]
             conn = None
             try:
@@ -125,8 +140,16 @@ class Database:
                 )
                 if cursor.fetchone()[0] == 0:
                     cursor.execute(f"ALTER TABLE {_USERS_TABLE} ADD COLUMN name VARCHAR(255) DEFAULT NULL")
+                # 检查并添加群成员计数列
+                cursor.execute(
+                    "SELECT COUNT(*) FROM information_schema.COLUMNS WHERE TABLE_SCHEMA = %s AND TABLE_NAME = %s AND COLUMN_NAME = 'member_count'",
+                    (_DB_DATABASE, _GROUPS_USERS_TABLE)
+                )
+                if cursor.fetchone()[0] == 0:
+                    cursor.execute(f"ALTER TABLE {_GROUPS_USERS_TABLE} ADD COLUMN member_count INT UNSIGNED NOT NULL DEFAULT 0, ADD INDEX idx_member_count (member_count)")
                 conn.commit()
                 cursor.close()
+                threading.Thread(target=self._migrate_group_users_blob, daemon=True, name="GroupMembersMigrate").start()
             except Exception as e:
                 logger.error(f"初始化数据库表失败: {type(e).__name__}: {e}")
             finally:
@@ -143,10 +166,63 @@ class Database:
         if init_thread.is_alive():
             logger.warning("数据库表初始化超时，将在后台继续")
 
+    def _migrate_group_users_blob(self):
+        """将旧版 groups_users.users JSON 迁移到 group_members 表，迁移完成的群 users 置为 NULL"""
+        conn = None
+        migrated = 0
+        try:
+            conn = pymysql.connect(
+                host=_DB_HOST, port=_DB_PORT, user=_DB_USER, password=_DB_PASSWORD,
+                database=_DB_DATABASE, charset='utf8mb4', connect_timeout=10,
+                read_timeout=60, write_timeout=60, autocommit=False
+            )
+            cursor = conn.cursor()
+            today = date.today().isoformat()
+            while True:
+                cursor.execute(f"SELECT group_id, users FROM {_GROUPS_USERS_TABLE} WHERE users IS NOT NULL LIMIT {_MIGRATE_BATCH_SIZE}")
+                rows = cursor.fetchall()
+                if not rows:
+                    break
+                for group_id, users_json in rows:
+                    try:
+                        users = json.loads(users_json) if users_json else []
+                    except (json.JSONDecodeError, TypeError):
+                        users = []
+                    values = []
+                    for u in users if isinstance(users, list) else []:
+                        if isinstance(u, dict) and u.get('userid'):
+                            last_active = u.get('last_active') or today
+                            values.append((group_id, str(u['userid']), last_active, last_active))
+                    if values:
+                        cursor.executemany(f"INSERT IGNORE INTO {_GROUP_MEMBERS_TABLE} (group_id, user_id, first_seen, last_active) VALUES (%s, %s, %s, %s)", values)
+                    cursor.execute(
+                        f"UPDATE {_GROUPS_USERS_TABLE} SET users = NULL, member_count = (SELECT COUNT(*) FROM {_GROUP_MEMBERS_TABLE} WHERE group_id = %s) WHERE group_id = %s",
+                        (group_id, group_id)
+                    )
+                conn.commit()
+                migrated += len(rows)
+            cursor.close()
+            if migrated:
+                logger.info(f"群成员数据迁移完成，共 {migrated} 个群")
+        except Exception as e:
+            logger.error(f"群成员数据迁移失败: {type(e).__name__}: {e}")
+        finally:
+            if conn:
+                try:
+                    conn.close()
+                except:
+                    pass
+
     def _async_execute(self, func, *args, **kwargs):
         if self._thread_pool:
             self._thread_pool.submit(func, *args, **kwargs)
 
+    def shutdown(self):
+        """等待已提交的异步写入完成并回收工作线程，避免解释器退出阶段由垃圾回收关闭线程池"""
+        pool, self._thread_pool = self._thread_pool, None
+        if pool:
+            pool.shutdown(wait=True)
+
     def _execute_query(self, sql, params=None):
         try:
             with self._get_cursor() as (cursor, connection):
@@ -191,7 +267,7 @@ class Database:
     def add_user_to_group(self, group_id, user_id):
         self._async_execute(self._add_user_to_group, group_id, user_id)
 
-    _last_active_cache: dict[tuple[str, str], str] = {}
+    _last_active_cache = get_cache('last_active')
 
     def _add_user_to_group(self, group_id, user_id):
         user_id_str = str(user_id)
@@ -202,48 +278,23 @@ class Database:
         if self._last_active_cache.get(cache_key) == today:
             return
 
-        result = self._execute_query(_SQL_SELECT_GROUP_USERS, (group_id,))
-
         try:
-            users = []
-            if result and result.get('users'):
-                try:
-                    users = json.loads(result['users'])
-                    if not isinstance(users, list):
-                        users = []
-                except (json.JSONDecodeError, TypeError):
-                    users = []
-
-            changed = False
-            found = False
-            for u in users:
-                if isinstance(u, dict) and u.get("userid") == user_id_str:
-                    found = True
-                    if u.get("last_active") != today:
-                        u["last_active"] = today
-                        changed = True
-                    break
-
-            if not found:
-                users.append({"value": 1, "userid": user_id_str, "last_active": today})
-                changed = True
-
-            if changed:
-                users_json = json.dumps(users, ensure_ascii=False)
-                self._execute_update(_SQL_UPSERT_GROUP_USERS, (group_id, users_json, users_json))
-
-            self._last_active_cache[cache_key] = today
+            with self._get_cursor() as (cursor, connection):
+                if not cursor:
+                    return
+                # 新成员 rowcount=1，已有成员更新活跃日期 rowcount=2/0
+                if cursor.execute(_SQL_UPSERT_GROUP_MEMBER, (group_id_str, user_id_str, today, today)) == 1:
+                    cursor.execute(_SQL_INCR_GROUP_MEMBER_COUNT, (group_id_str,))
+                else:
+                    cursor.execute(_SQL_ENSURE_GROUP, (group_id_str,))
+                connection.commit()
+            self._last_active_cache.set(cache_key, today)
         except Exception as e:
             logger.error(f"添加用户到群组失败: {e}, group_id: {group_id}, user_id: {user_id}")
 
     def get_group_member_count(self, group_id):
-        result = self._execute_query(_SQL_SELECT_GROUP_USERS, (group_id,))
-        if result and result.get('users'):
-            try:
-                return len(json.loads(result['users']))
-            except:
-                pass
-        return 0
+        result = self._execute_query(_SQL_SELECT_GROUP_MEMBER_COUNT, (str(group_id),))
+        return result.get('member_count', 0) if result else 0
             
     def add_member(self, user_id):
         self._async_execute(self._add_member, user_id)
@@ -273,9 +324,61 @@ class Database:
         result = self._execute_query(_SQL_SELECT_USER_NAME, (user_id,))
         return result.get('name') if result else None
 
+    def fetch_user_name_from_api(self, user_id):
+        """通过 NICKNAME_BACKFILL_CONFIG['api_url'] 查询用户昵称，未配置接口或查询失败返回 None"""
+        api_url = _NICKNAME_API_CONFIG.get('api_url')
+        if not api_url or not user_id:
+            return None
+        from config import appid
+        from function.httpx_pool import sync_get
+        try:
+            response = sync_get(api_url.format(user_id=user_id, appid=appid), timeout=_NICKNAME_API_CONFIG.get('timeout', 5))
+            if response.status_code != 200:
+                return None
+            value = response.json()
+            for key in _NICKNAME_API_CONFIG.get('name_field', 'nickname').split('.'):
+                value = value.get(key) if isinstance(value, dict) else None
+            name = value.strip() if isinstance(value, str) else ''
+            return name[:255] or None
+        except Exception as e:
+            logger.debug(f"查询用户昵称失败 {user_id}: {e}")
+            return None
+
+    def get_unnamed_user_ids(self, after='', limit=200):
+        """按 user_id 顺序分批读取无昵称用户（键集分页，after 为上一批最后一个 user_id）"""
+        try:
+            with self._get_cursor() as (cursor, connection):
+                if not cursor:
+                    return None
+                cursor.execute(_SQL_SELECT_UNNAMED_USERS, (after, int(limit)))
+                return [row['user_id'] if isinstance(row, dict) else row[0] for row in cursor.fetchall()]
+        except Exception as e:
+            logger.error(f"读取无昵称用户失败: {e}")
+            return None
+
+    def count_unnamed_users(self, after=''):
+        result = self._execute_query(_SQL_COUNT_UNNAMED_USERS, (after,))
+        return result.get('count', 0) if result else 0
+
+    def update_user_names_batch(self, names):
+        """一条 UPDATE ... CASE 写入一批 {user_id: name}"""
+        if not names:
+            return True
+        items = list(names.items())
+        sql = (f"UPDATE {_USERS_TABLE} SET name = CASE user_id {' '.join(['WHEN %s THEN %s'] * len(items))} END "
+               f"WHERE user_id IN ({','.join(['%s'] * len(items))})")
+        params = [v for item in items for v in item] + [uid for uid, _ in items]
+        if not self._execute_update(sql, params):
+            return False
+        nickname_cache = get_cache('nickname')
+        for user_id, name in items:
+            nickname_cache.set(user_id, name)
+        return True
+
 def get_table_name(base_name):
     return Database._table_cache.get(base_name, f"{_TABLE_PREFIX}{base_name}")
 
 USERS_TABLE = _USERS_TABLE
 GROUPS_USERS_TABLE = _GROUPS_USERS_TABLE
 MEMBERS_TABLE = _MEMBERS_TABLE
+GROUP_MEMBERS_TABLE = _GROUP_MEMBERS_TABLE
@@ -5,7 +5,8 @@ import json, time, datetime, logging, threading, schedule, re
 from typing import Dict, List, Any, Optional, Tuple
 from concurrent.futures import ThreadPoolExecutor
 from collections import defaultdict
-from function.log_db import LogDatabasePool
+from function.log_db import LogDatabasePool, get_log_table_name, get_day_log_source, day_log_exists
+from function.dau_rollup import get_dau_rollup
 from config import LOG_DB_CONFIG
 
 try:
@@ -103,10 +104,12 @@ class DAUAnalytics:
         schedule.every().day.at("01:00").do(self._daily_id_cleanup_task)
         self.scheduler_thread = threading.Thread(target=self._run_scheduler, daemon=True)
         self.scheduler_thread.start()
+        threading.Thread(target=get_dau_rollup().load, daemon=True, name="DAURollupLoad").start()
 
     def stop_scheduler(self):
         self.is_running = False
         schedule.clear()
+        get_dau_rollup().flush()
         if hasattr(self, '_thread_pool'):
             self._thread_pool.shutdown(wait=True)
         self._query_cache.clear()
@@ -124,6 +127,10 @@ class DAUAnalytics:
                     schedule.every().day.at("01:00").do(self._daily_id_cleanup_task)
             except Exception as e:
                 logger.error(f"DAU定时任务执行异常: {e}")
+            try:
+                get_dau_rollup().flush()
+            except Exception as e:
+                logger.error(f"DAU汇总写入失败: {e}")
             time.sleep(60)
 
     def _daily_dau_task(self):
@@ -155,6 +162,16 @@ class DAUAnalytics:
         date_str = self._format_date(target_date, 'table')
         display_date = self._format_date(target_date)
         logger.info(f"开始收集DAU数据: {display_date} (表: {date_str})")
+        rollup = get_dau_rollup()
+        if rollup.has_complete_day(target_date):
+            # 增量汇总完整时直接读取，无需扫描消息表
+            message_stats = rollup.get_message_stats(target_date)
+            return {
+                'date': display_date, 'date_str': date_str,
+                'generated_at': self._format_date(datetime.datetime.now(), 'iso'),
+                'message_stats': message_stats, 'user_stats': self._get_user_stats(),
+                'command_stats': rollup.get_command_stats(target_date) or [], 'version': '2.0'
+            }
         with ThreadPoolExecutor(max_workers=3, thread_name_prefix="DAUCollect") as executor:
             future_message = executor.submit(self._get_message_stats, date_str)
             future_user = executor.submit(self._get_user_stats)
@@ -167,7 +184,7 @@ class DAUAnalytics:
                 logger.error(f"收集DAU数据超时或失败: {e}")
                 return None
         if not message_stats:
-            logger.warning(f"消息统计为空，可能表 {self.log_table_prefix}{date_str}_message 不存在")
+            logger.warning(f"消息统计为空，可能表 {get_log_table_name('message', date_str)} 不存在或当天无数据")
             return None
         logger.info(f"DAU数据收集完成: {display_date}, 消息数: {message_stats.get('total_messages', 0)}, 活跃用户: {message_stats.get('active_users', 0)}")
         return {
@@ -183,10 +200,10 @@ class DAUAnalytics:
         if cached_result:
             return cached_result
         
-        table_name = f"{self.log_table_prefix}{date_str}_message"
+        table_name = get_day_log_source('message', date_str)
         
         def execute_queries(cursor):
-            if not self._table_exists(cursor, table_name):
+            if not day_log_exists(cursor, 'message', date_str):
                 return None
             results = {}
             cursor.execute(f"SELECT COUNT(*) as total_messages, COUNT(DISTINCT CASE WHEN user_id IS NOT NULL AND user_id != '' THEN user_id END) as active_users, COUNT(DISTINCT CASE WHEN group_id != 'c2c' AND group_id IS NOT NULL AND group_id != '' THEN group_id END) as active_groups, COUNT(CASE WHEN group_id = 'c2c' THEN 1 END) as private_messages FROM {table_name}")
@@ -216,7 +233,7 @@ class DAUAnalytics:
             groups = cursor.fetchone()
             cursor.execute(f"SELECT COUNT(*) as count FROM {self._members_table}")
             members = cursor.fetchone()
-            cursor.execute(f"SELECT group_id, GREATEST(1, ROUND((CHAR_LENGTH(users) - 2) / 25)) as member_count FROM {self._groups_users_table} WHERE users IS NOT NULL AND users != '[]' ORDER BY member_count DESC LIMIT 3")
+            cursor.execute(f"SELECT group_id, member_count FROM {self._groups_users_table} WHERE member_count > 0 ORDER BY member_count DESC LIMIT 3")
             top_groups = cursor.fetchall()
             return {
                 'total_users': users['count'] if users else 0,
@@ -234,10 +251,10 @@ class DAUAnalytics:
         if cached_result:
             return cached_result
         
-        table_name = f"{self.log_table_prefix}{date_str}_message"
+        table_name = get_day_log_source('message', date_str)
         
         def get_stats(cursor):
-            if not self._table_exists(cursor, table_name):
+            if not day_log_exists(cursor, 'message', date_str):
                 return []
             compiled_commands = self._get_compiled_commands()
             if not compiled_commands:
@@ -337,6 +354,26 @@ class DAUAnalytics:
             return self._build_dau_result(result, date_str) if result else None
         return self._with_log_db_cursor(get_data)
 
+    def load_dau_range(self, start_date: datetime.datetime, end_date: datetime.datetime) -> Dict[str, Dict[str, Any]]:
+        """一次主键范围查询读取 [start_date, end_date] 内所有已保存的DAU记录，返回 {YYYY-MM-DD: 数据}"""
+        start_str, end_str = self._format_date(start_date), self._format_date(end_date)
+        def get_data(cursor):
+            if not self._table_exists(cursor, self._dau_table):
+                return {}
+            cursor.execute(f"SELECT * FROM {self._dau_table} WHERE date >= %s AND date <= %s ORDER BY date", (start_str, end_str))
+            return {(r := self._build_dau_result(row))['date']: r for row in cursor.fetchall()}
+        return self._with_log_db_cursor(get_data) or {}
+
+    def get_dau_dates(self, start_date: datetime.datetime, end_date: datetime.datetime) -> List[str]:
+        """范围内已有DAU记录的日期（YYYY-MM-DD，升序），只读主键列"""
+        start_str, end_str = self._format_date(start_date), self._format_date(end_date)
+        def get_data(cursor):
+            if not self._table_exists(cursor, self._dau_table):
+                return []
+            cursor.execute(f"SELECT date FROM {self._dau_table} WHERE date >= %s AND date <= %s ORDER BY date", (start_str, end_str))
+            return [row['date'].strftime('%Y-%m-%d') if hasattr(row['date'], 'strftime') else str(row['date']) for row in cursor.fetchall()]
+        return self._with_log_db_cursor(get_data) or []
+
     def get_recent_dau_data(self, days: int = 7) -> List[Dict[str, Any]]:
         def get_data(cursor):
             if not self._table_exists(cursor, self._dau_table):
@@ -375,11 +412,12 @@ class DAUAnalytics:
             start_date, end_date = end_date, start_date
         total_days = generated_days = skipped_days = failed_days = 0
         generated_dates, skipped_dates, failed_dates = [], [], []
+        saved_dates = set(self.get_dau_dates(start_date, end_date))
         current_date = start_date
         while current_date <= end_date:
             total_days += 1
             date_str = self._format_date(current_date)
-            if self.load_dau_data(current_date):
+            if date_str in saved_dates:
                 skipped_days += 1
                 skipped_dates.append(date_str)
             else:
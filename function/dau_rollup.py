@@ -0,0 +1,498 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import heapq, logging, datetime, threading
+from functools import lru_cache
+
+logger = logging.getLogger('ElainaBot.function.dau_rollup')
+
+_MINUTES_PER_DAY = 1440
+_KEEP_DAYS = 2          # 内存中保留的天数（今天、昨天）
+_TABLE_KEEP_DAYS = 7    # 汇总明细表保留天数
+_HOURLY_KEEP_DAYS = 31  # 小时汇总表保留天数
+_TOP_LIMIT = 10
+_DATE_FORMAT = '%Y-%m-%d'
+_MEMBER_ID_LENGTH = 128
+_COMMAND_LENGTH = 191
+_EMPTY_GROUP_IDS = frozenset(('', 'c2c'))
+
+class _DayRollup:
+    """单日消息汇总：精确去重集合 + 分钟计数 + 群/用户/指令计数，另记录自上次写入以来的增量"""
+    __slots__ = ('users', 'groups', 'minute_messages', 'minute_private', 'minute_new_users', 'minute_new_groups',
+                 'group_counts', 'user_counts', 'command_counts', 'total', 'private', 'complete',
+                 'pending_minutes', 'pending_members', 'pending_commands')
+
+    def __init__(self, complete=True):
+        self.users = {}    # user_id -> 首次出现分钟
+        self.groups = {}   # group_id -> 首次出现分钟
+        self.minute_messages = [0] * _MINUTES_PER_DAY
+        self.minute_private = [0] * _MINUTES_PER_DAY
+        self.minute_new_users = [0] * _MINUTES_PER_DAY
+        self.minute_new_groups = [0] * _MINUTES_PER_DAY
+        self.group_counts = {}
+        self.user_counts = {}
+        self.command_counts = {}
+        self.total = self.private = 0
+        self.complete = complete
+        self.pending_minutes = {}   # minute -> [消息数, 私聊数]
+        self.pending_members = {}   # ('u'/'g', id) -> [最早出现分钟, 消息数]
+        self.pending_commands = {}  # pattern -> 次数
+
+    def add_message(self, minute, user_id, group_id):
+        self.total += 1
+        self.minute_messages[minute] += 1
+        pending = self.pending_minutes.get(minute)
+        if pending is None:
+            pending = self.pending_minutes[minute] = [0, 0]
+        pending[0] += 1
+        if user_id:
+            self.user_counts[user_id] = self.user_counts.get(user_id, 0) + 1
+            if user_id not in self.users:
+                self.users[user_id] = minute
+                self.minute_new_users[minute] += 1
+            self._add_pending_member('u', user_id, minute, 1)
+        if group_id == 'c2c':
+            self.private += 1
+            self.minute_private[minute] += 1
+            pending[1] += 1
+        elif group_id:
+            self.group_counts[group_id] = self.group_counts.get(group_id, 0) + 1
+            if group_id not in self.groups:
+                self.groups[group_id] = minute
+                self.minute_new_groups[minute] += 1
+            self._add_pending_member('g', group_id, minute, 1)
+
+    def _add_pending_member(self, kind, member_id, minute, count):
+        pending = self.pending_members.get((kind, member_id))
+        if pending is None:
+            self.pending_members[(kind, member_id)] = [minute, count]
+        else:
+            if minute < pending[0]:
+                pending[0] = minute
+            pending[1] += count
+
+    def add_command(self, pattern):
+        self.command_counts[pattern] = self.command_counts.get(pattern, 0) + 1
+        self.pending_commands[pattern] = self.pending_commands.get(pattern, 0) + 1
+
+    def has_pending(self):
+        return bool(self.pending_minutes or self.pending_commands)
+
+    def take_pending(self):
+        """取出并清空待写入的增量"""
+        pending = (self.pending_minutes, self.pending_members, self.pending_commands)
+        self.pending_minutes, self.pending_members, self.pending_commands = {}, {}, {}
+        return pending
+
+    def restore_pending(self, pending):
+        """写入失败时把取出的增量放回，与期间新产生的增量合并"""
+        minutes, members, commands = pending
+        for minute, (messages, private) in minutes.items():
+            current = self.pending_minutes.setdefault(minute, [0, 0])
+            current[0] += messages
+            current[1] += private
+        for (kind, member_id), (minute, count) in members.items():
+            self._add_pending_member(kind, member_id, minute, count)
+        for pattern, count in commands.items():
+            self.pending_commands[pattern] = self.pending_commands.get(pattern, 0) + count
+
+    def merge(self, other):
+        """合并持久化的状态（重启前）与内存中的新增数据，内存中尚未写入的增量保持不变"""
+        for attr in ('users', 'groups'):
+            mine, theirs = getattr(self, attr), getattr(other, attr)
+            for key, minute in theirs.items():
+                if key not in mine or minute < mine[key]:
+                    mine[key] = minute
+        for attr in ('group_counts', 'user_counts', 'command_counts'):
+            mine = getattr(self, attr)
+            for key, count in getattr(other, attr).items():
+                mine[key] = mine.get(key, 0) + count
+        for i in range(_MINUTES_PER_DAY):
+            self.minute_messages[i] += other.minute_messages[i]
+            self.minute_private[i] += other.minute_private[i]
+        self.total += other.total
+        self.private += other.private
+        self.complete = self.complete or other.complete
+        self._rebuild_new_counts()
+
+    def _rebuild_new_counts(self):
+        self.minute_new_users = [0] * _MINUTES_PER_DAY
+        self.minute_new_groups = [0] * _MINUTES_PER_DAY
+        for minute in self.users.values():
+            self.minute_new_users[minute] += 1
+        for minute in self.groups.values():
+            self.minute_new_groups[minute] += 1
+
+    @classmethod
+    def from_rows(cls, complete, minute_rows, member_rows, command_rows):
+        """由汇总明细表中的分钟、群/用户、指令行还原单日汇总"""
+        day = cls(complete=complete)
+        for row in minute_rows:
+            day.minute_messages[row['minute']] = row['messages']
+            day.minute_private[row['minute']] = row['private_messages']
+        for row in member_rows:
+            firsts, counts = (day.users, day.user_counts) if row['kind'] == 'u' else (day.groups, day.group_counts)
+            firsts[row['member_id']] = row['first_minute']
+            counts[row['member_id']] = row['messages']
+        day.command_counts = {row['pattern']: row['calls'] for row in command_rows}
+        day.total, day.private = sum(day.minute_messages), sum(day.minute_private)
+        day._rebuild_new_counts()
+        return day
+
+    def hourly(self):
+        return [sum(self.minute_messages[h * 60:(h + 1) * 60]) for h in range(24)]
+
+    def hourly_buckets(self, hours=range(24)):
+        """指定小时的 (小时, 消息数, 私聊数, 新增活跃用户数, 新增活跃群数)，新增数按首次出现时间归入小时"""
+        return [(h, *(sum(counts[h * 60:(h + 1) * 60]) for counts in
+                      (self.minute_messages, self.minute_private, self.minute_new_users, self.minute_new_groups)))
+                for h in hours]
+
+    def totals_until(self, minute):
+        """截至某分钟（含）的消息数、私聊数、活跃用户数、活跃群数"""
+        end = minute + 1
+        return {
+            'total_messages': sum(self.minute_messages[:end]), 'private_messages': sum(self.minute_private[:end]),
+            'active_users': sum(self.minute_new_users[:end]), 'active_groups': sum(self.minute_new_groups[:end])
+        }
+
+@lru_cache(maxsize=2048)
+def _simplify_command(pattern):
+    from function.dau_analytics import get_dau_analytics
+    return get_dau_analytics()._simplify_regex_pattern(pattern) or pattern
+
+class DAURollup:
+    """DAU 增量汇总：消息入库时同步累加，查询当天数据无需扫描消息表"""
+    _instance = None
+    _init_lock = threading.Lock()
+
+    @classmethod
+    def get_instance(cls):
+        if cls._instance is None:
+            with cls._init_lock:
+                if cls._instance is None:
+                    cls._instance = cls()
+        return cls._instance
+
+    def __init__(self):
+        self._days = {}
+        self._lock = threading.Lock()
+        self._persist_lock = threading.Lock()
+        self._loaded = False
+        self._purged_date = None
+        self._days_table = self._minutes_table = self._members_table = self._commands_table = None
+        self._hourly_table = None
+        self._table_ready = False
+
+    def _get_day(self, date_key):
+        day = self._days.get(date_key)
+        if day is None:
+            # 运行中跨天产生的新一天从零点开始累计，视为完整
+            day = self._days[date_key] = _DayRollup(complete=bool(self._days))
+        return day
+
+    def record_message(self, log_data):
+        ts = log_data.get('timestamp') or ''
+        try:
+            date_key, minute = ts[:10], int(ts[11:13]) * 60 + int(ts[14:16])
+        except (ValueError, TypeError):
+            now = datetime.datetime.now()
+            date_key, minute = now.strftime(_DATE_FORMAT), now.hour * 60 + now.minute
+        group_id = log_data.get('group_id') or ''
+        with self._lock:
+            self._get_day(date_key).add_message(minute, log_data.get('user_id') or '', group_id)
+
+    def record_command(self, pattern):
+        date_key = datetime.datetime.now().strftime(_DATE_FORMAT)
+        with self._lock:
+            self._get_day(date_key).add_command(pattern)
+
+    def _day(self, target_date):
+        key = target_date if isinstance(target_date, str) else target_date.strftime(_DATE_FORMAT)
+        return self._days.get(key)
+
+    def has_complete_day(self, target_date):
+        day = self._day(target_date)
+        return bool(day and day.complete)
+
+    def get_message_stats(self, target_date):
+        """返回与 DAUAnalytics._get_message_stats 相同结构的统计结果"""
+        with self._lock:
+            day = self._day(target_date)
+            if not day or not day.complete:
+                return None
+            hourly = day.hourly()
+            peak_hour = max(range(24), key=hourly.__getitem__)
+            top_groups = heapq.nlargest(_TOP_LIMIT, day.group_counts.items(), key=lambda x: x[1])
+            top_users = heapq.nlargest(_TOP_LIMIT, day.user_counts.items(), key=lambda x: x[1])
+            return {
+                'total_messages': day.total, 'active_users': len(day.users), 'active_groups': len(day.groups),
+                'private_messages': day.private, 'peak_hour': peak_hour, 'peak_hour_count': hourly[peak_hour],
+                'hourly': hourly,
+                'top_groups': [{'group_id': g, 'message_count': c} for g, c in top_groups],
+                'top_users': [{'user_id': u, 'message_count': c} for u, c in top_users]
+            }
+
+    def get_totals_until(self, target_date, minute):
+        """截至某分钟的累计值：内存中有完整汇总时精确到分钟，否则按小时汇总表查询（当前小时按分钟比例折算）"""
+        with self._lock:
+            day = self._day(target_date)
+            if day and day.complete:
+                return day.totals_until(minute)
+        return self._hourly_totals_until(target_date, minute)
+
+    def _hourly_totals_until(self, target_date, minute):
+        date_key = target_date if isinstance(target_date, str) else target_date.strftime(_DATE_FORMAT)
+        hour, fraction = divmod(minute, 60)
+
+        def query(cursor):
+            cursor.execute(f"""SELECT hour, messages, private_messages, new_users, new_groups FROM `{self._hourly_table}`
+                WHERE date = %s AND hour <= %s""", (date_key, hour))
+            return cursor.fetchall()
+
+        rows = self._with_cursor(query)
+        if not rows:
+            return None
+        keys = ('messages', 'private_messages', 'new_users', 'new_groups')
+        totals = dict.fromkeys(keys, 0)
+        for row in rows:
+            weight = (fraction + 1) / 60 if row['hour'] == hour else 1
+            for key in keys:
+                totals[key] += (row[key] or 0) * weight
+        return {
+            'total_messages': round(totals['messages']), 'private_messages': round(totals['private_messages']),
+            'active_users': round(totals['new_users']), 'active_groups': round(totals['new_groups'])
+        }
+
+    def get_command_stats(self, target_date, limit=5):
+        with self._lock:
+            day = self._day(target_date)
+            if not day or not day.complete:
+                return None
+            commands = list(day.command_counts.items())
+        merged = {}
+        for pattern, count in commands:
+            key = _simplify_command(pattern)
+            merged[key] = merged.get(key, 0) + count
+        return [{'command': cmd, 'count': cnt} for cmd, cnt in heapq.nlargest(limit, merged.items(), key=lambda x: x[1])]
+
+    # ==================== 持久化 ====================
+    # 汇总按键拆成明细行，每次写入只累加上次写入以来变化的分钟、群/用户和指令，而不是重写整天的状态
+    def _ensure_table(self, cursor):
+        if self._table_ready:
+            return
+        from config import LOG_DB_CONFIG
+        prefix = LOG_DB_CONFIG.get('table_prefix', 'Mlog_')
+        self._days_table = f"{prefix}dau_rollup_days"
+        self._minutes_table = f"{prefix}dau_rollup_minutes"
+        self._members_table = f"{prefix}dau_rollup_members"
+        self._commands_table = f"{prefix}dau_rollup_commands"
+        self._hourly_table = f"{prefix}dau_hourly"
+        table_options = "ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci"
+        cursor.execute(f"""CREATE TABLE IF NOT EXISTS `{self._days_table}` (
+            `date` date NOT NULL, `complete` tinyint NOT NULL DEFAULT 0,
+            `updated_at` timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+            PRIMARY KEY (`date`)) {table_options}""")
+        cursor.execute(f"""CREATE TABLE IF NOT EXISTS `{self._minutes_table}` (
+            `date` date NOT NULL, `minute` smallint NOT NULL, `messages` int NOT NULL DEFAULT 0,
+            `private_messages` int NOT NULL DEFAULT 0, PRIMARY KEY (`date`, `minute`)) {table_options}""")
+        cursor.execute(f"""CREATE TABLE IF NOT EXISTS `{self._members_table}` (
+            `date` date NOT NULL, `kind` char(1) NOT NULL, `member_id` varchar({_MEMBER_ID_LENGTH}) NOT NULL,
+            `first_minute` smallint NOT NULL, `messages` int NOT NULL DEFAULT 0,
+            PRIMARY KEY (`date`, `kind`, `member_id`)) {table_options}""")
+        cursor.execute(f"""CREATE TABLE IF NOT EXISTS `{self._commands_table}` (
+            `date` date NOT NULL, `pattern` varchar({_COMMAND_LENGTH}) NOT NULL, `calls` int NOT NULL DEFAULT 0,
+            PRIMARY KEY (`date`, `pattern`)) {table_options}""")
+        cursor.execute(f"""CREATE TABLE IF NOT EXISTS `{self._hourly_table}` (
+            `date` date NOT NULL, `hour` tinyint NOT NULL, `messages` int NOT NULL DEFAULT 0,
+            `private_messages` int NOT NULL DEFAULT 0, `new_users` int NOT NULL DEFAULT 0, `new_groups` int NOT NULL DEFAULT 0,
+            PRIMARY KEY (`date`, `hour`)) {table_options}""")
+        self._table_ready = True
+
+    def _with_cursor(self, operation):
+        from function.log_db import LogDatabasePool
+        pool = LogDatabasePool()
+        connection = pool.get_connection()
+        if not connection:
+            return None
+        cursor = None
+        try:
+            cursor = connection.cursor()
+            self._ensure_table(cursor)
+            result = operation(cursor)
+            connection.commit()
+            return result
+        except Exception as e:
+            logger.error(f"DAU汇总表操作失败: {e}")
+            # 增量写入失败时整体回滚，避免部分累加后再重试造成重复计数
+            try:
+                connection.rollback()
+            except:
+                pass
+            return None
+        finally:
+            if cursor:
+                cursor.close()
+            pool.release_connection(connection)
+
+    def load(self):
+        """启动时加载今天和昨天的汇总状态，与内存中已累计的数据合并"""
+        with self._persist_lock:
+            return self._loaded or self._load_locked()
+
+    def _load_locked(self):
+        today = datetime.date.today()
+        dates = [(today - datetime.timedelta(days=i)).strftime(_DATE_FORMAT) for i in range(_KEEP_DAYS)]
+        placeholders = ','.join(['%s'] * len(dates))
+
+        def get_rows(cursor):
+            result = {}
+            for name, sql in (
+                ('days', f"SELECT date, complete FROM `{self._days_table}` WHERE date IN ({placeholders})"),
+                ('minutes', f"SELECT date, minute, messages, private_messages FROM `{self._minutes_table}` WHERE date IN ({placeholders})"),
+                ('members', f"SELECT date, kind, member_id, first_minute, messages FROM `{self._members_table}` WHERE date IN ({placeholders})"),
+                ('commands', f"SELECT date, pattern, calls FROM `{self._commands_table}` WHERE date IN ({placeholders})"),
+            ):
+                cursor.execute(sql, dates)
+                result[name] = cursor.fetchall()
+            return result
+
+        rows = self._with_cursor(get_rows)
+        if rows is None:
+            return False
+
+        def date_key(row):
+            date_val = row['date']
+            return date_val.strftime(_DATE_FORMAT) if hasattr(date_val, 'strftime') else str(date_val)
+
+        grouped = {date_key(row): ([], [], []) for row in rows['days']}
+        for index, name in enumerate(('minutes', 'members', 'commands')):
+            for row in rows[name]:
+                if date_key(row) in grouped:
+                    grouped[date_key(row)][index].append(row)
+        loaded = {}
+        for row in rows['days']:
+            key = date_key(row)
+            try:
+                loaded[key] = _DayRollup.from_rows(bool(row['complete']), *grouped[key])
+            except Exception as e:
+                logger.error(f"DAU汇总状态解析失败: {e}")
+        today_key = dates[0]
+        with self._lock:
+            for key, persisted in loaded.items():
+                if key in self._days:
+                    self._days[key].merge(persisted)
+                else:
+                    self._days[key] = persisted
+            if today_key not in loaded:
+                # 首次启用且今天已有消息表数据时，今天的汇总不完整，查询回退到扫表
+                self._get_day(today_key).complete = not self._message_table_has_rows(today_key)
+        self._loaded = True
+        return True
+
+    def _message_table_has_rows(self, date_key):
+        from function.log_db import day_log_exists, get_day_log_source
+
+        def check(cursor):
+            if not day_log_exists(cursor, 'message', date_key):
+                return False
+            cursor.execute(f"SELECT 1 FROM {get_day_log_source('message', date_key)} LIMIT 1")
+            return bool(cursor.fetchone())
+
+        return bool(self._with_cursor(check))
+
+    def flush(self):
+        """将上次写入以来的增量累加到汇总明细表，并每天清理一次过期数据"""
+        with self._persist_lock:
+            # 加载完成前写入的增量会在加载时被重复合并，先完成加载
+            if not self._loaded and not self._load_locked():
+                return False
+            return self._flush_locked()
+
+    def _flush_locked(self):
+        with self._lock:
+            pending = {key: (day.complete, day.take_pending()) for key, day in self._days.items() if day.has_pending()}
+            # 只有完整的一天才写入小时汇总，避免不完整的计数被当作同时段对比的依据；只重写有变化的小时
+            hourly = [(key, *bucket) for key, (complete, (minutes, _, _)) in pending.items() if complete
+                      for bucket in self._days[key].hourly_buckets(sorted({m // 60 for m in minutes}))]
+        today = datetime.date.today()
+        purge = self._purged_date != today
+        if not pending and not purge:
+            return True
+        day_rows, minute_rows, member_rows, command_rows = [], [], [], []
+        for key, (complete, (minutes, members, commands)) in pending.items():
+            day_rows.append((key, int(complete)))
+            minute_rows.extend((key, minute, messages, private) for minute, (messages, private) in minutes.items())
+            member_rows.extend((key, kind, member_id[:_MEMBER_ID_LENGTH], minute, count)
+                               for (kind, member_id), (minute, count) in members.items())
+            command_rows.extend((key, pattern[:_COMMAND_LENGTH], count) for pattern, count in commands.items())
+        cutoff = (today - datetime.timedelta(days=_TABLE_KEEP_DAYS)).strftime(_DATE_FORMAT)
+        hourly_cutoff = (today - datetime.timedelta(days=_HOURLY_KEEP_DAYS)).strftime(_DATE_FORMAT)
+
+        def save(cursor):
+            if day_rows:
+                cursor.executemany(
+                    f"INSERT INTO `{self._days_table}` (date, complete) VALUES (%s, %s) ON DUPLICATE KEY UPDATE complete = VALUES(complete)",
+                    day_rows
+                )
+            if minute_rows:
+                cursor.executemany(
+                    f"""INSERT INTO `{self._minutes_table}` (date, minute, messages, private_messages) VALUES (%s, %s, %s, %s)
+                    ON DUPLICATE KEY UPDATE messages = messages + VALUES(messages), private_messages = private_messages + VALUES(private_messages)""",
+                    minute_rows
+                )
+            if member_rows:
+                cursor.executemany(
+                    f"""INSERT INTO `{self._members_table}` (date, kind, member_id, first_minute, messages) VALUES (%s, %s, %s, %s, %s)
+                    ON DUPLICATE KEY UPDATE first_minute = LEAST(first_minute, VALUES(first_minute)), messages = messages + VALUES(messages)""",
+                    member_rows
+                )
+            if command_rows:
+                cursor.executemany(
+                    f"""INSERT INTO `{self._commands_table}` (date, pattern, calls) VALUES (%s, %s, %s)
+                    ON DUPLICATE KEY UPDATE calls = calls + VALUES(calls)""",
+                    command_rows
+                )
+            if hourly:
+                cursor.executemany(
+                    f"""INSERT INTO `{self._hourly_table}` (date, hour, messages, private_messages, new_users, new_groups)
+                    VALUES (%s, %s, %s, %s, %s, %s) ON DUPLICATE KEY UPDATE messages = VALUES(messages),
+                    private_messages = VALUES(private_messages), new_users = VALUES(new_users), new_groups = VALUES(new_groups)""",
+                    hourly
+                )
+            if purge:
+                for table in (self._days_table, self._minutes_table, self._members_table, self._commands_table):
+                    cursor.execute(f"DELETE FROM `{table}` WHERE date < %s", (cutoff,))
+                cursor.execute(f"DELETE FROM `{self._hourly_table}` WHERE date < %s", (hourly_cutoff,))
+            return True
+
+        saved = bool(self._with_cursor(save))
+        with self._lock:
+            if saved:
+                if purge:
+                    self._purged_date = today
+            else:
+                for key, (_, taken) in pending.items():
+                    self._get_day(key).restore_pending(taken)
+            keep = sorted(self._days)[-_KEEP_DAYS:]
+            for key in list(self._days):
+                if key not in keep and not self._days[key].has_pending():
+                    del self._days[key]
+        return saved
+
+dau_rollup = DAURollup.get_instance()
+
+def record_message_rollup(log_data):
+    try:
+        dau_rollup.record_message(log_data)
+    except Exception as e:
+        logger.error(f"DAU汇总累加失败: {e}")
+
+def record_command_rollup(pattern):
+    try:
+        dau_rollup.record_command(pattern)
+    except Exception as e:
+        logger.error(f"DAU指令计数失败: {e}")
+
+def get_dau_rollup():
+    return dau_rollup
@@ -1,7 +1,8 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
-import pymysql, threading, time, logging, queue
+import pymysql, threading, time, logging, queue, bisect
+from collections import deque
 from pymysql.cursors import DictCursor
 from config import DB_CONFIG
 from concurrent.futures import ThreadPoolExecutor, Future
@@ -23,6 +24,8 @@ _CONNECTION_LIFETIME = DB_CONFIG['connection_lifetime']
 _RETRY_COUNT = DB_CONFIG['retry_count']
 _RETRY_INTERVAL = DB_CONFIG['retry_interval']
 _MIN_CONNECTIONS = 6
+_MAX_CONNECTIONS = DB_CONFIG.get('max_pool_size', 50)
+_HEALTH_CHECK_IDLE = DB_CONFIG.get('health_check_idle', 30)
 _IDLE_TIMEOUT = 180
 _REQUEST_TIMEOUT = 5.0
 _MAX_RETRY_DELAY = 10
@@ -36,6 +39,9 @@ _DB_PASSWORD = DB_CONFIG.get('password', '')
 _DB_DATABASE = DB_CONFIG.get('database', '')
 _DB_AUTOCOMMIT = DB_CONFIG.get('autocommit', True)
 
+# 获取连接等待时间直方图的桶上界（毫秒），最后一个桶收纳超出部分
+_WAIT_BUCKETS_MS = (1, 5, 10, 50, 100, 500, 1000, 5000)
+
 _TABLE_EXISTS_SQL = "SELECT COUNT(*) as count FROM information_schema.tables WHERE table_schema = DATABASE() AND table_name = %s"
 
 class DatabasePool:
@@ -44,8 +50,12 @@ class DatabasePool:
     _pool_lock = threading.RLock()
     _busy_lock = threading.RLock()
     _maintenance_lock = threading.Lock()
-    _pool = []
+    _pool = deque()             # 空闲连接，右端为最近归还的连接
+    _waiters = deque()          # 等待连接的请求，按到达顺序先进先出
+    _total = 0                  # 空闲 + 借出 + 创建中的连接数，受 _MAX_CONNECTIONS 限制
     _busy_connections = {}
+    _stats = {'acquired': 0, 'waited': 0, 'timeouts': 0, 'created': 0, 'closed': 0,
+              'health_checks': 0, 'health_failures': 0, 'wait_histogram': [0] * (len(_WAIT_BUCKETS_MS) + 1)}
     _initialized = False
     _db_available = False
     _connection_requests = queue.Queue()
@@ -102,6 +112,7 @@ class DatabasePool:
         if conn:
             current_time = time.time()
             self._pool.append({'connection': conn, 'created_at': current_time, 'last_used': current_time})
+            DatabasePool._total = 1
             self._db_available = True
             add_framework_log(f"主数据库连接池初始化完成")
             # 继续创建剩余连接
@@ -109,6 +120,7 @@ class DatabasePool:
                 conn = self._create_connection_quick(timeout=3)
                 if conn:
                     self._pool.append({'connection': conn, 'created_at': current_time, 'last_used': current_time})
+                    DatabasePool._total += 1
         else:
             logger.warning("主数据库连接失败，数据库功能将不可用")
             self._db_available = False
@@ -128,13 +140,18 @@ class DatabasePool:
                     delay = min(delay * 1.5, _MAX_RETRY_DELAY)
         return None
 
-    def _check_connection_health(self, connection, created_at=None):
-        if not connection:
+    def _check_connection_health(self, conn_info, current_time):
+        """连接超过生命周期视为不可用；空闲超过 _HEALTH_CHECK_IDLE 秒才 ping，刚归还的连接直接复用"""
+        if current_time - conn_info['created_at'] > _CONNECTION_LIFETIME:
             return False
+        if current_time - conn_info['last_used'] < _HEALTH_CHECK_IDLE:
+            return True
+        self._stats['health_checks'] += 1
         try:
-            connection.ping(reconnect=True)
-            return created_at is None or time.time() - created_at <= _CONNECTION_LIFETIME
+            conn_info['connection'].ping(reconnect=True)
+            return True
         except:
+            self._stats['health_failures'] += 1
             return False
 
     def _close_connection_safely(self, connection):
@@ -198,43 +215,77 @@ class DatabasePool:
         busy_conn = self._busy_connections.get(connection_id)
         if busy_conn:
             return busy_conn['connection']
-        max_attempts = int(max_wait_time * 10)
-        for _ in range(max_attempts):
-            conn = self._get_pooled_connection(connection_id) or self._create_and_register_connection(connection_id)
-            if conn:
-                return conn
-            time.sleep(0.1)
-        raise TimeoutError(f"获取数据库连接超时({max_wait_time}秒)")
-    
-    def _get_pooled_connection(self, connection_id):
-        current_time = time.time()
-        with self._pool_lock:
-            while self._pool:
-                try:
-                    conn_info = self._pool.pop(0)
-                    connection = conn_info['connection']
-                    if self._check_connection_health(connection, conn_info.get('created_at')):
-                        with self._busy_lock:
-                            self._busy_connections[connection_id] = {
-                                'connection': connection, 'acquired_at': current_time,
-                                'created_at': conn_info.get('created_at', current_time)
-                            }
-                        return connection
-                    self._close_connection_safely(connection)
-                except IndexError:
-                    break
-        return None
-    
-    def _create_and_register_connection(self, connection_id):
+        start = time.time()
+        conn_info = self._acquire_slot(max_wait_time)
+        while conn_info is not None:
+            # 拿到空闲连接：按需做健康检查，不可用则关闭并沿用该名额重新获取
+            current_time = time.time()
+            if self._check_connection_health(conn_info, current_time):
+                return self._register_busy(connection_id, conn_info, start, current_time)
+            self._close_connection_safely(conn_info['connection'])
+            self._stats['closed'] += 1
+            with self._pool_lock:
+                if self._pool:
+                    # 改用下一个空闲连接，被关闭连接的名额归还
+                    DatabasePool._total -= 1
+                    conn_info = self._pool.pop()
+                else:
+                    conn_info = None
+        # 持有新建名额：创建连接
         connection = self._create_connection()
         if not connection:
-            return None
+            self._free_slot()
+            raise TimeoutError("创建数据库连接失败")
+        self._stats['created'] += 1
         current_time = time.time()
+        return self._register_busy(connection_id, {'connection': connection, 'created_at': current_time}, start, current_time)
+
+    def _acquire_slot(self, max_wait_time):
+        """返回空闲连接信息；返回 None 表示获得新建连接的名额。池满时按先来后到排队等待归还"""
+        with self._pool_lock:
+            if not self._waiters:
+                if self._pool:
+                    return self._pool.pop()
+                if DatabasePool._total < _MAX_CONNECTIONS:
+                    DatabasePool._total += 1
+                    return None
+            # 每个等待者持有共享池锁的独立条件变量，归还时直接交接给队首，后来者无法插队
+            waiter = {'cond': threading.Condition(self._pool_lock), 'conn_info': None, 'granted': False}
+            self._waiters.append(waiter)
+            self._stats['waited'] += 1
+            deadline = time.time() + max_wait_time
+            while not waiter['granted']:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    self._waiters.remove(waiter)
+                    self._stats['timeouts'] += 1
+                    raise TimeoutError(f"获取数据库连接超时({max_wait_time}秒)")
+                waiter['cond'].wait(remaining)
+            return waiter['conn_info']
+
+    def _hand_over(self, conn_info):
+        """把空闲连接（None 表示新建名额）交给队首等待者，没有等待者时返回 False；调用方需持有池锁"""
+        if not self._waiters:
+            return False
+        waiter = self._waiters.popleft()
+        waiter['conn_info'], waiter['granted'] = conn_info, True
+        waiter['cond'].notify()
+        return True
+
+    def _free_slot(self):
+        """连接关闭后释放名额，有等待者时把新建名额转交给队首"""
+        with self._pool_lock:
+            if not self._hand_over(None):
+                DatabasePool._total -= 1
+
+    def _register_busy(self, connection_id, conn_info, start, current_time):
+        conn_info['acquired_at'] = current_time
+        wait_ms = (current_time - start) * 1000
         with self._busy_lock:
-            self._busy_connections[connection_id] = {
-                'connection': connection, 'acquired_at': current_time, 'created_at': current_time
-            }
-        return connection
+            self._busy_connections[connection_id] = conn_info
+            self._stats['acquired'] += 1
+            self._stats['wait_histogram'][bisect.bisect_left(_WAIT_BUCKETS_MS, wait_ms)] += 1
+        return conn_info['connection']
     
     def release_connection(self, connection=None):
         connection_id = threading.get_ident()
@@ -254,17 +305,32 @@ class DatabasePool:
                 return
             connection = conn_info['connection']
             current_time = time.time()
-            age = current_time - conn_info.get('created_at', current_time)
-            usage = current_time - conn_info.get('acquired_at', current_time)
-            if (self._check_connection_health(connection, conn_info.get('created_at')) and 
-                age <= _CONNECTION_LIFETIME and usage <= 120):
+            age = current_time - conn_info['created_at']
+            usage = current_time - conn_info['acquired_at']
+            # 归还时不再 ping，空闲较久的连接在下次借出时才做健康检查
+            if getattr(connection, 'open', True) and age <= _CONNECTION_LIFETIME and usage <= 120:
                 conn_info['last_used'] = current_time
                 with self._pool_lock:
-                    self._pool.append(conn_info)
+                    if not self._hand_over(conn_info):
+                        self._pool.append(conn_info)
             else:
                 self._close_connection_safely(connection)
+                self._stats['closed'] += 1
+                self._free_slot()
         except:
             pass
+
+    def get_stats(self):
+        """连接池状态与获取连接的等待时间直方图"""
+        with self._pool_lock:
+            stats = dict(self._stats, idle=len(self._pool), waiting=len(self._waiters), total=DatabasePool._total)
+        with self._busy_lock:
+            stats['busy'] = len(self._busy_connections)
+            histogram = list(self._stats['wait_histogram'])
+        stats['max'] = _MAX_CONNECTIONS
+        labels = [f"<={b}ms" for b in _WAIT_BUCKETS_MS] + [f">{_WAIT_BUCKETS_MS[-1]}ms"]
+        stats['wait_histogram'] = dict(zip(labels, histogram))
+        return stats
     
     def execute_async(self, sql, params=None):
         return self._thread_pool.submit(self._execute_query, sql, params)
@@ -302,37 +368,42 @@ class DatabasePool:
                 pass
                 
     def _cleanup_expired_connections(self, current_time):
+        expired = []
         with self._pool_lock:
-            if not self._pool:
-                return
             kept = []
-            pool_size = len(self._pool)
-            cleaned = 0
             for conn_info in self._pool:
                 idle = current_time - conn_info['last_used']
                 age = current_time - conn_info['created_at']
-                if age > _CONNECTION_LIFETIME or (idle > _IDLE_TIMEOUT and pool_size - cleaned > _MIN_CONNECTIONS):
-                    try:
-                        conn_info['connection'].close()
-                    except:
-                        pass
-                    cleaned += 1
+                if age > _CONNECTION_LIFETIME or (idle > _IDLE_TIMEOUT and DatabasePool._total - len(expired) > _MIN_CONNECTIONS):
+                    expired.append(conn_info)
                 else:
                     kept.append(conn_info)
-            self._pool[:] = kept
+            self._pool.clear()
+            self._pool.extend(kept)
+        for conn_info in expired:
+            self._close_connection_safely(conn_info['connection'])
+            self._stats['closed'] += 1
+            self._free_slot()
     
     def _ensure_min_connections(self):
         with self._pool_lock:
-            needed = _MIN_CONNECTIONS - len(self._pool)
+            needed = _MIN_CONNECTIONS - DatabasePool._total
             if needed <= 0:
                 return
-            for _ in range(needed):
-                conn = self._create_connection()
-                if conn:
-                    current_time = time.time()
-                    self._pool.append({'connection': conn, 'created_at': current_time, 'last_used': current_time})
-                else:
-                    break
+            DatabasePool._total += needed
+        # 先占名额再在锁外建立连接，避免阻塞正在获取连接的请求
+        for i in range(needed):
+            conn = self._create_connection()
+            if not conn:
+                for _ in range(needed - i):
+                    self._free_slot()
+                break
+            self._stats['created'] += 1
+            current_time = time.time()
+            conn_info = {'connection': conn, 'created_at': current_time, 'last_used': current_time}
+            with self._pool_lock:
+                if not self._hand_over(conn_info):
+                    self._pool.append(conn_info)
     
     def _check_long_running_connections(self, current_time):
         with self._busy_lock:
@@ -354,12 +425,10 @@ class ConnectionManager:
         delay = _RETRY_INTERVAL
         for i in range(_RETRY_COUNT):
             try:
+                # 连接可用性由连接池在取出时按空闲时长检查，这里不再逐次 ping
                 self.connection = self.pool.get_connection()
                 if self.connection:
-                    self.connection.ping(reconnect=True)
                     self.cursor = self.connection.cursor(DictCursor)
-                    self.cursor.execute("SELECT 1")
-                    self.cursor.fetchone()
                     return self
             except:
                 if self.connection:
@@ -434,6 +503,9 @@ class ConnectionManager:
 
 db_pool = DatabasePool()
 
+def get_pool_stats():
+    return db_pool.get_stats()
+
 def execute_query(sql, params=None, fetchall=False):
     try:
         with ConnectionManager() as m:
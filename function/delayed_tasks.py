@@ -0,0 +1,190 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os, json, time, heapq, uuid, logging, threading, atexit
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger('ElainaBot.function.delayed_tasks')
+
+_DATA_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'delayed_tasks.json')
+_WORKERS = 4
+_SAVE_INTERVAL = 10         # 待执行任务有变化时的落盘间隔（秒）
+_STALE_SECONDS = 3600       # 重启后超过该时长仍未执行的任务直接丢弃
+_SHUTDOWN_TIMEOUT = 5
+
+KIND_RECALL = 'recall'
+
+class DelayedTaskScheduler:
+    """延时 API 调用调度器：单线程最小堆计时 + 小型线程池执行
+
+    任务只保存纯数据（method / endpoint / payload / group_id），不引用事件对象，
+    因此可以在面板中查看、取消，并在正常关闭时落盘、重启后继续执行。
+    """
+    __slots__ = ('_heap', '_tasks', '_cond', '_save_lock', '_executor', '_thread', '_stats',
+                 '_dirty', '_last_save', '_stopped')
+    _instance = None
+    _init_lock = threading.Lock()
+
+    @classmethod
+    def get_instance(cls):
+        if cls._instance is None:
+            with cls._init_lock:
+                if cls._instance is None:
+                    cls._instance = cls()
+        return cls._instance
+
+    def __init__(self):
+        self._heap = []          # (due, task_id)，取消的任务惰性删除
+        self._tasks = {}         # task_id -> task
+        self._cond = threading.Condition()
+        self._save_lock = threading.Lock()     # 串行化落盘，避免定期保存与关闭时的保存同时写同一临时文件
+        self._executor = ThreadPoolExecutor(max_workers=_WORKERS, thread_name_prefix="DelayedTask")
+        self._stats = {'scheduled': 0, 'executed': 0, 'failed': 0, 'cancelled': 0, 'restored': 0}
+        self._dirty = False
+        self._last_save = time.time()
+        self._stopped = False
+        self._load()
+        self._thread = threading.Thread(target=self._run, daemon=True, name="DelayedTaskScheduler")
+        self._thread.start()
+        atexit.register(self.shutdown)
+
+    def schedule(self, delay, kind, method, endpoint, payload=None, group_id=None, target=None):
+        """delay 秒后调用 BOTAPI(endpoint, method, payload, group_id)，返回任务ID"""
+        task = {
+            'id': uuid.uuid4().hex[:12], 'kind': kind, 'due': time.time() + max(0.0, float(delay)),
+            'method': method, 'endpoint': endpoint, 'payload': payload, 'group_id': group_id,
+            'target': target or '', 'created': time.time(),
+        }
+        with self._cond:
+            self._tasks[task['id']] = task
+            heapq.heappush(self._heap, (task['due'], task['id']))
+            self._stats['scheduled'] += 1
+            self._dirty = True
+            # 新任务成为最早到期的任务时唤醒调度线程重新计算等待时间
+            if self._heap[0][1] == task['id']:
+                self._cond.notify()
+        return task['id']
+
+    def cancel(self, task_id):
+        with self._cond:
+            if self._tasks.pop(task_id, None) is None:
+                return False
+            self._stats['cancelled'] += 1
+            self._dirty = True
+            return True
+
+    def list_tasks(self):
+        now = time.time()
+        with self._cond:
+            tasks = sorted(self._tasks.values(), key=lambda t: t['due'])
+        return [{'id': t['id'], 'kind': t['kind'], 'target': t['target'], 'endpoint': t['endpoint'],
+                 'remaining': max(0.0, round(t['due'] - now, 1)),
+                 'due_at': time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(t['due']))} for t in tasks]
+
+    def get_stats(self):
+        with self._cond:
+            stats = dict(self._stats)
+            stats['pending'] = len(self._tasks)
+        return stats
+
+    def _run(self):
+        while True:
+            due_tasks = []
+            with self._cond:
+                if self._stopped:
+                    return
+                now = time.time()
+                while self._heap and self._heap[0][0] <= now:
+                    _, task_id = heapq.heappop(self._heap)
+                    task = self._tasks.pop(task_id, None)
+                    if task:
+                        due_tasks.append(task)
+                        self._dirty = True
+                timeout = min(self._heap[0][0] - now, _SAVE_INTERVAL) if self._heap else _SAVE_INTERVAL
+                if not due_tasks:
+                    self._cond.wait(timeout)
+            for task in due_tasks:
+                self._executor.submit(self._execute, task)
+            if self._dirty and time.time() - self._last_save >= _SAVE_INTERVAL:
+                self._save()
+
+    def _execute(self, task):
+        try:
+            from function.Access import BOTAPI
+            payload = task['payload']
+            BOTAPI(task['endpoint'], task['method'], json.dumps(payload, ensure_ascii=False) if payload is not None else None,
+                   group_id=task['group_id'])
+            key = 'executed'
+        except Exception as e:
+            logger.warning(f"延时任务执行失败 [{task['kind']}] {task['endpoint']}: {e}")
+            key = 'failed'
+        with self._cond:
+            self._stats[key] += 1
+
+    # ==================== 持久化 ====================
+    def _load(self):
+        try:
+            with open(_DATA_FILE, 'r', encoding='utf-8') as f:
+                tasks = json.load(f).get('tasks', [])
+        except FileNotFoundError:
+            return
+        except Exception as e:
+            logger.warning(f"读取延时任务文件失败: {e}")
+            return
+        now = time.time()
+        for task in tasks:
+            if now - task.get('due', 0) > _STALE_SECONDS:
+                continue
+            self._tasks[task['id']] = task
+            heapq.heappush(self._heap, (task['due'], task['id']))
+        self._stats['restored'] = len(self._tasks)
+        if self._tasks:
+            logger.info(f"已恢复 {len(self._tasks)} 个延时任务")
+
+    def _save(self):
+        # 快照在落盘锁内获取，后获得锁的保存总是写入更新的快照
+        with self._save_lock:
+            with self._cond:
+                tasks = list(self._tasks.values())
+                self._dirty = False
+                self._last_save = time.time()
+            try:
+                os.makedirs(os.path.dirname(_DATA_FILE), exist_ok=True)
+                tmp_path = _DATA_FILE + '.tmp'
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump({'saved_at': time.time(), 'tasks': tasks}, f, ensure_ascii=False)
+                os.replace(tmp_path, _DATA_FILE)
+            except Exception as e:
+                logger.warning(f"保存延时任务失败: {e}")
+
+    def shutdown(self):
+        """停止调度并把尚未执行的任务落盘，重启后继续执行"""
+        with self._cond:
+            if self._stopped:
+                return
+            self._stopped = True
+            self._cond.notify()
+        # 等调度线程退出，它不会再取出任务或定期保存，最后一次保存即为最终状态
+        if self._thread is not threading.current_thread():
+            self._thread.join(_SHUTDOWN_TIMEOUT)
+        self._save()
+        self._executor.shutdown(wait=False)
+
+def get_delayed_task_scheduler():
+    return DelayedTaskScheduler.get_instance()
+
+def schedule_recall(delay, endpoint, group_id=None, target=None):
+    return get_delayed_task_scheduler().schedule(delay, KIND_RECALL, 'DELETE', endpoint, group_id=group_id, target=target)
+
+def cancel_delayed_task(task_id):
+    return get_delayed_task_scheduler().cancel(task_id)
+
+def get_delayed_tasks():
+    return get_delayed_task_scheduler().list_tasks()
+
+def get_delayed_task_stats():
+    return get_delayed_task_scheduler().get_stats()
+
+def shutdown_delayed_tasks():
+    if DelayedTaskScheduler._instance is not None:
+        DelayedTaskScheduler._instance.shutdown()
@@ -1,17 +1,27 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
-import time, logging, threading, asyncio, httpx, atexit, json
+import time, logging, threading, asyncio, httpx, atexit, json, importlib.util
 from urllib.parse import urlparse
 
 logger = logging.getLogger("ElainaBot.function.httpx_pool")
 logger.setLevel(logging.INFO)
 logging.getLogger("httpx").setLevel(logging.WARNING)
 
-_MAX_CONNECTIONS = 200
-_MAX_KEEPALIVE = 75
-_KEEPALIVE_EXPIRY = 30.0
-_TIMEOUT = 30.0
+try:
+    from config import HTTP_POOL_CONFIG
+except ImportError:
+    HTTP_POOL_CONFIG = {}
+
+_MAX_CONNECTIONS = HTTP_POOL_CONFIG.get('max_connections', 200)
+_MAX_KEEPALIVE = HTTP_POOL_CONFIG.get('max_keepalive', 75)
+_KEEPALIVE_EXPIRY = float(HTTP_POOL_CONFIG.get('keepalive_expiry', 30.0))
+_TIMEOUT = float(HTTP_POOL_CONFIG.get('timeout', 30.0))
+# 开放平台等固定主机使用独立连接池：主机 -> 最大连接数，HTTP/2 下同一连接可多路复用
+_HOST_LIMITS = HTTP_POOL_CONFIG.get('host_limits', {'api.sgroup.qq.com': 20, 'sandbox.api.sgroup.qq.com': 10, 'bots.qq.com': 4})
+# HTTP/2 需要 h2 模块（pip install httpx[http2]），未安装时回退到 HTTP/1.1 长连接
+_HTTP2 = bool(HTTP_POOL_CONFIG.get('http2', True)) and importlib.util.find_spec('h2') is not None
+_OTHER_HOST = '*'
 _JSON_CONTENT_TYPE = 'application/json'
 _CONTENT_TYPE_KEYS = frozenset({'Content-Type', 'content-type'})
 
@@ -28,7 +38,9 @@ def _sanitize_url(url):
         return url.replace('\n', '%0A').replace('\r', '%0D').replace('\t', '%09')
 
 class HttpxPoolManager:
-    __slots__ = ('_limits', '_timeout', '_sync_client', '_async_client', '_sync_lock', '_async_lock')
+    """进程内共用的 httpx 客户端：通用同步/异步客户端 + 按主机独立限额的同步客户端，统计连接复用情况"""
+    __slots__ = ('_limits', '_timeout', '_sync_client', '_async_client', '_sync_lock', '_async_lock',
+                 '_host_clients', '_stats', '_stats_lock', '_tracers')
     _instance = None
     _init_lock = threading.RLock()
     
@@ -47,6 +59,10 @@ class HttpxPoolManager:
         self._async_client = None
         self._sync_lock = threading.RLock()
         self._async_lock = threading.RLock()
+        self._host_clients = {}
+        self._stats = {}
+        self._stats_lock = threading.Lock()
+        self._tracers = {}
         self._build_sync_client()
         self._build_async_client()
         atexit.register(self.cleanup)
@@ -67,11 +83,66 @@ class HttpxPoolManager:
                 pass
         self._async_client = httpx.AsyncClient(timeout=self._timeout, limits=self._limits)
     
-    def get_sync_client(self):
+    def get_sync_client(self, host=None):
+        """host 在 _HOST_LIMITS 中时返回该主机的专用客户端，否则返回通用客户端"""
+        if host in _HOST_LIMITS:
+            client = self._host_clients.get(host)
+            if client is not None:
+                return client
         with self._sync_lock:
-            if self._sync_client is None:
-                self._build_sync_client()
-            return self._sync_client
+            if host not in _HOST_LIMITS:
+                if self._sync_client is None:
+                    self._build_sync_client()
+                return self._sync_client
+            client = self._host_clients.get(host)
+            if client is None:
+                limit = int(_HOST_LIMITS[host])
+                client = httpx.Client(timeout=self._timeout, http2=_HTTP2, limits=httpx.Limits(
+                    max_connections=limit, max_keepalive_connections=limit, keepalive_expiry=_KEEPALIVE_EXPIRY))
+                self._host_clients[host] = client
+            return client
+
+    def _host_stats(self, host):
+        stats = self._stats.get(host)
+        if stats is None:
+            stats = self._stats.setdefault(host, {'requests': 0, 'errors': 0, 'new_connections': 0, 'http2_requests': 0})
+        return stats
+
+    def get_tracer(self, host):
+        """httpcore trace 回调：新建 TCP 连接与 HTTP/2 请求计数，请求数减新建连接数即为复用次数"""
+        tracer = self._tracers.get(host)
+        if tracer is None:
+            tracer = self._tracers.setdefault(host, self._make_tracer(host))
+        return tracer
+
+    def _make_tracer(self, host):
+        stats = self._host_stats(host)
+        lock = self._stats_lock
+
+        def trace(event, info):
+            if event == 'connection.connect_tcp.complete':
+                with lock:
+                    stats['new_connections'] += 1
+            elif event == 'http2.send_request_headers.started':
+                with lock:
+                    stats['http2_requests'] += 1
+        return trace
+
+    def record_request(self, host, error=False):
+        stats = self._host_stats(host)
+        with self._stats_lock:
+            stats['requests'] += 1
+            if error:
+                stats['errors'] += 1
+
+    def get_stats(self):
+        with self._stats_lock:
+            hosts = {host: dict(stats) for host, stats in self._stats.items()}
+        for stats in hosts.values():
+            succeeded = stats['requests'] - stats['errors']
+            stats['reused'] = max(0, succeeded - stats['new_connections'])
+            stats['reuse_rate'] = round(stats['reused'] / succeeded * 100, 1) if succeeded > 0 else 0.0
+        return {'http2': _HTTP2, 'host_limits': dict(_HOST_LIMITS), 'hosts': hosts}
     
     async def get_async_client(self):
         with self._async_lock:
@@ -80,6 +151,12 @@ class HttpxPoolManager:
             return self._async_client
         
     def cleanup(self):
+        for client in list(self._host_clients.values()):
+            try:
+                client.close()
+            except:
+                pass
+        self._host_clients.clear()
         if self._sync_client:
             try:
                 self._sync_client.close()
@@ -108,6 +185,9 @@ def get_pool_manager():
 def _process_json_kwargs(kwargs):
     if 'json' in kwargs:
         json_data = kwargs.pop('json')
+        if json_data is None:
+            kwargs.pop('verify', None)
+            return kwargs
         kwargs['content'] = json.dumps(json_data).encode('utf-8')
         headers = kwargs.get('headers')
         if headers is None:
@@ -120,8 +200,17 @@ def _process_json_kwargs(kwargs):
 def _make_sync_request(method, url, **kwargs):
     url = _sanitize_url(url)
     kwargs = _process_json_kwargs(kwargs)
-    client = get_pool_manager().get_sync_client()
-    return getattr(client, method)(url, **kwargs)
+    manager = get_pool_manager()
+    host = urlparse(url).hostname
+    stats_host = host if host in _HOST_LIMITS else _OTHER_HOST
+    kwargs['extensions'] = {**kwargs.get('extensions', {}), 'trace': manager.get_tracer(stats_host)}
+    try:
+        response = manager.get_sync_client(host).request(method.upper(), url, **kwargs)
+    except Exception:
+        manager.record_request(stats_host, error=True)
+        raise
+    manager.record_request(stats_host)
+    return response
 
 async def _make_async_request(method, url, **kwargs):
     url = _sanitize_url(url)
@@ -138,6 +227,12 @@ def sync_post(url, **kwargs):
 def sync_delete(url, **kwargs):
     return _make_sync_request('delete', url, **kwargs)
 
+def sync_put(url, **kwargs):
+    return _make_sync_request('put', url, **kwargs)
+
+def sync_request(method, url, **kwargs):
+    return _make_sync_request(method, url, **kwargs)
+
 async def async_get(url, **kwargs):
     return await _make_async_request('get', url, **kwargs)
 
@@ -166,8 +261,14 @@ async def async_delete_json(url, **kwargs):
     return (await async_delete(url, **kwargs)).json()
 
 def get_binary_content(url, **kwargs):
+    kwargs.setdefault('follow_redirects', True)
     return sync_get(url, **kwargs).content
 
+def get_http_pool_stats():
+    if HttpxPoolManager._instance is None:
+        return None
+    return HttpxPoolManager._instance.get_stats()
+
 def run_async(coroutine):
     try:
         current_loop = None
@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import time, queue, logging, threading, atexit
+
+logger = logging.getLogger('ElainaBot.function.ingest_pipeline')
+
+try:
+    from config import INGEST_CONFIG
+except ImportError:
+    INGEST_CONFIG = {}
+
+_DEFAULT_INGEST_CONFIG = {
+    'workers': 4, 'queue_size': 2000, 'overflow_policy': 'drop_oldest', 'block_timeout': 0.5,
+}
+_CONFIG = {**_DEFAULT_INGEST_CONFIG, **INGEST_CONFIG}
+
+_POLICY_BLOCK = 'block'
+_POLICY_DROP_NEWEST = 'drop_newest'
+_POLICY_DROP_OLDEST = 'drop_oldest'
+_POLICIES = frozenset((_POLICY_BLOCK, _POLICY_DROP_NEWEST, _POLICY_DROP_OLDEST))
+_STOP = object()
+_SHUTDOWN_TIMEOUT = 5
+
+class IngestPipeline:
+    """消息旁路任务流水线：固定数量工作线程 + 有界队列
+
+    同一 key（群ID/用户ID）的任务总是进入同一个工作线程的队列，保证按序执行。
+    """
+    __slots__ = ('_queues', '_threads', '_policy', '_block_timeout', '_queue_size',
+                 '_stats', '_stats_lock', '_max_depth', '_stopped')
+    _instance = None
+    _init_lock = threading.Lock()
+
+    @classmethod
+    def get_instance(cls):
+        if cls._instance is None:
+            with cls._init_lock:
+                if cls._instance is None:
+                    cls._instance = cls()
+        return cls._instance
+
+    def __init__(self, config=None):
+        cfg = {**_CONFIG, **(config or {})}
+        workers = max(1, int(cfg['workers']))
+        self._queue_size = max(1, int(cfg['queue_size']))
+        self._policy = cfg['overflow_policy'] if cfg['overflow_policy'] in _POLICIES else _POLICY_BLOCK
+        self._block_timeout = max(0.0, float(cfg['block_timeout']))
+        self._queues = [queue.Queue(maxsize=self._queue_size) for _ in range(workers)]
+        self._stats = {'submitted': 0, 'processed': 0, 'dropped': 0, 'failed': 0}
+        self._stats_lock = threading.Lock()
+        self._max_depth = 0
+        self._stopped = False
+        self._threads = []
+        for i, q in enumerate(self._queues):
+            t = threading.Thread(target=self._worker_loop, args=(q,), daemon=True, name=f"IngestWorker-{i}")
+            t.start()
+            self._threads.append(t)
+        atexit.register(self.shutdown)
+
+    def _incr(self, key, count=1):
+        with self._stats_lock:
+            self._stats[key] += count
+
+    def submit(self, key, func, *args):
+        """提交任务，返回是否成功入队"""
+        if self._stopped:
+            return False
+        q = self._queues[hash(key) % len(self._queues)]
+        item = (func, args)
+        if self._policy == _POLICY_DROP_OLDEST:
+            while True:
+                try:
+                    q.put_nowait(item)
+                    break
+                except queue.Full:
+                    try:
+                        q.get_nowait()
+                        q.task_done()
+                        self._incr('dropped')
+                    except queue.Empty:
+                        pass
+        else:
+            try:
+                if self._policy == _POLICY_DROP_NEWEST:
+                    q.put_nowait(item)
+                else:
+                    q.put(item, timeout=self._block_timeout)
+            except queue.Full:
+                self._incr('dropped')
+                return False
+        depth = q.qsize()
+        with self._stats_lock:
+            self._stats['submitted'] += 1
+            if depth > self._max_depth:
+                self._max_depth = depth
+        return True
+
+    def _worker_loop(self, q):
+        while True:
+            item = q.get()
+            try:
+                if item is _STOP:
+                    break
+                func, args = item
+                try:
+                    func(*args)
+                    self._incr('processed')
+                except Exception as e:
+                    self._incr('failed')
+                    logger.error(f"入库任务执行失败: {e}")
+            finally:
+                q.task_done()
+
+    def get_stats(self):
+        depths = [q.qsize() for q in self._queues]
+        with self._stats_lock:
+            stats = dict(self._stats)
+            max_depth = self._max_depth
+        stats.update({
+            'workers': len(self._queues), 'queue_size': self._queue_size, 'overflow_policy': self._policy,
+            'queue_depth': sum(depths), 'worker_depths': depths, 'max_depth': max_depth,
+        })
+        return stats
+
+    def shutdown(self, timeout=_SHUTDOWN_TIMEOUT):
+        """停止接收新任务，等待已入队任务执行完毕"""
+        if self._stopped:
+            return
+        self._stopped = True
+        deadline = time.time() + timeout
+        for q in self._queues:
+            try:
+                q.put(_STOP, timeout=max(0.0, deadline - time.time()))
+            except queue.Full:
+                pass
+        for t in self._threads:
+            t.join(max(0.0, deadline - time.time()))
+
+def get_ingest_pipeline():
+    return IngestPipeline.get_instance()
+
+def submit_ingest_task(key, func, *args):
+    return get_ingest_pipeline().submit(key, func, *args)
+
+def get_ingest_stats():
+    return get_ingest_pipeline().get_stats()
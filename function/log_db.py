@@ -1,17 +1,18 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
-import os, time, json, queue, threading, logging, datetime, pymysql
+import os, re, time, json, queue, threading, logging, datetime, pymysql
 from decimal import Decimal
 from pymysql.cursors import DictCursor
 from concurrent.futures import ThreadPoolExecutor
 from contextlib import contextmanager
 from config import LOG_DB_CONFIG
+from function.dau_rollup import record_message_rollup
 
 logger = logging.getLogger('ElainaBot.function.log_db')
 
 _DEFAULT_LOG_CONFIG = {
-    'enabled': True, 'create_tables': True, 'table_per_day': True,
+    'enabled': True, 'create_tables': True, 'table_per_day': True, 'partitioned': False,
     'fallback_to_file': True, 'batch_size': 0, 'min_pool_size': 5, 'pool_size': None,
 }
 _CONFIG = {**_DEFAULT_LOG_CONFIG, **LOG_DB_CONFIG}
@@ -25,6 +26,7 @@ _MIN_POOL_SIZE = _CONFIG['min_pool_size']
 _IDLE_TIMEOUT = 300
 _TABLE_PREFIX = _CONFIG['table_prefix']
 _TABLE_PER_DAY = _CONFIG['table_per_day']
+_PARTITIONED = _CONFIG['partitioned']
 _CREATE_TABLES = _CONFIG['create_tables']
 _FALLBACK_TO_FILE = _CONFIG['fallback_to_file']
 _RETENTION_DAYS = _CONFIG.get('retention_days', 0)
@@ -41,29 +43,69 @@ _DB_DATABASE = _CONFIG.get('database', '')
 
 _TABLE_EXISTS_SQL = "SELECT COUNT(*) as count FROM information_schema.tables WHERE table_schema = DATABASE() AND table_name = %s"
 _CLEANUP_TABLES_SQL = "SELECT TABLE_NAME as table_name FROM information_schema.tables WHERE table_schema = DATABASE() AND TABLE_NAME LIKE %s"
+_INDEXES_SQL = "SELECT DISTINCT INDEX_NAME as name FROM information_schema.statistics WHERE table_schema = DATABASE() AND table_name = %s"
+# 聊天记录按会话 + 时间游标分页查询所用的复合索引
+_MESSAGE_COMPOSITE_INDEXES = (('group_time', '`group_id`, `timestamp`'), ('user_time', '`user_id`, `timestamp`'))
+_PARTITIONS_SQL = "SELECT PARTITION_NAME as name FROM information_schema.partitions WHERE table_schema = DATABASE() AND table_name = %s AND PARTITION_NAME IS NOT NULL"
+
+# ==================== 分区单表模式 ====================
+# 每种日志一张表，按 TO_DAYS(timestamp) RANGE 分区，分区名 pYYYYMMDD 存放当天数据，pmax 兜底
+_PARTITIONED_TYPES = frozenset({'message', 'framework', 'error'})
+_PARTITION_AHEAD_DAYS = 3
+_DAY_TABLE_RE = re.compile(rf"^{re.escape(_TABLE_PREFIX)}(\d{{8}})_({'|'.join(_PARTITIONED_TYPES)})$")
+_MIGRATION_TABLE = f"{_TABLE_PREFIX}log_migration"
+_MIGRATION_BATCH = 2000
+_MIGRATION_PAUSE = 0.2
+_MIGRATION_COLUMNS = {
+    'message': "`timestamp`, `type`, `user_id`, `group_id`, `content`, `raw_message`, `plugin_name`, `created_at`",
+    'error': "`timestamp`, `content`, `traceback`, `resp_obj`, `send_payload`, `raw_message`, `created_at`",
+    'framework': "`timestamp`, `content`, `created_at`",
+}
+_SQL_CREATE_MIGRATION_TABLE = f"""
+CREATE TABLE IF NOT EXISTS `{_MIGRATION_TABLE}` (
+    `source` varchar(100) NOT NULL PRIMARY KEY,
+    `last_id` bigint(20) NOT NULL DEFAULT 0,
+    `updated_at` timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+"""
+
+def _partition_def(day):
+    return f"PARTITION p{day.strftime('%Y%m%d')} VALUES LESS THAN (TO_DAYS('{(day + datetime.timedelta(days=1)).isoformat()}'))"
+
+def _partition_day(name):
+    try:
+        return datetime.datetime.strptime(name[1:], '%Y%m%d').date()
+    except (ValueError, TypeError):
+        return None
 
 _FALLBACK_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'log')
 
 # ==================== 分享表相关常量 ====================
-_SHARE_TABLE = f"{_TABLE_PREFIX}Share"
+_SHARE_TABLE = f"{_TABLE_PREFIX}share_relations"
+_LEGACY_SHARE_TABLE = f"{_TABLE_PREFIX}Share"      # 旧版按分享者存 referrals JSON 的表，启动时迁移到关系表
+_SHARE_MIGRATE_BATCH = 200
 _share_table_initialized = False
 
 _SQL_CREATE_SHARE_TABLE = f"""
 CREATE TABLE IF NOT EXISTS `{_SHARE_TABLE}` (
     `id` bigint(20) NOT NULL AUTO_INCREMENT,
-    `openid` varchar(128) NOT NULL COMMENT '分享者openid或自定义callbackData',
-    `referrals` mediumtext DEFAULT NULL COMMENT '被邀请用户信息',
-    `created_at` datetime DEFAULT NULL,
-    `updated_at` timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    `sharer_id` varchar(128) NOT NULL COMMENT '分享者openid或自定义callbackData',
+    `referred_id` varchar(128) NOT NULL COMMENT '被邀请用户openid',
+    `scene` int(11) NOT NULL DEFAULT 0 COMMENT '来源场景值',
+    `created_at` datetime NOT NULL DEFAULT CURRENT_TIMESTAMP,
     PRIMARY KEY (`id`),
-    UNIQUE KEY `uk_openid` (`openid`),
-    KEY `idx_updated_at` (`updated_at`)
+    UNIQUE KEY `uk_referred_id` (`referred_id`),
+    KEY `idx_sharer_created` (`sharer_id`, `created_at`)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
 """
 
-_SQL_SELECT_SHARE_REFERRALS = f"SELECT referrals FROM `{_SHARE_TABLE}` WHERE openid = %s"
-_SQL_INSERT_SHARE = f"INSERT INTO `{_SHARE_TABLE}` (openid, referrals) VALUES (%s, %s)"
-_SQL_UPDATE_SHARE_REFERRALS = f"UPDATE `{_SHARE_TABLE}` SET referrals = %s WHERE openid = %s"
+# 同一被邀请用户只归属首个分享者，重复记录被唯一索引忽略
+_SQL_INSERT_SHARE_RELATION = f"INSERT IGNORE INTO `{_SHARE_TABLE}` (sharer_id, referred_id, scene, created_at) VALUES (%s, %s, %s, %s)"
+_SQL_SELECT_SHARE_REFERRALS = f"SELECT referred_id, scene FROM `{_SHARE_TABLE}` WHERE sharer_id = %s ORDER BY created_at, id"
+_SQL_COUNT_SHARE_REFERRALS = f"SELECT COUNT(*) as count FROM `{_SHARE_TABLE}` WHERE sharer_id = %s"
+_SQL_SELECT_SHARER = f"SELECT sharer_id FROM `{_SHARE_TABLE}` WHERE referred_id = %s"
+_SQL_SELECT_LEGACY_SHARES = f"SELECT id, openid, referrals, created_at, updated_at FROM `{_LEGACY_SHARE_TABLE}` WHERE referrals IS NOT NULL AND id > %s ORDER BY id LIMIT %s"
+_SQL_CLEAR_LEGACY_SHARES = f"UPDATE `{_LEGACY_SHARE_TABLE}` SET referrals = NULL WHERE id IN ({{}})"
 
 # 场景值定义
 SHARE_SCENE_MAP = {
@@ -103,6 +145,15 @@ def _decimal_converter(obj):
         return int(obj) if obj % 1 == 0 else float(obj)
     raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
 
+def _raw_message_text(raw):
+    """插件回复日志的 raw_message 以 payload 原样入队，在写库线程里才序列化"""
+    if raw is None or isinstance(raw, str):
+        return raw
+    try:
+        return json.dumps(raw, ensure_ascii=False)
+    except Exception:
+        return str(raw)
+
 class LogDatabasePool:
     __slots__ = ('_thread_pool', '_pool', '_busy_connections', '_initialized', '_db_available')
     _instance = None
@@ -303,8 +354,10 @@ class LogDatabaseManager:
             self._create_wakeup_table()
         self._stop_event = threading.Event()
         threading.Thread(target=self._periodic_save, daemon=True, name="LogDBSaveThread").start()
-        if not self._fallback_mode and _RETENTION_DAYS > 0:
+        if not self._fallback_mode and (_RETENTION_DAYS > 0 or _PARTITIONED):
             threading.Thread(target=self._periodic_cleanup, daemon=True, name="LogDBCleanupThread").start()
+        if not self._fallback_mode and _PARTITIONED:
+            threading.Thread(target=self._migrate_day_tables, daemon=True, name="LogDBMigrateThread").start()
 
     def _init_sql_templates(self):
         self._sql_templates = {
@@ -323,7 +376,7 @@ class LogDatabaseManager:
             'default': "INSERT INTO `{table_name}` (timestamp, content) VALUES (%s, %s)"
         }
         self._field_extractors = {
-            'message': lambda l: (l.get('timestamp'), l.get('type', 'received'), l.get('user_id', '未知用户' if l.get('type', 'received') == 'received' else ''), l.get('group_id', 'c2c'), l.get('content', ''), l.get('raw_message', ''), l.get('plugin_name', '')),
+            'message': lambda l: (l.get('timestamp'), l.get('type', 'received'), l.get('user_id', '未知用户' if l.get('type', 'received') == 'received' else ''), l.get('group_id', 'c2c'), l.get('content', ''), _raw_message_text(l.get('raw_message', '')), l.get('plugin_name', '')),
             'error': lambda l: (l.get('timestamp'), l.get('content'), l.get('traceback', ''), l.get('resp_obj', ''), l.get('send_payload', ''), l.get('raw_message', '')),
             'id': lambda l: (l.get('chat_type'), l.get('chat_id'), l.get('last_message_id'), l.get('id_type', 'msg')),
             'default': lambda l: (l.get('timestamp'), l.get('content'))
@@ -383,11 +436,11 @@ class LogDatabaseManager:
         suffix = _TABLE_SUFFIX.get(log_type, log_type)
         if log_type in _NON_DAILY_TYPES:
             return f"{_TABLE_PREFIX}{suffix}"
-        if _TABLE_PER_DAY:
+        if _TABLE_PER_DAY and not _PARTITIONED:
             return f"{_TABLE_PREFIX}{datetime.datetime.now().strftime('%Y%m%d')}_{suffix}"
         return f"{_TABLE_PREFIX}{suffix}"
 
-    def _get_create_table_sql(self, table_name, log_type):
+    def _get_create_table_sql(self, table_name, log_type, partition_days=None):
         base, fields, end = self._table_schemas.get(log_type, self._table_schemas['default'])
         if base == 'special':
             sql = f"CREATE TABLE IF NOT EXISTS `{table_name}` ({fields}"
@@ -398,8 +451,51 @@ class LogDatabaseManager:
             'dau': "`updated_at` timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci",
             'id': "`timestamp` timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci"
         }
+        if partition_days:
+            # 分区键必须包含在主键中
+            partitions = ', '.join([_partition_def(d) for d in partition_days] + ['PARTITION pmax VALUES LESS THAN MAXVALUE'])
+            return (sql + ends[end]).replace("PRIMARY KEY (`id`))", "PRIMARY KEY (`id`, `timestamp`))") + f" PARTITION BY RANGE (TO_DAYS(`timestamp`)) ({partitions})"
         return sql + ends[end]
 
+    def _ensure_message_indexes(self, cursor, table_name):
+        """为已存在的消息表补建聊天记录查询使用的复合索引"""
+        try:
+            cursor.execute(_INDEXES_SQL, (table_name,))
+            existing = {r['name'] for r in cursor.fetchall()}
+            for name, cols in _MESSAGE_COMPOSITE_INDEXES:
+                if f"idx_{table_name}_{name}" not in existing:
+                    cursor.execute(f"ALTER TABLE `{table_name}` ADD INDEX `idx_{table_name}_{name}` ({cols})")
+                    logger.info(f"已为 {table_name} 添加索引 ({cols})")
+        except Exception as e:
+            logger.warning(f"为 {table_name} 添加复合索引失败: {e}")
+
+    def _initial_partition_days(self, cursor, log_type):
+        """新建分区表时的分区：待迁移的历史日表所在日期 + 今天起若干天"""
+        today = datetime.date.today()
+        days = {today + datetime.timedelta(days=i) for i in range(_PARTITION_AHEAD_DAYS + 1)}
+        cursor.execute(_CLEANUP_TABLES_SQL, (f"{_TABLE_PREFIX}%",))
+        for row in cursor.fetchall():
+            match = _DAY_TABLE_RE.match(row.get('table_name', ''))
+            if match and match.group(2) == log_type:
+                days.add(datetime.datetime.strptime(match.group(1), '%Y%m%d').date())
+        return sorted(days)
+
+    def _ensure_partitions(self, cursor, table_name):
+        """从 pmax 中拆出最后一个分区之后直到今天 + _PARTITION_AHEAD_DAYS 的每日分区"""
+        cursor.execute(_PARTITIONS_SQL, (table_name,))
+        days = [d for d in (_partition_day(r['name']) for r in cursor.fetchall()) if d]
+        if not days:
+            return False
+        day, last = max(days) + datetime.timedelta(days=1), datetime.date.today() + datetime.timedelta(days=_PARTITION_AHEAD_DAYS)
+        missing = []
+        while day <= last:
+            missing.append(day)
+            day += datetime.timedelta(days=1)
+        if missing:
+            partitions = ', '.join([_partition_def(d) for d in missing] + ['PARTITION pmax VALUES LESS THAN MAXVALUE'])
+            cursor.execute(f"ALTER TABLE `{table_name}` REORGANIZE PARTITION pmax INTO ({partitions})")
+        return True
+
     def _create_table(self, log_type):
         table_name = self._get_table_name(log_type)
         if table_name in self.tables_created:
@@ -419,14 +515,22 @@ class LogDatabaseManager:
                             self.tables_created.add(table_name)
                             return True
                     else:
+                        if _PARTITIONED and log_type in _PARTITIONED_TYPES and not self._ensure_partitions(cursor, table_name):
+                            logger.warning(f"日志表 {table_name} 已存在但未分区，将按普通单表写入")
+                        if log_type == 'message':
+                            self._ensure_message_indexes(cursor, table_name)
+                        conn.commit()
                         self.tables_created.add(table_name)
                         return True
-                cursor.execute(self._get_create_table_sql(table_name, log_type))
+                partition_days = self._initial_partition_days(cursor, log_type) if _PARTITIONED and log_type in _PARTITIONED_TYPES else None
+                cursor.execute(self._get_create_table_sql(table_name, log_type, partition_days))
                 if log_type not in _NON_DAILY_TYPES:
                     cursor.execute(f"CREATE INDEX idx_{table_name}_time ON {table_name} (timestamp)")
                 if log_type == 'message':
-                    for col in ('type', 'user_id', 'group_id', 'plugin_name'):
+                    for col in ('type', 'plugin_name'):
                         cursor.execute(f"CREATE INDEX idx_{table_name}_{col} ON {table_name} ({col})")
+                    for name, cols in _MESSAGE_COMPOSITE_INDEXES:
+                        cursor.execute(f"CREATE INDEX idx_{table_name}_{name} ON {table_name} ({cols})")
                 conn.commit()
                 self.tables_created.add(table_name)
                 return True
@@ -442,6 +546,8 @@ class LogDatabaseManager:
         if log_type not in _LOG_TYPES_SET:
             return False
         self.log_queues[log_type].put(log_data)
+        if log_type == 'message':
+            record_message_rollup(log_data)
         if _INSERT_INTERVAL == 0 or log_type == 'dau':
             self._save_log_type_to_db(log_type)
         return True
@@ -491,6 +597,8 @@ class LogDatabaseManager:
                     target += datetime.timedelta(days=1)
                 if self._stop_event.wait((target - now).total_seconds()):
                     break
+                if _PARTITIONED:
+                    self._maintain_partitions()
                 self._cleanup_expired_tables()
             except:
                 time.sleep(3600)
@@ -513,9 +621,75 @@ class LogDatabaseManager:
                                 cursor.execute(f"DROP TABLE IF EXISTS `{name}`")
                     except:
                         continue
+                if _PARTITIONED:
+                    self._drop_expired_partitions(cursor, cutoff.date())
                 conn.commit()
         except Exception as e:
             logger.error(f"清理过期日志表失败: {e}")
+
+    def _drop_expired_partitions(self, cursor, cutoff_day):
+        """分区模式下按整天 DROP PARTITION，代价与删除日表相同，不逐行 DELETE"""
+        for log_type in _PARTITIONED_TYPES:
+            table_name = self._get_table_name(log_type)
+            cursor.execute(_PARTITIONS_SQL, (table_name,))
+            expired = [r['name'] for r in cursor.fetchall() if (_partition_day(r['name']) or cutoff_day) < cutoff_day]
+            if expired:
+                cursor.execute(f"ALTER TABLE `{table_name}` DROP PARTITION {', '.join(expired)}")
+                logger.info(f"已删除过期日志分区 {table_name}: {', '.join(expired)}")
+
+    def _maintain_partitions(self):
+        try:
+            with self._with_cursor() as (cursor, conn):
+                for log_type in _PARTITIONED_TYPES:
+                    self._ensure_partitions(cursor, self._get_table_name(log_type))
+                conn.commit()
+        except Exception as e:
+            logger.error(f"创建日志分区失败: {e}")
+
+    def _migrate_day_tables(self):
+        """后台把按天分表模式遗留的日表逐批搬入分区表，搬完后删除日表
+
+        每批数据与迁移进度在同一事务提交，中断或重启后从上次的位置继续，不会重复写入。
+        """
+        try:
+            with self._with_cursor() as (cursor, conn):
+                cursor.execute(_SQL_CREATE_MIGRATION_TABLE)
+                cursor.execute(_CLEANUP_TABLES_SQL, (f"{_TABLE_PREFIX}%",))
+                sources = sorted(m.group(0) for m in (_DAY_TABLE_RE.match(r.get('table_name', '')) for r in cursor.fetchall()) if m)
+                conn.commit()
+            for source in sources:
+                if self._stop_event.is_set():
+                    return
+                log_type = _DAY_TABLE_RE.match(source).group(2)
+                if self._create_table(log_type):
+                    self._migrate_day_table(source, log_type)
+        except Exception as e:
+            logger.error(f"迁移按天日志表失败: {e}")
+
+    def _migrate_day_table(self, source, log_type):
+        target, columns = self._get_table_name(log_type), _MIGRATION_COLUMNS[log_type]
+        with self._with_cursor() as (cursor, conn):
+            cursor.execute(f"SELECT last_id FROM `{_MIGRATION_TABLE}` WHERE source = %s", (source,))
+            row = cursor.fetchone()
+            conn.commit()
+        last_id, copied = (row['last_id'] if row else 0), 0
+        while not self._stop_event.is_set():
+            with self._with_cursor() as (cursor, conn):
+                cursor.execute(f"SELECT MAX(id) as max_id FROM (SELECT id FROM `{source}` WHERE id > %s ORDER BY id LIMIT {_MIGRATION_BATCH}) AS batch", (last_id,))
+                batch_end = (cursor.fetchone() or {}).get('max_id')
+                if batch_end is None:
+                    cursor.execute(f"DROP TABLE IF EXISTS `{source}`")
+                    cursor.execute(f"DELETE FROM `{_MIGRATION_TABLE}` WHERE source = %s", (source,))
+                    conn.commit()
+                    add_framework_log(f"日志表迁移完成: {source} -> {target}，本次迁移 {copied} 条")
+                    return
+                cursor.execute(f"INSERT INTO `{target}` ({columns}) SELECT {columns} FROM `{source}` WHERE id > %s AND id <= %s ORDER BY id", (last_id, batch_end))
+                copied += cursor.rowcount
+                cursor.execute(f"INSERT INTO `{_MIGRATION_TABLE}` (source, last_id) VALUES (%s, %s) ON DUPLICATE KEY UPDATE last_id = VALUES(last_id)", (source, batch_end))
+                conn.commit()
+                last_id = batch_end
+            # 分批让出，避免迁移长时间占用日志库
+            self._stop_event.wait(_MIGRATION_PAUSE)
     
     def _save_logs_to_db(self):
         for t in _LOG_TYPES:
@@ -600,12 +774,51 @@ class LogDatabaseManager:
             with self._with_cursor() as (cursor, conn):
                 cursor.execute(_SQL_CREATE_SHARE_TABLE)
                 conn.commit()
+                cursor.execute(_TABLE_EXISTS_SQL, (_LEGACY_SHARE_TABLE,))
+                legacy = cursor.fetchone()
                 _share_table_initialized = True
-                return True
+            if legacy and legacy['count'] > 0:
+                threading.Thread(target=self._migrate_legacy_shares, daemon=True, name="ShareRelationMigrate").start()
+            return True
         except Exception as e:
             logger.error(f"初始化分享表失败: {e}")
             return False
 
+    def _migrate_legacy_shares(self):
+        """把旧版 Share 表每个分享者的 referrals JSON 拆成关系表行，迁移完的行 referrals 置为 NULL，中断后可重入"""
+        migrated = last_id = 0
+        try:
+            while True:
+                with self._with_cursor() as (cursor, conn):
+                    cursor.execute(_SQL_SELECT_LEGACY_SHARES, (last_id, _SHARE_MIGRATE_BATCH))
+                    rows = cursor.fetchall()
+                    if not rows:
+                        break
+                    values = []
+                    for row in rows:
+                        try:
+                            referrals = json.loads(row['referrals']) if isinstance(row['referrals'], str) else row['referrals']
+                        except (ValueError, TypeError):
+                            referrals = None
+                        created_at = row.get('created_at') or row.get('updated_at') or datetime.datetime.now()
+                        for referred_id, scene in (referrals.items() if isinstance(referrals, dict) else ()):
+                            try:
+                                scene = int(scene) if scene else 0
+                            except (ValueError, TypeError):
+                                scene = 0
+                            values.append((row['openid'], str(referred_id)[:128], scene, created_at))
+                    if values:
+                        cursor.executemany(_SQL_INSERT_SHARE_RELATION, values)
+                    ids = [row['id'] for row in rows]
+                    cursor.execute(_SQL_CLEAR_LEGACY_SHARES.format(','.join(['%s'] * len(ids))), ids)
+                    conn.commit()
+                    migrated += len(values)
+                    last_id = ids[-1]
+            if migrated:
+                logger.info(f"分享关系迁移完成，共 {migrated} 条")
+        except Exception as e:
+            logger.error(f"分享关系迁移失败: {e}")
+
     def _create_wakeup_table(self):
         global _wakeup_table_initialized
         try:
@@ -730,6 +943,96 @@ def cleanup_expired_log_tables():
     return True
 
 
+# ==================== 日志表读取 ====================
+# 读取方统一通过以下函数定位日志表，不再自行拼接 {前缀}{YYYYMMDD}_{类型}
+
+_SINGLE_TABLE = _PARTITIONED or not _TABLE_PER_DAY
+
+def is_single_log_table():
+    """日志是否写入单表（分区模式或关闭按天分表），此时可按时间范围一次查询多天"""
+    return _SINGLE_TABLE
+
+def _as_date(value):
+    if isinstance(value, datetime.datetime):
+        return value.date()
+    if isinstance(value, datetime.date):
+        return value
+    value = str(value)
+    return datetime.datetime.strptime(value, '%Y%m%d' if len(value) == 8 else '%Y-%m-%d').date()
+
+def get_log_table_name(log_type, date=None):
+    """日志表名：单表模式下与日期无关，按天分表模式下为 date（默认今天）当天的表"""
+    suffix = _TABLE_SUFFIX.get(log_type, log_type)
+    if log_type in _NON_DAILY_TYPES or _SINGLE_TABLE:
+        return f"{_TABLE_PREFIX}{suffix}"
+    return f"{_TABLE_PREFIX}{_as_date(date or datetime.date.today()).strftime('%Y%m%d')}_{suffix}"
+
+def get_day_log_source(log_type, date):
+    """返回可直接写在 FROM 之后的某一天日志数据源
+
+    按天分表时就是当天的表；单表模式下是带时间范围条件的派生表，MySQL 会把它合并进外层查询，
+    分区表只扫描当天分区并可使用 timestamp 索引。
+    """
+    table_name = get_log_table_name(log_type, date)
+    if not _SINGLE_TABLE:
+        return f"`{table_name}`"
+    day = _as_date(date)
+    return (f"(SELECT * FROM `{table_name}` WHERE `timestamp` >= '{day.isoformat()}' "
+            f"AND `timestamp` < '{(day + datetime.timedelta(days=1)).isoformat()}') AS `day_log`")
+
+def day_log_exists(cursor, log_type, date):
+    """某天的日志是否有表可查，单表模式下只检查单表是否存在"""
+    cursor.execute(_TABLE_EXISTS_SQL, (get_log_table_name(log_type, date),))
+    result = cursor.fetchone()
+    return bool(result and result['count'] > 0)
+
+def get_log_tables_in_range(cursor, log_type, start_date, end_date):
+    """返回日期范围内实际存在的日志表（新到旧），一次 information_schema 查询，不逐天探测"""
+    if _SINGLE_TABLE:
+        return [get_log_table_name(log_type)] if day_log_exists(cursor, log_type, end_date) else []
+    suffix = _TABLE_SUFFIX.get(log_type, log_type)
+    start, end = _as_date(start_date).strftime('%Y%m%d'), _as_date(end_date).strftime('%Y%m%d')
+    cursor.execute(_CLEANUP_TABLES_SQL, (f"{_TABLE_PREFIX}%_{suffix}",))
+    tables = []
+    for row in cursor.fetchall():
+        name = row.get('table_name', '')
+        day = name[len(_TABLE_PREFIX):len(_TABLE_PREFIX) + 8]
+        if name == f"{_TABLE_PREFIX}{day}_{suffix}" and day.isdigit() and start <= day <= end:
+            tables.append(name)
+    return sorted(tables, reverse=True)
+
+def execute_log_query(sql, params=None, fetchall=False):
+    """在日志库执行一条查询，连接在任何返回路径上都会归还"""
+    pool = LogDatabasePool()
+    connection = pool.get_connection()
+    if not connection:
+        return None
+    cursor = None
+    try:
+        cursor = connection.cursor()
+        cursor.execute(sql, params)
+        return cursor.fetchall() if fetchall else cursor.fetchone()
+    except Exception as e:
+        logger.error(f"日志库查询失败: {e}")
+        return None
+    finally:
+        if cursor:
+            cursor.close()
+        pool.release_connection(connection)
+
+def execute_log_queries_concurrent(query_list, timeout=3.0):
+    """在日志连接池共享的线程池上并发执行 [(sql, params, fetchall), ...]，按顺序返回结果，超时或失败为 None"""
+    executor = LogDatabasePool()._thread_pool
+    futures = [executor.submit(execute_log_query, q[0], q[1], q[2] if len(q) > 2 else False) for q in query_list]
+    results = []
+    for f in futures:
+        try:
+            results.append(f.result(timeout=timeout))
+        except:
+            results.append(None)
+    return results
+
+
 # ==================== 分享链接功能 ====================
 
 def _init_share_table():
@@ -762,21 +1065,8 @@ def record_share_relation(sharer_id, referral_id, scene=0):
     
     try:
         with log_db_manager._with_cursor() as (cursor, conn):
-            cursor.execute(_SQL_SELECT_SHARE_REFERRALS, (sharer_id,))
-            result = cursor.fetchone()
-            
-            if result:
-                try:
-                    referrals = json.loads(result['referrals']) if isinstance(result.get('referrals'), str) else (result.get('referrals') or {})
-                except:
-                    referrals = {}
-                if referral_id not in referrals:
-                    referrals[referral_id] = scene
-                    cursor.execute(_SQL_UPDATE_SHARE_REFERRALS, (json.dumps(referrals, ensure_ascii=False), sharer_id))
-                    conn.commit()
-            else:
-                cursor.execute(_SQL_INSERT_SHARE, (sharer_id, json.dumps({referral_id: scene}, ensure_ascii=False)))
-                conn.commit()
+            cursor.execute(_SQL_INSERT_SHARE_RELATION, (sharer_id, referral_id, scene, datetime.datetime.now()))
+            conn.commit()
             return True
     except Exception as e:
         logger.error(f"记录分享关系失败: {e}")
@@ -789,11 +1079,7 @@ def get_share_referrals(sharer_id):
     try:
         with log_db_manager._with_cursor() as (cursor, conn):
             cursor.execute(_SQL_SELECT_SHARE_REFERRALS, (sharer_id,))
-            result = cursor.fetchone()
-            if result and result.get('referrals'):
-                referrals = json.loads(result['referrals']) if isinstance(result['referrals'], str) else result['referrals']
-                return referrals if isinstance(referrals, dict) else {}
-            return {}
+            return {row['referred_id']: row['scene'] for row in cursor.fetchall()}
     except:
         return {}
 
@@ -803,7 +1089,16 @@ def get_share_referrals_list(sharer_id):
 
 
 def get_share_count(sharer_id):
-    return len(get_share_referrals(sharer_id))
+    """按 sharer_id 索引计数，不读取邀请明细"""
+    if not sharer_id or (not _share_table_initialized and not _init_share_table()):
+        return 0
+    try:
+        with log_db_manager._with_cursor() as (cursor, conn):
+            cursor.execute(_SQL_COUNT_SHARE_REFERRALS, (sharer_id,))
+            result = cursor.fetchone()
+            return result['count'] if result else 0
+    except:
+        return 0
 
 
 def get_share_referrals_with_scene_name(sharer_id):
@@ -815,9 +1110,9 @@ def get_sharer_by_referral(referral_id):
         return None
     try:
         with log_db_manager._with_cursor() as (cursor, conn):
-            cursor.execute(f"SELECT openid FROM `{_SHARE_TABLE}` WHERE JSON_CONTAINS_PATH(referrals, 'one', %s)", (f'$."{referral_id}"',))
+            cursor.execute(_SQL_SELECT_SHARER, (referral_id,))
             result = cursor.fetchone()
-            return result.get('openid') if result else None
+            return result.get('sharer_id') if result else None
     except:
         return None
 
@@ -0,0 +1,205 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os, json, time, logging, threading
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger('ElainaBot.function.nickname_backfill')
+
+try:
+    from config import NICKNAME_BACKFILL_CONFIG
+except ImportError:
+    NICKNAME_BACKFILL_CONFIG = {}
+
+_DEFAULT_NICKNAME_BACKFILL_CONFIG = {
+    'api_url': '', 'name_field': 'nickname', 'concurrency': 8, 'rate': 20, 'batch_size': 200, 'timeout': 5,
+}
+_CONFIG = {**_DEFAULT_NICKNAME_BACKFILL_CONFIG, **NICKNAME_BACKFILL_CONFIG}
+
+_CHECKPOINT_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'nickname_backfill.json')
+_CHECKPOINT_KEYS = ('cursor', 'processed', 'success', 'failed', 'total', 'started_at')
+
+class _RateLimiter:
+    """全局限速：调用方按 rate 均匀预约时刻，未到时刻则休眠等待"""
+    __slots__ = ('interval', 'next_at', 'lock')
+
+    def __init__(self, rate):
+        self.interval = 1.0 / max(float(rate), 0.001)
+        self.next_at = 0.0
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        with self.lock:
+            now = time.time()
+            at = max(self.next_at, now)
+            self.next_at = at + self.interval
+        if at > now:
+            time.sleep(at - now)
+
+def _load_checkpoint():
+    try:
+        with open(_CHECKPOINT_FILE, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except:
+        return None
+
+def _save_checkpoint(state):
+    try:
+        os.makedirs(os.path.dirname(_CHECKPOINT_FILE), exist_ok=True)
+        tmp_path = _CHECKPOINT_FILE + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({k: state[k] for k in _CHECKPOINT_KEYS}, f, ensure_ascii=False)
+        os.replace(tmp_path, _CHECKPOINT_FILE)
+    except Exception as e:
+        logger.warning(f"保存昵称补全检查点失败: {e}")
+
+def _clear_checkpoint():
+    try:
+        os.remove(_CHECKPOINT_FILE)
+    except OSError:
+        pass
+
+class NicknameBackfillJob:
+    """后台昵称补全任务：按 user_id 键集分批读取无昵称用户，限并发、全局限速查询昵称，
+    每批结果合并为一条 UPDATE 写入并记录检查点，中断（停止、失败或重启）后再次发起从检查点继续。
+    """
+    __slots__ = ('_lock', '_state', '_stop_event')
+    _instance = None
+    _init_lock = threading.Lock()
+
+    @classmethod
+    def get_instance(cls):
+        if cls._instance is None:
+            with cls._init_lock:
+                if cls._instance is None:
+                    cls._instance = cls()
+        return cls._instance
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._state = None
+        self._stop_event = threading.Event()
+
+    def start(self):
+        """启动或继续补全，返回 (是否新启动, 当前状态)"""
+        with self._lock:
+            if self._state and self._state['status'] == 'running':
+                return False, self._status_locked()
+        if not _CONFIG.get('api_url'):
+            return False, {'status': 'unavailable', 'message': '未配置昵称查询接口 NICKNAME_BACKFILL_CONFIG[\'api_url\']'}
+        from function.database import Database
+        db = Database()
+        checkpoint = _load_checkpoint()
+        if checkpoint:
+            state = {k: checkpoint.get(k, 0) for k in _CHECKPOINT_KEYS}
+            state['cursor'] = checkpoint.get('cursor') or ''
+            state['total'] = state['processed'] + db.count_unnamed_users(state['cursor'])
+        else:
+            state = {'cursor': '', 'processed': 0, 'success': 0, 'failed': 0,
+                     'total': db.count_unnamed_users(), 'started_at': time.time()}
+            if not state['total']:
+                return False, {'status': 'completed', 'total': 0, 'processed': 0, 'success': 0, 'failed': 0,
+                               'progress': 100, 'message': '所有用户都已有昵称，无需补全'}
+        state.update(status='running', resumed=bool(checkpoint), run_started_at=time.time(), run_processed=0, error=None)
+        with self._lock:
+            if self._state and self._state['status'] == 'running':
+                return False, self._status_locked()
+            self._state = state
+            self._stop_event.clear()
+            _save_checkpoint(state)
+            threading.Thread(target=self._run, args=(state,), daemon=True, name="NicknameBackfill").start()
+            return True, self._status_locked()
+
+    def stop(self):
+        """请求停止，当前批次完成后退出并保留检查点"""
+        with self._lock:
+            if self._state and self._state['status'] == 'running':
+                self._stop_event.set()
+                return True
+        return False
+
+    def _run(self, state):
+        from function.database import Database
+        db = Database()
+        limiter = _RateLimiter(_CONFIG.get('rate', 20))
+        batch_size = max(1, int(_CONFIG.get('batch_size', 200)))
+
+        def fetch(user_id):
+            if self._stop_event.is_set():
+                return None
+            limiter.acquire()
+            return None if self._stop_event.is_set() else db.fetch_user_name_from_api(user_id)
+
+        executor = ThreadPoolExecutor(max_workers=max(1, int(_CONFIG.get('concurrency', 8))), thread_name_prefix="NicknameFetch")
+        status, error = 'completed', None
+        try:
+            while not self._stop_event.is_set():
+                batch = db.get_unnamed_user_ids(state['cursor'], batch_size)
+                if batch is None:
+                    raise RuntimeError("读取用户表失败")
+                if not batch:
+                    break
+                names = {uid: name for uid, name in zip(batch, executor.map(fetch, batch)) if name}
+                if names and not db.update_user_names_batch(names):
+                    raise RuntimeError("写入昵称失败")
+                # 停止时本批未必查询完：已取得的昵称计入成功，其余用户仍无昵称，下次从同一检查点重新查询
+                stopped = self._stop_event.is_set()
+                done = len(names) if stopped else len(batch)
+                with self._lock:
+                    if not stopped:
+                        state['cursor'] = batch[-1]
+                    state['processed'] += done
+                    state['run_processed'] += done
+                    state['success'] += len(names)
+                    state['failed'] += done - len(names)
+                    _save_checkpoint(state)
+            if self._stop_event.is_set():
+                status = 'paused'
+            else:
+                _clear_checkpoint()
+        except Exception as e:
+            status, error = 'failed', str(e)
+            logger.error(f"昵称补全任务失败: {e}")
+        finally:
+            executor.shutdown(wait=True)
+            with self._lock:
+                state.update(status=status, error=error, finished_at=time.time())
+        logger.info(f"昵称补全任务结束({status}): 处理 {state['processed']}/{state['total']}，成功 {state['success']}，失败 {state['failed']}")
+
+    def _status_locked(self):
+        state = self._state
+        now = state.get('finished_at') or time.time()
+        elapsed = now - state['run_started_at']
+        rate = state['run_processed'] / elapsed if elapsed > 0 else 0.0
+        remaining = max(state['total'] - state['processed'], 0)
+        status = {k: state[k] for k in ('status', 'total', 'processed', 'success', 'failed', 'resumed', 'error')}
+        status.update(progress=round(state['processed'] / state['total'] * 100, 1) if state['total'] else 100,
+                      elapsed_time=round(elapsed, 1), users_per_second=round(rate, 2),
+                      eta_seconds=round(remaining / rate) if state['status'] == 'running' and rate > 0 else None)
+        status['message'] = {
+            'running': f"正在补全昵称 {state['processed']}/{state['total']}",
+            'completed': f"昵称补全完成，成功 {state['success']} 个，失败 {state['failed']} 个",
+            'paused': f"昵称补全已暂停 {state['processed']}/{state['total']}，再次发起将从检查点继续",
+            'failed': f"昵称补全中断: {state['error']}，再次发起将从检查点继续",
+        }[state['status']]
+        return status
+
+    def get_status(self):
+        with self._lock:
+            if self._state:
+                return self._status_locked()
+        checkpoint = _load_checkpoint()
+        if checkpoint:
+            return {'status': 'interrupted', 'processed': checkpoint.get('processed', 0), 'total': checkpoint.get('total', 0),
+                    'success': checkpoint.get('success', 0), 'failed': checkpoint.get('failed', 0),
+                    'message': '上次昵称补全未完成，再次发起将从检查点继续'}
+        return {'status': 'idle', 'message': '没有进行中的昵称补全任务'}
+
+def start_nickname_backfill():
+    return NicknameBackfillJob.get_instance().start()
+
+def stop_nickname_backfill():
+    return NicknameBackfillJob.get_instance().stop()
+
+def get_nickname_backfill_status():
+    return NicknameBackfillJob.get_instance().get_status()
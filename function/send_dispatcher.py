@@ -0,0 +1,297 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import re, time, heapq, logging, threading, atexit
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+
+logger = logging.getLogger('ElainaBot.function.send_dispatcher')
+
+try:
+    from config import SEND_QUEUE_CONFIG
+except ImportError:
+    SEND_QUEUE_CONFIG = {}
+
+_DEFAULT_SEND_QUEUE_CONFIG = {
+    'enabled': True, 'max_concurrency': 16,
+    'group_rate': 5, 'group_burst': 5, 'user_rate': 2, 'user_burst': 3,
+}
+_CONFIG = {**_DEFAULT_SEND_QUEUE_CONFIG, **SEND_QUEUE_CONFIG}
+
+PRIORITY_REPLY = 0        # 被动回复
+PRIORITY_PROACTIVE = 1    # 主动消息（send_to_group / send_to_user）
+_PRIORITIES = (PRIORITY_REPLY, PRIORITY_PROACTIVE)
+
+_TARGET_RE = re.compile(r'^/(?:v2/)?(groups|channels|users|dms)/([^/]+)')
+_GROUP_SCOPES = frozenset(('groups', 'channels'))
+_PRUNE_INTERVAL = 60
+_SHUTDOWN_TIMEOUT = 5
+
+class _TokenBucket:
+    """令牌桶（GCRA 形式）：同一目标的消息按 rate 平滑、允许 burst 条突发，发出时才占用令牌"""
+    __slots__ = ('interval', 'tolerance', 'tat')
+
+    def __init__(self, rate, burst):
+        self.interval = 1.0 / max(float(rate), 0.001)
+        self.tolerance = (max(int(burst), 1) - 1) * self.interval
+        self.tat = 0.0
+
+    def available_at(self):
+        """下一个令牌可用的时刻"""
+        return self.tat - self.tolerance
+
+    def take(self, now):
+        self.tat = max(self.tat, now) + self.interval
+
+_IDLE, _READY, _WAITING = 0, 1, 2
+
+class _Target:
+    """单个群/用户的待发消息：每个优先级一条队列，共用一个令牌桶（无法识别目标的接口不限速）"""
+    __slots__ = ('bucket', 'lanes', 'state', 'token')
+
+    def __init__(self, bucket):
+        self.bucket = bucket
+        self.lanes = {p: deque() for p in _PRIORITIES}
+        self.state = _IDLE
+        self.token = 0      # 每次进入就绪队列时递增，就绪队列中过期的条目据此跳过
+
+    def head_priority(self):
+        return next((p for p in _PRIORITIES if self.lanes[p]), None)
+
+class OutboundDispatcher:
+    """出站消息调度器：按群/用户令牌桶限速 + 全局并发上限 + 优先级通道
+
+    提交立即返回 Future（结果为 BOTAPI 的原始响应）。消息按目标、优先级排队，目标有令牌时进入
+    所在最高优先级的就绪队列，发出时才占用令牌；同一目标总是先发被动回复，
+    有空闲并发槽时也总是先取有被动回复待发的目标，主动消息不会挤占回复。
+    """
+    __slots__ = ('_cond', '_targets', '_delayed', '_ready', '_queued', '_executor', '_thread', '_local',
+                 '_active', '_max_concurrency', '_stats', '_seq', '_last_prune', '_stopped')
+    _instance = None
+    _init_lock = threading.Lock()
+
+    @classmethod
+    def get_instance(cls):
+        if cls._instance is None:
+            with cls._init_lock:
+                if cls._instance is None:
+                    cls._instance = cls()
+        return cls._instance
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._targets = {}                              # (scope, target) -> _Target，无法识别目标时键为 None
+        self._delayed = []                              # (available_at, seq, key)，等待令牌的目标
+        self._ready = {p: deque() for p in _PRIORITIES}  # (key, token)，有令牌可发的目标
+        self._queued = dict.fromkeys(_PRIORITIES, 0)
+        self._max_concurrency = max(1, int(_CONFIG.get('max_concurrency', 16)))
+        self._executor = ThreadPoolExecutor(max_workers=self._max_concurrency, thread_name_prefix="SendWorker")
+        self._local = threading.local()
+        self._active = 0
+        self._seq = 0
+        self._last_prune = time.time()
+        self._stopped = False
+        self._stats = {'submitted': 0, 'completed': 0, 'failed': 0, 'throttled': 0,
+                       'max_active': 0, 'max_wait_ms': 0.0, 'total_wait_ms': 0.0}
+        self._thread = threading.Thread(target=self._run, daemon=True, name="SendDispatcher")
+        self._thread.start()
+        atexit.register(self.shutdown)
+
+    def submit(self, endpoint, method, data, group_id=None, priority=PRIORITY_REPLY):
+        """提交一次 BOTAPI(endpoint, method, data, group_id) 调用，返回 Future"""
+        future = Future()
+        with self._cond:
+            if self._stopped:
+                future.set_exception(RuntimeError("发送队列已关闭"))
+                return future
+            now = time.time()
+            key = self._target_key(endpoint)
+            target = self._targets.get(key)
+            if target is None:
+                target = self._targets[key] = _Target(self._new_bucket(key))
+            head = target.head_priority()
+            target.lanes[priority].append((endpoint, method, data, group_id, priority, future, now))
+            self._queued[priority] += 1
+            self._stats['submitted'] += 1
+            if target.state == _IDLE:
+                self._schedule(key, target, now)
+            elif target.state == _READY and priority < head:
+                # 已就绪的目标来了更高优先级的消息，改排入对应的就绪队列
+                self._mark_ready(key, target)
+            self._cond.notify()
+        return future
+
+    def in_worker(self):
+        """当前线程是否为发送工作线程（工作线程内不能同步等待新的发送任务，否则可能占满并发槽互相等待）"""
+        return getattr(self._local, 'worker', False)
+
+    @staticmethod
+    def _target_key(endpoint):
+        match = _TARGET_RE.match(endpoint or '')
+        if not match:
+            return None
+        return ('group' if match.group(1) in _GROUP_SCOPES else 'user', match.group(2))
+
+    @staticmethod
+    def _new_bucket(key):
+        if key is None:
+            return None
+        scope = key[0]
+        return _TokenBucket(_CONFIG.get(f'{scope}_rate', 5), _CONFIG.get(f'{scope}_burst', 5))
+
+    def _schedule(self, key, target, now):
+        """目标有待发消息时：令牌可用则进入就绪队列，否则按令牌可用时刻等待"""
+        available_at = target.bucket.available_at() if target.bucket else now
+        if available_at <= now:
+            self._mark_ready(key, target)
+            return
+        target.state = _WAITING
+        self._stats['throttled'] += 1
+        self._seq += 1
+        heapq.heappush(self._delayed, (available_at, self._seq, key))
+
+    def _mark_ready(self, key, target):
+        target.state = _READY
+        target.token += 1
+        self._ready[target.head_priority()].append((key, target.token))
+
+    def _next_ready(self):
+        for priority in _PRIORITIES:
+            ready = self._ready[priority]
+            while ready:
+                key, token = ready.popleft()
+                target = self._targets.get(key)
+                if target is not None and target.state == _READY and target.token == token:
+                    return key, target
+        return None, None
+
+    def _prune_targets(self, now):
+        # 空闲且令牌已回满的目标等同于新建，删除后按需重建，避免目标数无限增长
+        self._targets = {k: t for k, t in self._targets.items()
+                         if t.state != _IDLE or (t.bucket is not None and t.bucket.tat > now)}
+        self._last_prune = now
+
+    def _run(self):
+        while True:
+            batch = []
+            with self._cond:
+                while True:
+                    if self._stopped:
+                        return
+                    now = time.time()
+                    while self._delayed and self._delayed[0][0] <= now:
+                        key = heapq.heappop(self._delayed)[2]
+                        target = self._targets.get(key)
+                        if target is not None and target.state == _WAITING:
+                            self._mark_ready(key, target)
+                    while self._active < self._max_concurrency:
+                        key, target = self._next_ready()
+                        if target is None:
+                            break
+                        item = target.lanes[target.head_priority()].popleft()
+                        self._queued[item[4]] -= 1
+                        if target.bucket:
+                            target.bucket.take(now)
+                        if target.head_priority() is None:
+                            target.state = _IDLE
+                        else:
+                            self._schedule(key, target, now)
+                        batch.append(item)
+                        self._active += 1
+                    if batch:
+                        self._stats['max_active'] = max(self._stats['max_active'], self._active)
+                        break
+                    if now - self._last_prune >= _PRUNE_INTERVAL:
+                        self._prune_targets(now)
+                    timeout = min(self._delayed[0][0] - now, _PRUNE_INTERVAL) if self._delayed else _PRUNE_INTERVAL
+                    self._cond.wait(timeout)
+            for item in batch:
+                self._executor.submit(self._execute, item)
+
+    def _execute(self, item):
+        endpoint, method, data, group_id, priority, future, submitted_at = item
+        self._local.worker = True
+        wait_ms = (time.time() - submitted_at) * 1000
+        failed = False
+        try:
+            if future.set_running_or_notify_cancel():
+                from function.Access import BOTAPI
+                try:
+                    future.set_result(BOTAPI(endpoint, method, data, group_id=group_id))
+                except Exception as e:
+                    failed = True
+                    future.set_exception(e)
+        finally:
+            with self._cond:
+                self._active -= 1
+                self._stats['failed' if failed else 'completed'] += 1
+                self._stats['total_wait_ms'] += wait_ms
+                self._stats['max_wait_ms'] = max(self._stats['max_wait_ms'], wait_ms)
+                self._cond.notify()
+
+    def get_stats(self):
+        with self._cond:
+            stats = dict(self._stats)
+            stats['active'] = self._active
+            stats['queued_reply'] = self._queued[PRIORITY_REPLY]
+            stats['queued_proactive'] = self._queued[PRIORITY_PROACTIVE]
+            stats['delayed'] = len(self._delayed)
+            stats['buckets'] = len(self._targets)
+            done = stats['completed'] + stats['failed']
+            stats['avg_wait_ms'] = round(stats.pop('total_wait_ms') / done, 2) if done else 0.0
+            stats['max_wait_ms'] = round(stats['max_wait_ms'], 2)
+        return stats
+
+    def shutdown(self, timeout=_SHUTDOWN_TIMEOUT):
+        """等待已排队的消息发出（最多 timeout 秒），剩余任务以异常结束"""
+        deadline = time.time() + timeout
+        with self._cond:
+            if self._stopped:
+                return
+            while (self._active or any(self._queued.values())) and time.time() < deadline:
+                self._cond.wait(0.1)
+            self._stopped = True
+            pending = [item for target in self._targets.values() for lane in target.lanes.values() for item in lane]
+            self._targets.clear()
+            self._delayed.clear()
+            for ready in self._ready.values():
+                ready.clear()
+            self._cond.notify_all()
+        for item in pending:
+            if item[5].set_running_or_notify_cancel():
+                item[5].set_exception(RuntimeError("发送队列已关闭"))
+        if pending:
+            logger.warning(f"发送队列关闭时丢弃 {len(pending)} 条未发送消息")
+        # 此时已无进行中的任务，等待空闲工作线程退出，避免解释器退出阶段再回收线程池
+        self._executor.shutdown(wait=True)
+
+def send_queue_enabled():
+    return bool(_CONFIG.get('enabled', True))
+
+def get_outbound_dispatcher():
+    return OutboundDispatcher.get_instance()
+
+def submit_api(endpoint, method, data, group_id=None, priority=PRIORITY_REPLY):
+    """经发送队列调用 BOTAPI，返回 Future；未启用发送队列时在当前线程直接调用"""
+    if not send_queue_enabled():
+        future = Future()
+        try:
+            from function.Access import BOTAPI
+            future.set_result(BOTAPI(endpoint, method, data, group_id=group_id))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+    return get_outbound_dispatcher().submit(endpoint, method, data, group_id, priority)
+
+def in_send_worker():
+    dispatcher = OutboundDispatcher._instance
+    return dispatcher is not None and dispatcher.in_worker()
+
+def get_send_queue_stats():
+    if OutboundDispatcher._instance is None:
+        return None
+    return OutboundDispatcher._instance.get_stats()
+
+def shutdown_send_queue():
+    if OutboundDispatcher._instance is not None:
+        OutboundDispatcher._instance.shutdown()
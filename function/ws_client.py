@@ -1,9 +1,10 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
-import asyncio, json, time, logging, ssl, certifi, websockets, requests, sys, concurrent.futures
+import asyncio, json, time, logging, ssl, certifi, websockets, sys, random, concurrent.futures
 from contextlib import asynccontextmanager
 from function.Access import BOT凭证
+from function.httpx_pool import sync_get, sync_put
 from functools import lru_cache
 
 @lru_cache(maxsize=1)
@@ -59,6 +60,10 @@ _DEFAULT_INTENTS = Intent.GUILDS | Intent.GUILD_MESSAGE_REACTIONS | Intent.DIREC
 _DEFAULT_HEARTBEAT = 45000
 _GATEWAY_URL = "https://api.sgroup.qq.com/gateway/bot"
 _HANDLER_TYPES = frozenset({'message', 'connect', 'disconnect', 'error', 'ready'})
+_SHARD_START_INTERVAL = 5  # 多分片时每个分片的 IDENTIFY 间隔（秒）
+# 关闭码：会话失效需重新 IDENTIFY；机器人下线/封禁则停止重连
+_CLOSE_CODES_NO_RESUME = frozenset((4004, 4006, 4007, *range(4900, 4914)))
+_CLOSE_CODES_FATAL = frozenset((4914, 4915))
 
 @lru_cache(maxsize=1)
 def _get_ssl_context():
@@ -72,7 +77,7 @@ def _ack_interaction(interaction_id):
         return
     try:
         token = BOT凭证()
-        requests.put(
+        sync_put(
             f"https://api.sgroup.qq.com/interactions/{interaction_id}",
             headers={"Authorization": f"QQBot {token}", "Content-Type": "application/json"},
             json={"code": 0},
@@ -84,7 +89,7 @@ def _ack_interaction(interaction_id):
 class WebSocketClient:
     __slots__ = ('name', 'config', 'websocket', 'connected', 'running', 'reconnect_count',
                  'last_heartbeat', 'heartbeat_interval', 'heartbeat_task', 'session_id',
-                 'last_seq', 'is_custom_mode', 'handlers', 'stats', 'intents')
+                 'last_seq', 'is_custom_mode', 'handlers', 'stats', 'intents', 'shard')
     
     def __init__(self, name="default", config=None):
         self.name = name
@@ -100,8 +105,10 @@ class WebSocketClient:
         self.last_seq = 0
         self.is_custom_mode = self.config.get('custom_mode', False)
         self.handlers = {t: [] for t in _HANDLER_TYPES}
-        self.stats = {'start_time': 0, 'received_messages': 0, 'sent_messages': 0, 'heartbeat_count': 0, 'reconnect_count': 0}
+        self.stats = {'start_time': 0, 'received_messages': 0, 'sent_messages': 0, 'heartbeat_count': 0, 'reconnect_count': 0,
+                      'resume_count': 0, 'identify_count': 0, 'invalid_session_count': 0}
         self.intents = _DEFAULT_INTENTS
+        self.shard = list(self.config.get('shard') or (0, 1))
         log_level = self.config.get('log_level')
         if log_level:
             logger.setLevel(getattr(logging, log_level.upper(), logging.INFO))
@@ -186,20 +193,49 @@ class WebSocketClient:
     async def send_message(self, message):
         return await self._send(message)
     
+    def _get_token(self):
+        return self.config.get('token') or BOT凭证()
+    
     async def send_identify(self):
-        token = BOT凭证()
+        token = self._get_token()
         if not token:
             return False
+        self.stats['identify_count'] += 1
         return await self._send({
             "op": _OP_IDENTIFY,
             "d": {
                 "token": f"QQBot {token}",
                 "intents": self.intents,
-                "shard": [0, 1],
+                "shard": self.shard,
                 "properties": {"$os": "python", "$browser": "elaina-bot", "$device": "elaina-bot"}
             }
         })
     
+    async def send_resume(self):
+        token = self._get_token()
+        if not token:
+            return False
+        self.stats['resume_count'] += 1
+        return await self._send({
+            "op": _OP_RESUME,
+            "d": {"token": f"QQBot {token}", "session_id": self.session_id, "seq": self.last_seq}
+        })
+    
+    def _reset_session(self):
+        self.session_id = None
+        self.last_seq = 0
+    
+    async def _close_for_reconnect(self):
+        """主动断开当前连接，由 start() 的重连循环重新建立连接"""
+        self.connected = False
+        if self.heartbeat_task and not self.heartbeat_task.done():
+            self.heartbeat_task.cancel()
+        if self.websocket:
+            try:
+                await self.websocket.close()
+            except:
+                pass
+    
     async def send_heartbeat(self):
         if await self._send({"op": _OP_HEARTBEAT, "d": self.last_seq}):
             self.last_heartbeat = time.time()
@@ -242,21 +278,31 @@ class WebSocketClient:
                 self.last_seq = seq
             if op == _OP_HELLO:
                 self.heartbeat_interval = data.get('d', {}).get('heartbeat_interval', _DEFAULT_HEARTBEAT)
-                if await self.send_identify():
+                # 有会话则 RESUME 补发断线期间的事件，否则重新 IDENTIFY
+                sent = await self.send_resume() if self.session_id else await self.send_identify()
+                if sent:
                     await self.start_heartbeat()
                 else:
-                    self.connected = False
+                    await self._close_for_reconnect()
             elif op == _OP_RECONNECT:
-                self.connected = False
+                await self._close_for_reconnect()
             elif op == _OP_INVALID_SESSION:
-                self.session_id = None
-                self.connected = False
+                self.stats['invalid_session_count'] += 1
+                if data.get('d'):
+                    await self._close_for_reconnect()
+                else:
+                    self._reset_session()
+                    await asyncio.sleep(self.config.get('invalid_session_delay', random.uniform(1, 5)))
+                    if not await self.send_identify():
+                        await self._close_for_reconnect()
             elif op == _OP_DISPATCH:
                 event_type = data.get('t')
                 event_data = data.get('d')
                 if event_type == "READY":
                     self.session_id = event_data.get('session_id')
                     await self._call_handlers('ready', {'session_id': self.session_id, 'bot_info': event_data.get('user', {}), 'data': event_data})
+                elif event_type == "RESUMED":
+                    logger.info(f"[{self.name}] 会话已恢复: session_id={self.session_id}, seq={self.last_seq}")
                 elif event_type in _get_supported_event_types():
                     if event_type == "INTERACTION_CREATE" and event_data:
                         _ack_interaction(event_data.get('id'))
@@ -270,8 +316,15 @@ class WebSocketClient:
                 if not self.running:
                     break
                 await self._process_message(message)
-        except websockets.exceptions.ConnectionClosed:
             self.connected = False
+        except websockets.exceptions.ConnectionClosed as e:
+            self.connected = False
+            code = e.rcvd.code if e.rcvd else None
+            if code in _CLOSE_CODES_FATAL:
+                logger.error(f"[{self.name}] 网关关闭连接({code})，机器人已下线或被封禁，停止重连")
+                self.running = False
+            elif code in _CLOSE_CODES_NO_RESUME:
+                self._reset_session()
         except:
             self.connected = False
 
@@ -279,6 +332,13 @@ class WebSocketClient:
         self.running = True
         max_reconnects = self.config.get('max_reconnects', -1)
         reconnect_interval = self.config.get('reconnect_interval', 5)
+        start_delay = self.config.get('start_delay', 0)
+        if start_delay:
+            try:
+                await asyncio.sleep(start_delay)
+            except asyncio.CancelledError:
+                self.running = False
+                return
         while self.running:
             try:
                 if not self.connected:
@@ -312,7 +372,7 @@ class WebSocketClient:
     
     def get_stats(self):
         uptime = time.time() - self.stats['start_time'] if self.stats['start_time'] > 0 else 0
-        return {**self.stats, 'uptime': uptime, 'connected': self.connected, 'running': self.running,
+        return {**self.stats, 'uptime': uptime, 'connected': self.connected, 'running': self.running, 'shard': self.shard,
                 'session_id': self.session_id, 'last_seq': self.last_seq, 'heartbeat_interval': self.heartbeat_interval}
 
 class WebSocketManager:
@@ -353,6 +413,10 @@ class QQBotWSManager:
         self.config = config
     
     def get_gateway_url(self):
+        return self.get_gateway_info()['url']
+    
+    def get_gateway_info(self):
+        """获取网关地址及推荐分片数: {'url': ..., 'shards': ...}"""
         token = BOT凭证()
         if not token:
             raise Exception("BOT凭证获取失败")
@@ -366,11 +430,11 @@ class QQBotWSManager:
                 last_error = None
                 for attempt in range(3):
                     try:
-                        resp = requests.get(sandbox_gateway, headers=headers, timeout=30)
+                        resp = sync_get(sandbox_gateway, headers=headers, timeout=30)
                         if resp.status_code == 200:
-                            url = resp.json().get('url')
-                            if url:
-                                return url
+                            info = resp.json()
+                            if info.get('url'):
+                                return {'url': info['url'], 'shards': info.get('shards') or 1}
                         try:
                             resp_data = resp.json()
                         except Exception:
@@ -390,11 +454,11 @@ class QQBotWSManager:
         last_error = None
         for attempt in range(3):
             try:
-                resp = requests.get(_GATEWAY_URL, headers=headers, timeout=30)
+                resp = sync_get(_GATEWAY_URL, headers=headers, timeout=30)
                 if resp.status_code == 200:
-                    url = resp.json().get('url')
-                    if url:
-                        return url
+                    info = resp.json()
+                    if info.get('url'):
+                        return {'url': info['url'], 'shards': info.get('shards') or 1}
                 try:
                     resp_data = resp.json()
                 except Exception:
@@ -406,17 +470,33 @@ class QQBotWSManager:
                 time.sleep(3 + attempt)
         raise Exception(last_error or "获取网关地址失败")
     
-    async def create_client(self, name="qq_bot"):
-        url = self.config.get('custom_url') or self.get_gateway_url()
-        if not url:
-            return None
-        return WebSocketClient(name, {
+    def _client_config(self, url, shard=(0, 1)):
+        return {
             'url': url,
+            'shard': list(shard),
+            'start_delay': shard[0] * _SHARD_START_INTERVAL,
             'reconnect_interval': self.config.get('reconnect_interval', 5),
             'max_reconnects': self.config.get('max_reconnects', -1),
             'log_level': self.config.get('log_level', 'INFO'),
             'log_message_content': self.config.get('log_message_content', False),
-        })
+        }
+    
+    async def create_client(self, name="qq_bot"):
+        url = self.config.get('custom_url') or self.get_gateway_url()
+        if not url:
+            return None
+        return WebSocketClient(name, self._client_config(url))
+    
+    async def create_shard_clients(self, name="qq_bot"):
+        """按 shards 配置创建分片客户端，shards 为 'auto' 时使用网关推荐值；分片0沿用 name"""
+        shards = self.config.get('shards', 1)
+        if self.config.get('custom_url'):
+            url, recommended = self.config['custom_url'], 1
+        else:
+            info = self.get_gateway_info()
+            url, recommended = info['url'], info['shards']
+        total = max(1, int(recommended if shards == 'auto' else shards or 1))
+        return [WebSocketClient(name if i == 0 else f"{name}#{i}", self._client_config(url, (i, total))) for i in range(total)]
 
 _manager = WebSocketManager()
 
@@ -433,6 +513,15 @@ async def create_qq_bot_client(config, name="qq_bot"):
         _manager.add_client(name, client)
     return client
 
+async def create_qq_bot_clients(config, name="qq_bot"):
+    clients = await QQBotWSManager(config).create_shard_clients(name)
+    for client in clients:
+        _manager.add_client(client.name, client)
+    return clients
+
+def get_shard_clients(name="qq_bot"):
+    return [c for n, c in _manager.clients.items() if n == name or n.startswith(f"{name}#")]
+
 def create_custom_ws_client(ws_url, name="custom_ws", config=None):
     cfg = config or {}
     cfg.update({
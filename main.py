@@ -164,6 +164,7 @@ from flask_socketio import SocketIO
 from config import LOG_DB_CONFIG, WEBSOCKET_CONFIG, SERVER_CONFIG, WEB_CONFIG
 from function.Access import BOT凭证, BOTAPI, Json取, Json
 from function.httpx_pool import get_pool_manager
+from function.ingest_pipeline import submit_ingest_task
 
 warnings.filterwarnings("ignore", category=UserWarning)
 warnings.filterwarnings("ignore", category=DeprecationWarning)
@@ -307,7 +308,9 @@ def create_app():
                 'headers': dict(request.headers)
             }
             
-            _message_executor.submit(process_message_event, data.decode(), http_ctx)
+            from config import SAVE_RAW_MESSAGE_TO_DB
+            raw_text = data.decode() if SAVE_RAW_MESSAGE_TO_DB else None
+            _message_executor.submit(process_message_event, json_data, http_ctx, raw_text)
             return "OK"
         elif op == 13:
             from function.sign import Signs
@@ -317,7 +320,7 @@ def create_app():
     log_to_console("📦 Flask应用创建成功")
     return flask_app
 
-def process_message_event(data, http_context=None):
+def process_message_event(data, http_context=None, raw_text=None):
     if not data:
         return False
     
@@ -329,7 +332,7 @@ def process_message_event(data, http_context=None):
         from core.event.MessageEvent import MessageEvent
         from core.plugin.PluginManager import PluginManager
         
-        event = MessageEvent(data, http_context=http_context)
+        event = MessageEvent(data, http_context=http_context, raw_text=raw_text)
         if event.ignore:
             del event
             return False
@@ -342,7 +345,7 @@ def process_message_event(data, http_context=None):
         except:
             pass
         
-        def async_db_tasks():
+        def async_db_tasks(event):
             try:
                 if not event.skip_recording:
                     event._record_user_and_group()
@@ -350,9 +353,10 @@ def process_message_event(data, http_context=None):
                 event.record_last_message_id()
             except:
                 pass
+            cleanup_gc()
         
-        import threading
-        threading.Thread(target=async_db_tasks, daemon=True).start()
+        # 同一群/用户的入库任务由同一工作线程按序执行；event 作为参数传入，下方 del 后任务仍持有引用
+        submit_ingest_task(event.group_id or event.user_id, async_db_tasks, event)
         
         try:
             PluginManager.dispatch_message(event)
@@ -360,7 +364,6 @@ def process_message_event(data, http_context=None):
             log_error(f"插件处理失败: {str(e)}")
         
         del event, data
-        cleanup_gc()
         return False
     except Exception as e:
         log_error(f"消息处理异常: {str(e)}")
@@ -373,19 +376,21 @@ async def handle_ws_message(raw_data):
         _message_executor = ThreadPoolExecutor(max_workers=100, thread_name_prefix="MsgHandler")
     _message_executor.submit(process_message_event, raw_data)
 
-async def create_websocket_client():
-    from function.ws_client import create_qq_bot_client
+async def create_websocket_clients():
+    from function.ws_client import create_qq_bot_clients
     log_to_console("正在获取网关地址...")
-    client = await create_qq_bot_client(WEBSOCKET_CONFIG)
-    if not client:
+    clients = await create_qq_bot_clients(WEBSOCKET_CONFIG)
+    if not clients:
         raise Exception("无法获取网关地址或创建客户端")
-    log_to_console("正在配置事件处理器...")
-    client.add_handler('message', handle_ws_message)
-    client.add_handler('connect', lambda d: log_to_console("WebSocket连接已建立"))
-    client.add_handler('disconnect', lambda d: log_to_console("WebSocket连接已断开"))
-    client.add_handler('error', lambda d: log_error(f"WebSocket错误: {d.get('error', '')}"))
-    client.add_handler('ready', lambda d: log_to_console(f"WebSocket已就绪 - Bot: {d.get('bot_info', {}).get('username', '二次转发接收模式')}"))
-    return client
+    log_to_console(f"正在配置事件处理器... (分片数: {len(clients)})")
+    for client in clients:
+        name = client.name
+        client.add_handler('message', handle_ws_message)
+        client.add_handler('connect', lambda d, n=name: log_to_console(f"WebSocket连接已建立 [{n}]"))
+        client.add_handler('disconnect', lambda d, n=name: log_to_console(f"WebSocket连接已断开 [{n}]"))
+        client.add_handler('error', lambda d: log_error(f"WebSocket错误: {d.get('error', '')}"))
+        client.add_handler('ready', lambda d: log_to_console(f"WebSocket已就绪 - Bot: {d.get('bot_info', {}).get('username', '二次转发接收模式')}"))
+    return clients
 
 def run_websocket_client():
     import asyncio
@@ -394,14 +399,14 @@ def run_websocket_client():
     
     for attempt in range(3):
         loop = None
-        client = None
+        clients = None
         try:
             loop = asyncio.new_event_loop()
             asyncio.set_event_loop(loop)
             log_to_console(f"正在创建WebSocket客户端...")
-            client = loop.run_until_complete(create_websocket_client())
+            clients = loop.run_until_complete(create_websocket_clients())
             log_to_console("WebSocket客户端已创建，开始连接...")
-            loop.run_until_complete(client.start())
+            loop.run_until_complete(asyncio.gather(*(c.start() for c in clients)))
             log_to_console("WebSocket客户端连接成功")
             break
         except KeyboardInterrupt:
@@ -414,8 +419,8 @@ def run_websocket_client():
                 time.sleep(10)
         finally:
             try:
-                if client:
-                    del client
+                if clients:
+                    del clients
                 if loop:
                     try:
                         pending = asyncio.all_tasks(loop)
@@ -458,6 +463,10 @@ def init_systems(is_subprocess=False):
             Database()
             log_to_console("💾 数据库系统初始化成功")
             
+            # 启动延时任务调度器，恢复上次关闭时未执行的自动撤回等任务
+            from function.delayed_tasks import get_delayed_task_scheduler
+            get_delayed_task_scheduler()
+            
             try:
                 from function.redis_pool import init_redis
                 status, message = init_redis()
@@ -505,6 +514,10 @@ wsgi_app = initialize_app()
 def signal_handler(signum, frame):
     if _dau_available:
         stop_dau_analytics()
+    from function.delayed_tasks import shutdown_delayed_tasks
+    shutdown_delayed_tasks()
+    from function.send_dispatcher import shutdown_send_queue
+    shutdown_send_queue()
     sys.exit(0)
 
 def start_main_process():
@@ -7,19 +7,22 @@ import datetime
 from config import LOG_DB_CONFIG, USE_MARKDOWN, OWNER_IDS, SERVER_CONFIG, ROBOT_QQ, appid, WEB_CONFIG
 import traceback
 from function.httpx_pool import sync_get, get_json
-from function.database import Database
 
 import os
 import sys
 import platform
 import re
 
-from function.log_db import LogDatabasePool
+from function.log_db import (get_day_log_source, get_log_table_name, execute_log_query,
+    execute_log_queries_concurrent)
 from core.plugin.PluginManager import PluginManager
 from web.tools.bot_restart import execute_bot_restart
 
 logger = logging.getLogger('user_stats')
 
+_TABLE_EXISTS_SQL = "SELECT COUNT(*) as count FROM information_schema.tables WHERE table_schema = DATABASE() AND table_name = %s"
+_SCAN_QUERY_TIMEOUT = 10
+
 BLACKLIST_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "data", "blacklist.json")
 GROUP_BLACKLIST_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "data", "group_blacklist.json")
 
@@ -304,163 +307,107 @@ class system_plugin(Plugin):
             event.reply(f"<@{event.user_id}>\n❌ {display_date} 的DAU数据未生成或无该日期数据")
             return
         
-        log_db_pool = LogDatabasePool()
-        connection = log_db_pool.get_connection()
+        stats = cls._get_rollup_dau_stats(target_date, yesterday_str, current_hour, current_minute)
+        if stats:
+            cls._send_realtime_dau(event, stats, date_str, yesterday_str, current_hour, current_minute, start_time, '增量汇总')
+            return
         
-        if not connection:
+        stats = cls._get_scan_dau_stats(target_date, date_str, yesterday_str, current_hour, current_minute)
+        if stats is None:
             event.reply("无法连接到日志数据库，请稍后再试")
             return
-        
-        cursor = connection.cursor()
-        table_prefix = LOG_DB_CONFIG['table_prefix']
-        table_name = f"{table_prefix}{date_str}_message"
-        
-        check_query = """
-            SELECT COUNT(*) as count 
-            FROM information_schema.tables 
-            WHERE table_schema = DATABASE() 
-            AND table_name = %s
-        """
-        
-        cursor.execute(check_query, (table_name,))
-        result = cursor.fetchone()
-        if not result or result['count'] == 0:
+        if not stats:
             display_date = f"{date_str[4:6]}-{date_str[6:8]}"
             event.reply(f"该日期({display_date})无消息记录")
             return
+        cls._send_realtime_dau(event, stats, date_str, yesterday_str, current_hour, current_minute, start_time, '实时数据库查询')
+    
+    @classmethod
+    def _get_scan_dau_stats(cls, target_date, date_str, yesterday_str, current_hour, current_minute):
+        """增量汇总不完整时（如首次启用当天）扫描今日消息表，返回 None 表示无法查询、False 表示无消息表
         
-        time_condition = ""
-        if current_hour is not None and current_minute is not None:
-            time_limit = f"{current_hour:02d}:{current_minute:02d}:00"
-            time_condition = f" WHERE TIME(timestamp) <= '{time_limit}'"
-        
-        total_messages_query = f"SELECT COUNT(*) as count FROM {table_name}{time_condition}"
-        cursor.execute(total_messages_query)
-        total_messages_result = cursor.fetchone()
-        total_messages = total_messages_result['count'] if total_messages_result else 0
-        
-        unique_users_query = f"SELECT COUNT(DISTINCT user_id) as count FROM {table_name}{time_condition}"
-        unique_users_query += " AND user_id IS NOT NULL AND user_id != ''" if time_condition else " WHERE user_id IS NOT NULL AND user_id != ''"
-        cursor.execute(unique_users_query)
-        unique_users_result = cursor.fetchone()
-        unique_users = unique_users_result['count'] if unique_users_result else 0
-        
-        unique_groups_query = f"SELECT COUNT(DISTINCT group_id) as count FROM {table_name}{time_condition}"
-        unique_groups_query += " AND group_id != 'c2c' AND group_id IS NOT NULL AND group_id != ''" if time_condition else " WHERE group_id != 'c2c' AND group_id IS NOT NULL AND group_id != ''"
-        cursor.execute(unique_groups_query)
-        unique_groups_result = cursor.fetchone()
-        unique_groups = unique_groups_result['count'] if unique_groups_result else 0
-        
-        private_messages_query = f"SELECT COUNT(*) as count FROM {table_name}{time_condition}"
-        private_messages_query += " AND group_id = 'c2c'" if time_condition else " WHERE group_id = 'c2c'"
-        cursor.execute(private_messages_query)
-        private_messages_result = cursor.fetchone()
-        private_messages = private_messages_result['count'] if private_messages_result else 0
-        
-        active_groups_query = f"""
-            SELECT group_id, COUNT(*) as msg_count 
-            FROM {table_name}{time_condition}
-            """
-        active_groups_query += " AND group_id != 'c2c' AND group_id IS NOT NULL AND group_id != ''" if time_condition else " WHERE group_id != 'c2c' AND group_id IS NOT NULL AND group_id != ''"
-        active_groups_query += """
-            GROUP BY group_id 
-            ORDER BY msg_count DESC 
-            LIMIT 2
-        """
-        cursor.execute(active_groups_query)
-        active_groups_result = cursor.fetchall()
-        
-        active_users_query = f"""
-            SELECT user_id, COUNT(*) as msg_count 
-            FROM {table_name}{time_condition}
-            """
-        active_users_query += " AND user_id IS NOT NULL AND user_id != ''" if time_condition else " WHERE user_id IS NOT NULL AND user_id != ''"
-        active_users_query += """
-            GROUP BY user_id 
-            ORDER BY msg_count DESC 
-            LIMIT 2
+        按 timestamp 范围过滤以使用时间索引，各统计合并为 4 条查询在日志库共享线程池上并发执行；
+        昨日同时段对比改由汇总读取，不再扫描昨日消息表。
         """
-        cursor.execute(active_users_query)
-        active_users_result = cursor.fetchall()
-        
-        hourly_stats_query = f"""
-            SELECT HOUR(timestamp) as hour, COUNT(*) as count 
-            FROM {table_name}{time_condition} 
-            GROUP BY HOUR(timestamp) 
-            ORDER BY hour
-        """
-        cursor.execute(hourly_stats_query)
-        hourly_stats_result = cursor.fetchall()
-        
+        exists = execute_log_query(_TABLE_EXISTS_SQL, (get_log_table_name('message', date_str),))
+        if exists is None:
+            return None
+        if not exists['count']:
+            return False
+        
+        source = get_day_log_source('message', date_str)
+        day_start = target_date.strftime('%Y-%m-%d 00:00:00')
+        if current_hour is not None and current_minute is not None:
+            day_end = (target_date.replace(hour=current_hour, minute=current_minute, second=0, microsecond=0)
+                       + datetime.timedelta(minutes=1)).strftime('%Y-%m-%d %H:%M:%S')
+        else:
+            day_end = (target_date + datetime.timedelta(days=1)).strftime('%Y-%m-%d 00:00:00')
+        time_condition = "WHERE timestamp >= %s AND timestamp < %s"
+        time_params = (day_start, day_end)
+        
+        summary, hourly_rows, top_groups, top_users = execute_log_queries_concurrent([
+            (f"""SELECT COUNT(*) as total_messages,
+                    COUNT(DISTINCT CASE WHEN user_id IS NOT NULL AND user_id != '' THEN user_id END) as unique_users,
+                    COUNT(DISTINCT CASE WHEN group_id != 'c2c' AND group_id IS NOT NULL AND group_id != '' THEN group_id END) as unique_groups,
+                    SUM(CASE WHEN group_id = 'c2c' THEN 1 ELSE 0 END) as private_messages
+                FROM {source} {time_condition}""", time_params, False),
+            (f"SELECT HOUR(timestamp) as hour, COUNT(*) as count FROM {source} {time_condition} GROUP BY HOUR(timestamp)", time_params, True),
+            (f"""SELECT group_id, COUNT(*) as msg_count FROM {source} {time_condition}
+                AND group_id != 'c2c' AND group_id IS NOT NULL AND group_id != ''
+                GROUP BY group_id ORDER BY msg_count DESC LIMIT 2""", time_params, True),
+            (f"""SELECT user_id, COUNT(*) as msg_count FROM {source} {time_condition}
+                AND user_id IS NOT NULL AND user_id != ''
+                GROUP BY user_id ORDER BY msg_count DESC LIMIT 2""", time_params, True)
+        ], timeout=_SCAN_QUERY_TIMEOUT)
+        
+        summary = summary or {}
         hours_data = {i: 0 for i in range(24)}
-        if hourly_stats_result:
-            for row in hourly_stats_result:
-                hour = row['hour']
-                count = row['count']
-                hours_data[hour] = count
-        
-        most_active_hour = max(hours_data.items(), key=lambda x: x[1]) if hours_data else (0, 0)
+        for row in hourly_rows or []:
+            hours_data[int(row['hour'])] = row['count']
         
+        return {
+            'total_messages': int(summary.get('total_messages') or 0), 'unique_users': int(summary.get('unique_users') or 0),
+            'unique_groups': int(summary.get('unique_groups') or 0), 'private_messages': int(summary.get('private_messages') or 0),
+            'most_active_hour': max(hours_data.items(), key=lambda x: x[1]), 'event_stats': cls._get_event_stats(target_date),
+            'yesterday_data': cls._get_yesterday_totals(yesterday_str, current_hour, current_minute),
+            'active_groups': top_groups or [], 'active_users': top_users or []
+        }
+    
+    @staticmethod
+    def _get_yesterday_totals(yesterday_str, current_hour, current_minute):
+        """昨日同时段累计值：取自内存增量汇总，或小时汇总表的主键查询"""
+        if not yesterday_str or current_hour is None or current_minute is None:
+            return None
+        from function.dau_rollup import get_dau_rollup
+        totals = get_dau_rollup().get_totals_until(datetime.datetime.strptime(yesterday_str, '%Y%m%d'), current_hour * 60 + current_minute)
+        if not totals:
+            return None
+        return {
+            'total_messages': totals['total_messages'], 'unique_users': totals['active_users'],
+            'unique_groups': totals['active_groups'], 'private_messages': totals['private_messages']
+        }
+    
+    @staticmethod
+    def _get_event_stats(target_date):
         event_stats = {'group_join_count': 0, 'group_leave_count': 0, 'friend_add_count': 0, 'friend_remove_count': 0}
-        if is_today:
-            dau_table_name = f"{table_prefix}dau"
-            cursor.execute(f"""
-                SELECT COUNT(*) as count 
-                FROM information_schema.tables 
-                WHERE table_schema = DATABASE() 
-                AND table_name = %s
-            """, (dau_table_name,))
-            dau_table_exists = cursor.fetchone()
-            
-            if dau_table_exists and dau_table_exists['count'] > 0:
-                cursor.execute(f"""
-                    SELECT group_join_count, group_leave_count, friend_add_count, friend_remove_count
-                    FROM {dau_table_name}
-                    WHERE date = %s
-                """, (target_date.strftime('%Y-%m-%d'),))
-                dau_result = cursor.fetchone()
-                
-                if dau_result:
-                    event_stats['group_join_count'] = dau_result.get('group_join_count', 0)
-                    event_stats['group_leave_count'] = dau_result.get('group_leave_count', 0)
-                    event_stats['friend_add_count'] = dau_result.get('friend_add_count', 0)
-                    event_stats['friend_remove_count'] = dau_result.get('friend_remove_count', 0)
-        
+        try:
+            from function.dau_analytics import get_dau_analytics
+            saved = get_dau_analytics().load_dau_data(target_date)
+            if saved:
+                event_stats.update({k: saved.get('event_stats', {}).get(k, 0) for k in event_stats})
+        except:
+            pass
+        return event_stats
+    
+    @classmethod
+    def _send_realtime_dau(cls, event, stats, date_str, yesterday_str, current_hour, current_minute, start_time, data_source):
+        total_messages, unique_users = stats['total_messages'], stats['unique_users']
+        unique_groups, private_messages = stats['unique_groups'], stats['private_messages']
+        most_active_hour, event_stats = stats['most_active_hour'], stats['event_stats']
+        yesterday_data = stats['yesterday_data']
+        active_groups_result, active_users_result = stats['active_groups'], stats['active_users']
         display_date = f"{date_str[4:6]}-{date_str[6:8]}"
         
-        yesterday_data = None
-        if yesterday_str and current_hour is not None and current_minute is not None:
-            yesterday_table = f"{table_prefix}{yesterday_str}_message"
-            cursor.execute(check_query, (yesterday_table,))
-            y_result = cursor.fetchone()
-            
-            if y_result and y_result['count'] > 0:
-                time_limit = f"{current_hour:02d}:{current_minute:02d}:00"
-                y_time_condition = f" WHERE TIME(timestamp) <= '{time_limit}'"
-                yesterday_data = {}
-                
-                cursor.execute(f"SELECT COUNT(*) as count FROM {yesterday_table}{y_time_condition}")
-                y_total = cursor.fetchone()
-                yesterday_data['total_messages'] = y_total['count'] if y_total else 0
-                
-                y_users_query = f"SELECT COUNT(DISTINCT user_id) as count FROM {yesterday_table}{y_time_condition}"
-                y_users_query += " AND user_id IS NOT NULL AND user_id != ''"
-                cursor.execute(y_users_query)
-                y_users = cursor.fetchone()
-                yesterday_data['unique_users'] = y_users['count'] if y_users else 0
-                
-                y_groups_query = f"SELECT COUNT(DISTINCT group_id) as count FROM {yesterday_table}{y_time_condition}"
-                y_groups_query += " AND group_id != 'c2c' AND group_id IS NOT NULL AND group_id != ''"
-                cursor.execute(y_groups_query)
-                y_groups = cursor.fetchone()
-                yesterday_data['unique_groups'] = y_groups['count'] if y_groups else 0
-                
-                y_private_query = f"SELECT COUNT(*) as count FROM {yesterday_table}{y_time_condition}"
-                y_private_query += " AND group_id = 'c2c'"
-                cursor.execute(y_private_query)
-                y_private = cursor.fetchone()
-                yesterday_data['private_messages'] = y_private['count'] if y_private else 0
-        
         info = [
             f'<@{event.user_id}>',
             f'📊 {display_date} 活跃统计' + (f' (截至{current_hour:02d}:{current_minute:02d})' if current_hour is not None else '')
@@ -491,7 +438,7 @@ class system_plugin(Plugin):
         
         info.append(f'⏰ 最活跃时段: {most_active_hour[0]}点 ({most_active_hour[1]})')
         
-        if is_today and event_stats and any(event_stats.values()):
+        if event_stats and any(event_stats.values()):
             info.append(f'📈 今日事件统计:')
             group_join = event_stats["group_join_count"]
             group_leave = event_stats["group_leave_count"]
@@ -527,7 +474,7 @@ class system_plugin(Plugin):
         
         query_time = round((time.time() - start_time) * 1000)
         info.append(f'🕒 查询耗时: {query_time}ms')
-        info.append(f'📁 数据源: 实时数据库查询')
+        info.append(f'📁 数据源: {data_source}')
         
         if USE_MARKDOWN:
             button_configs = [
@@ -541,11 +488,26 @@ class system_plugin(Plugin):
             event.reply('\n'.join(info), buttons, hide_avatar_and_center=True)
         else:
             event.reply('\n'.join(info))
+    
+    @classmethod
+    def _get_rollup_dau_stats(cls, target_date, yesterday_str, current_hour, current_minute):
+        """从 DAU 增量汇总读取今日数据，汇总不完整时返回 None 回退到扫表"""
+        from function.dau_rollup import get_dau_rollup
+        message_stats = get_dau_rollup().get_message_stats(target_date)
+        if not message_stats:
+            return None
+        
+        hourly = message_stats['hourly']
+        most_active_hour = max(enumerate(hourly), key=lambda x: x[1])
         
-        if cursor:
-            cursor.close()
-        if connection:
-            log_db_pool.release_connection(connection)
+        return {
+            'total_messages': message_stats['total_messages'], 'unique_users': message_stats['active_users'],
+            'unique_groups': message_stats['active_groups'], 'private_messages': message_stats['private_messages'],
+            'most_active_hour': most_active_hour, 'event_stats': cls._get_event_stats(target_date),
+            'yesterday_data': cls._get_yesterday_totals(yesterday_str, current_hour, current_minute),
+            'active_groups': [{'group_id': g['group_id'], 'msg_count': g['message_count']} for g in message_stats['top_groups'][:2]],
+            'active_users': [{'user_id': u['user_id'], 'msg_count': u['message_count']} for u in message_stats['top_users'][:2]]
+        }
     
     @classmethod
     def _send_dau_from_database(cls, event, dau_data, target_date, start_time):
@@ -630,7 +592,7 @@ class system_plugin(Plugin):
             (f"SELECT COUNT(*) as count FROM {prefix}groups_users", None, False),
             (f"SELECT COUNT(*) as count FROM {prefix}members", None, False),
             (f"""
-                SELECT group_id, JSON_LENGTH(users) as member_count
+                SELECT group_id, member_count
                 FROM {prefix}groups_users
                 ORDER BY member_count DESC
                 LIMIT 1
@@ -642,46 +604,18 @@ class system_plugin(Plugin):
     def _get_group_info_params(cls, group_id):
         prefix = LOG_DB_CONFIG['table_prefix']
         return [
-            (f"SELECT users FROM {prefix}groups_users WHERE group_id = %s", (group_id,), False),
+            (f"SELECT member_count FROM {prefix}groups_users WHERE group_id = %s", (group_id,), False),
             (f"""
-                SELECT group_id, JSON_LENGTH(users) as member_count
+                SELECT COUNT(*) + 1 as group_rank
                 FROM {prefix}groups_users
-                ORDER BY member_count DESC
-            """, None, True)
+                WHERE member_count > (SELECT member_count FROM {prefix}groups_users WHERE group_id = %s)
+            """, (group_id,), False)
         ]
     
     @classmethod
     def _execute_log_db_queries(cls, query_list):
-        """使用日志数据库执行并发查询"""
-        from concurrent.futures import ThreadPoolExecutor, as_completed
-        log_db_pool = LogDatabasePool()
-        
-        def execute_single_query(query_info):
-            sql, params, fetch_all = query_info[0], query_info[1], query_info[2] if len(query_info) > 2 else False
-            connection = log_db_pool.get_connection()
-            if not connection:
-                return None
-            try:
-                cursor = connection.cursor()
-                cursor.execute(sql, params)
-                result = cursor.fetchall() if fetch_all else cursor.fetchone()
-                cursor.close()
-                return result
-            except Exception as e:
-                logger.error(f"查询失败: {e}")
-                return None
-            finally:
-                log_db_pool.release_connection(connection)
-        
-        with ThreadPoolExecutor(max_workers=len(query_list)) as executor:
-            futures = [executor.submit(execute_single_query, query) for query in query_list]
-            results = []
-            for future in futures:
-                try:
-                    results.append(future.result(timeout=3.0))
-                except:
-                    results.append(None)
-            return results
+        """使用日志数据库执行并发查询（共享日志连接池的线程池）"""
+        return execute_log_queries_concurrent(query_list)
     
     @classmethod
     def _process_result(cls, results):
@@ -716,19 +650,8 @@ class system_plugin(Plugin):
     
     @classmethod
     def _process_group_results(cls, results, group_id):
-        group_members = 0
-        if results[0] and results[0].get('users'):
-            users = results[0]['users']
-            if isinstance(users, str):
-                users = json.loads(users)
-            group_members = len(users)
-        
-        group_rank = 'N/A'
-        if results[1]:
-            for i, group in enumerate(results[1], 1):
-                if group.get('group_id') == group_id:
-                    group_rank = i
-                    break
+        group_members = results[0].get('member_count', 0) if results[0] else 0
+        group_rank = results[1]['group_rank'] if results[0] and results[1] else 'N/A'
         
         return {
             'member_count': group_members,
@@ -831,55 +754,31 @@ class system_plugin(Plugin):
     
     @staticmethod
     def fill_user_names(event):
-        start_time = time.time()
-        db = Database()
-        users_table = db.get_table_name('users')
-        
-        query = f"SELECT user_id FROM {users_table} WHERE name IS NULL OR name = ''"
-        result = DatabaseService.execute_query(query, None, fetch_all=True)
+        from function.nickname_backfill import start_nickname_backfill
+        started, status = start_nickname_backfill()
         
-        if not result or not isinstance(result, list):
+        if status['status'] == 'unavailable':
+            event.reply(f"<@{event.user_id}>\n❌ {status['message']}")
+            return
+        if status['status'] == 'completed' and not started:
             event.reply(f"<@{event.user_id}>\n✅ 所有用户都已有昵称，无需补全！")
             return
         
-        total_users = len(result)
-        event.reply(f"<@{event.user_id}>\n🔄 开始补全昵称...\n📊 需要处理: {total_users} 个用户")
-        
-        success_count = 0
-        failed_count = 0
-        
-        for i, user_row in enumerate(result, 1):
-            user_id = user_row.get('user_id')
-            if not user_id:
-                continue
-            
-            name = db.fetch_user_name_from_api(user_id)
-            
-            if name:
-                sql = f"UPDATE {users_table} SET name = %s WHERE user_id = %s"
-                DatabaseService.execute_update(sql, (name, user_id))
-                success_count += 1
-            else:
-                failed_count += 1
-            
-            if i % 200000 == 0:
-                progress = (i / total_users) * 100
-                event.reply(f"⏳ 处理进度: {i}/{total_users} ({progress:.1f}%)\n✅ 成功: {success_count} | ❌ 失败: {failed_count}")
-        
-        total_time = round((time.time() - start_time) * 1000)
-        info = [
-            f'<@{event.user_id}>',
-            f'✅ 昵称补全完成！',
-            f'👤 处理总数: {total_users} 个',
-            f'✅ 成功补全: {success_count} 个',
-            f'❌ 获取失败: {failed_count} 个',
-            f'🕒 总耗时: {total_time}ms'
-        ]
+        info = [f'<@{event.user_id}>']
+        if started:
+            info.append('🔄 昵称补全已在后台' + ('从检查点继续' if status['resumed'] else '开始'))
+        else:
+            info.append('⏳ 昵称补全正在进行中')
+        info.append(f"📊 进度: {status['processed']}/{status['total']} ({status['progress']}%)")
+        info.append(f"✅ 成功: {status['success']} | ❌ 失败: {status['failed']}")
+        if status.get('eta_seconds'):
+            info.append(f"🕒 预计剩余: {status['eta_seconds']}秒")
+        info.append('💡 再次发送「补全昵称」或在Web面板统计页查看进度')
         
         if USE_MARKDOWN:
             button_configs = [[
-                {'text': '用户统计', 'data': '用户统计'},
-                {'text': 'DAU查询', 'data': 'dau'}
+                {'text': '补全进度', 'data': '补全昵称'},
+                {'text': '用户统计', 'data': '用户统计'}
             ]]
             buttons = system_plugin.create_buttons(event, button_configs)
             event.reply('\n'.join(info), buttons, hide_avatar_and_center=True)
@@ -896,6 +795,7 @@ class system_plugin(Plugin):
             return event.reply("无法将主人添加到黑名单")
         blacklist[user_id] = reason
         save_blacklist()
+        PluginManager.refresh_dispatch_filter()
         
         message = f"已添加用户 {user_id} 到黑名单\n原因: {reason}"
         
@@ -916,6 +816,7 @@ class system_plugin(Plugin):
             return event.reply(f"用户 {user_id} 不在黑名单中")
         reason = blacklist.pop(user_id, "未知")
         save_blacklist()
+        PluginManager.refresh_dispatch_filter()
         event.reply(f"已移除用户 {user_id}\n原因: {reason}")
     
     @staticmethod
@@ -1046,6 +947,9 @@ class system_plugin(Plugin):
             with open(sandbox_file, 'w', encoding='utf-8') as f:
                 json.dump(sandbox_data, f, ensure_ascii=False, indent=2)
             
+            from function.Access import reload_sandbox_groups
+            reload_sandbox_groups()
+            
             message_parts = [f"✅ 已将群组 {group_id} 设置为沙盒群"]
             
             if old_group and old_group != group_id:
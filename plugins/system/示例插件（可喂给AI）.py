@@ -218,8 +218,9 @@ class media_plugin(Plugin):
     #延迟撤回
     @staticmethod
     def test_recall(e):
+        # 插件内回复不等待发送完成，返回 Future，需要消息ID时调用 result()
         mid = e.reply("⏰ 3秒后撤回...")
-        if mid: threading.Thread(target=lambda: (time.sleep(3), e.recall_message(mid)), daemon=True).start()
+        if mid: threading.Thread(target=lambda: (time.sleep(3), e.recall_message(mid.result())), daemon=True).start()
 
     #利用内置定时器倒计时撤回
     @staticmethod
@@ -433,7 +434,7 @@ class media_plugin(Plugin):
         """主动私聊：主动私聊 用户OpenID 消息内容"""
         if not e.matches or len(e.matches) < 2: return e.reply("❌ 用法：主动私聊 用户OpenID 消息内容")
         uid, content = e.matches[0].strip(), e.matches[1].strip()
-        mid = e.reply(content, target_user_id=uid)
+        mid = e.reply(content, target_user_id=uid, wait=True)
         e.reply(f"✅ 已发送主动私聊消息\n目标: {uid[:8]}****\n消息ID: {mid}" if mid else f"❌ 发送失败")
 
     @staticmethod
@@ -441,7 +442,7 @@ class media_plugin(Plugin):
         """主动群发：主动群发 群OpenID 消息内容"""
         if not e.matches or len(e.matches) < 2: return e.reply("❌ 用法：主动群发 群OpenID 消息内容")
         gid, content = e.matches[0].strip(), e.matches[1].strip()
-        mid = e.reply(content, target_group_id=gid)
+        mid = e.reply(content, target_group_id=gid, wait=True)
         e.reply(f"✅ 已发送主动群消息\n目标群: {gid[:8]}****\n消息ID: {mid}" if mid else f"❌ 发送失败")
 
     @staticmethod
@@ -452,6 +453,7 @@ class media_plugin(Plugin):
             mid = e.reply_image("https://i0.hdslb.com/bfs/openplatform/559162218f455ea859c783dceeda65cb1c724f4c.png", "📸 主动图片", target_group_id=target_id)
         else:
             mid = e.reply_image("https://i0.hdslb.com/bfs/openplatform/559162218f455ea859c783dceeda65cb1c724f4c.png", "📸 主动图片", target_user_id=target_id)
+        mid = mid.result() if mid else None
         e.reply(f"✅ 主动图片已发送 ID:{mid}" if mid else "❌ 发送失败")
 
     @staticmethod
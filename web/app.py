@@ -182,7 +182,9 @@ from web.tools.openapi_handler import (openapi_user_data, handle_start_login, ha
 from web.tools.message_handler import (handle_get_chats, handle_get_chat_history, handle_send_message,
     handle_get_nickname, handle_get_nicknames_batch, handle_get_markdown_templates, handle_get_markdown_templates_detail)
 from web.tools.statistics_handler import (handle_get_statistics, handle_get_statistics_task_status,
-    handle_get_all_statistics_tasks, handle_complete_dau, handle_get_user_nickname, handle_get_available_dates)
+    handle_get_all_statistics_tasks, handle_complete_dau, handle_get_dau_backfill_status, handle_get_user_nickname,
+    handle_get_available_dates, handle_start_nickname_backfill, handle_stop_nickname_backfill,
+    handle_get_nickname_backfill_status)
 from web.tools.config_handler import (handle_get_config, handle_parse_config, handle_update_config_items,
     handle_save_config, handle_check_pending_config, handle_cancel_pending_config,
     handle_get_message_templates, handle_save_message_templates, handle_parse_message_templates)
@@ -339,6 +341,16 @@ def delete_ip_record():
 def status():
     return status_routes.handle_status()
 
+@web.route('/api/delayed_tasks')
+@full_auth
+def get_delayed_tasks():
+    return status_routes.handle_get_delayed_tasks()
+
+@web.route('/api/delayed_tasks/cancel', methods=['POST'])
+@full_auth
+def cancel_delayed_task():
+    return status_routes.handle_cancel_delayed_task()
+
 @web.route('/api/statistics')
 @full_auth
 def get_statistics():
@@ -359,6 +371,26 @@ def get_all_statistics_tasks():
 def complete_dau():
     return handle_complete_dau(api_success_response)
 
+@web.route('/api/complete_dau/status')
+@full_auth
+def complete_dau_status():
+    return handle_get_dau_backfill_status(api_success_response)
+
+@web.route('/api/nickname_backfill', methods=['POST'])
+@full_auth
+def start_nickname_backfill():
+    return handle_start_nickname_backfill(api_success_response)
+
+@web.route('/api/nickname_backfill/stop', methods=['POST'])
+@full_auth
+def stop_nickname_backfill():
+    return handle_stop_nickname_backfill(api_success_response)
+
+@web.route('/api/nickname_backfill/status')
+@full_auth
+def nickname_backfill_status():
+    return handle_get_nickname_backfill_status(api_success_response)
+
 @web.route('/api/get_nickname/<user_id>')
 @full_auth
 def get_user_nickname(user_id):
@@ -824,6 +856,7 @@ def register_socketio_handlers(sio):
     @require_socketio_token
     def handle_connect():
         sid = request.sid
+        log_handler.client_connected()
         def load_data():
             try:
                 sio.emit('system_info', get_system_info(), room=sid, namespace=PREFIX)
@@ -833,7 +866,7 @@ def register_socketio_handlers(sio):
                 sio.emit('plugins_update', scan_plugins(), room=sid, namespace=PREFIX)
                 logs_data = {}
                 for t, getter in _LOGS_MAP.items():
-                    logs = list(getter())[-30:]
+                    logs = [log_handler.serialize_entry(e) for e in list(getter())[-30:]]
                     logs.reverse()
                     logs_data[t] = {'logs': logs, 'total': len(getter()), 'page': 1, 'page_size': 30}
                 sio.emit('logs_batch', logs_data, room=sid, namespace=PREFIX)
@@ -843,7 +876,7 @@ def register_socketio_handlers(sio):
 
     @sio.on('disconnect', namespace=PREFIX)
     def handle_disconnect():
-        pass
+        log_handler.client_disconnected()
 
     @sio.on('get_system_info', namespace=PREFIX)
     @require_socketio_token
@@ -192,6 +192,12 @@ function initSocket(pageType = 'dashboard') {
     });
 
     socket.on('new_message', (data) => window.handleNewLog?.(data));
+    socket.on('new_messages', (batch) => {
+        if (!window.handleNewLog) return;
+        Object.entries(batch).forEach(([type, entries]) => {
+            entries.forEach(data => window.handleNewLog({ type, data }));
+        });
+    });
     socket.on('system_info_update', updateSystemInfo);
     socket.on('system_info', updateSystemInfo);
     socket.on('plugins_update', (data) => window.updatePluginsInfo?.(data));
@@ -338,6 +344,8 @@ const updateSystemInfo = throttle(function(data) {
         }
     }
     
+    if (data.caches) window.updateCacheStats?.(data.caches);
+    
     const formatUptime = (seconds) => {
         const days = Math.floor(seconds / 86400);
         const hours = Math.floor((seconds % 86400) / 3600);
@@ -120,6 +120,24 @@ def execute_bot_restart(restart_status=None):
     with open(_RESTART_STATUS_FILE, 'w', encoding='utf-8') as f:
         json.dump(restart_status, f, ensure_ascii=False)
     
+    # 进程可能被直接结束（atexit 不会执行），先把内存中的IP/会话变更写回，
+    # 待执行的延时任务落盘以便新进程继续执行，并发出发送队列中已排队的消息
+    try:
+        from web.tools.session_manager import flush_state
+        flush_state()
+    except:
+        pass
+    try:
+        from function.delayed_tasks import shutdown_delayed_tasks
+        shutdown_delayed_tasks()
+    except:
+        pass
+    try:
+        from function.send_dispatcher import shutdown_send_queue
+        shutdown_send_queue()
+    except:
+        pass
+    
     try:
         if _IS_WINDOWS:
             script_content = _WIN_RESTART_TEMPLATE.format(main_py_path=_MAIN_PY_PATH)
@@ -1,11 +1,13 @@
 import functools
-import os
 import json
+import threading
 from collections import deque
 from datetime import datetime
 
 _MAX_LOGS = 1000
 _PREFIX = '/web'
+_EMIT_INTERVAL = 0.2      # 推送合并窗口（秒）
+_EMIT_BATCH_SIZE = 50     # 缓冲条数达到该值时立即推送
 
 message_logs = deque(maxlen=_MAX_LOGS)
 framework_logs = deque(maxlen=_MAX_LOGS)
@@ -14,10 +16,76 @@ _GLOBAL_LOGS = {'message': message_logs, 'framework': framework_logs, 'error': e
 
 socketio = None
 
+# 实时推送缓冲：按日志通道分组，由后台线程合并后一次性 emit
+_pending = {}
+_pending_count = 0
+_pending_lock = threading.Lock()
+_flush_event = threading.Event()
+_flusher_started = False
+_client_count = 0
+
 def set_socketio(sio):
     global socketio
     socketio = sio
 
+def client_connected():
+    global _client_count
+    with _pending_lock:
+        _client_count += 1
+    _ensure_flusher()
+
+def client_disconnected():
+    global _client_count
+    with _pending_lock:
+        _client_count = max(0, _client_count - 1)
+
+def _ensure_flusher():
+    global _flusher_started
+    if _flusher_started:
+        return
+    with _pending_lock:
+        if _flusher_started:
+            return
+        _flusher_started = True
+    threading.Thread(target=_flush_loop, daemon=True, name="LogEmitFlusher").start()
+
+def _flush_loop():
+    while True:
+        _flush_event.wait(_EMIT_INTERVAL)
+        _flush_event.clear()
+        try:
+            flush_pending()
+        except:
+            pass
+
+def flush_pending():
+    """将缓冲的日志合并为一次 new_messages 推送"""
+    global _pending, _pending_count
+    with _pending_lock:
+        if not _pending_count:
+            return
+        batch, _pending, _pending_count = _pending, {}, 0
+        has_clients = _client_count > 0
+    if socketio and has_clients:
+        socketio.emit('new_messages', batch, namespace=_PREFIX)
+
+def _queue_emit(actual_type, entry):
+    global _pending_count
+    fields = ['timestamp', 'content']
+    if 'traceback' in entry:
+        fields.append('traceback')
+    if actual_type == 'plugin':
+        fields.extend(('user_id', 'group_id', 'plugin_name'))
+    elif actual_type == 'received':
+        fields.extend(('user_id', 'group_id'))
+    data = {k: entry[k] for k in fields if k in entry}
+    with _pending_lock:
+        _pending.setdefault(actual_type, []).append(data)
+        _pending_count += 1
+        full = _pending_count >= _EMIT_BATCH_SIZE
+    if full:
+        _flush_event.set()
+
 def catch_error(func):
     @functools.wraps(func)
     def wrapper(*args, **kwargs):
@@ -28,12 +96,12 @@ def catch_error(func):
     return wrapper
 
 class LogHandler:
-    __slots__ = ('log_type', 'logs', 'global_logs')
+    __slots__ = ('log_type', 'logs')
     
     def __init__(self, log_type):
         self.log_type = log_type
-        self.logs = deque(maxlen=_MAX_LOGS)
-        self.global_logs = _GLOBAL_LOGS.get(log_type, message_logs)
+        # 直接使用全局队列，避免同一条日志存储两份
+        self.logs = _GLOBAL_LOGS.get(log_type, message_logs)
     
     def add(self, content, traceback_info=None):
         entry = content.copy() if isinstance(content, dict) else {'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'), 'content': content}
@@ -43,25 +111,16 @@ class LogHandler:
             entry['traceback'] = traceback_info
         
         self.logs.append(entry)
-        self.global_logs.append(entry)
         
-        if socketio:
+        # 没有面板客户端连接时跳过推送
+        if socketio and _client_count > 0:
             try:
                 actual_type = self.log_type
                 if self.log_type == 'message':
                     entry_type = entry.get('type')
                     if entry_type in ('plugin', 'received'):
                         actual_type = entry_type
-                
-                fields = ['timestamp', 'content']
-                if 'traceback' in entry:
-                    fields.append('traceback')
-                if actual_type == 'plugin':
-                    fields.extend(('user_id', 'group_id', 'plugin_name'))
-                elif actual_type == 'received':
-                    fields.extend(('user_id', 'group_id'))
-                
-                socketio.emit('new_message', {'type': actual_type, 'data': {k: entry[k] for k in fields if k in entry}}, namespace=_PREFIX)
+                _queue_emit(actual_type, entry)
             except:
                 pass
         
@@ -106,80 +165,61 @@ def add_framework_log(log):
 def add_error_log(log, traceback_info=None):
     return error_handler.add(log, traceback_info)
 
+def serialize_entry(entry):
+    """插件回复日志的 raw_message 以原始 payload 存放，读取输出前才序列化为字符串（结果写回，只做一次）"""
+    raw = entry.get('raw_message')
+    if raw is not None and not isinstance(raw, str):
+        try:
+            entry['raw_message'] = json.dumps(raw, ensure_ascii=False)
+        except:
+            entry['raw_message'] = str(raw)
+    return entry
+
 def get_logs_data(log_type):
     handler = _HANDLERS.get(log_type)
-    return list(handler.logs) if handler else []
+    return [serialize_entry(e) for e in handler.logs] if handler else []
 
-# 登录日志相关
-_WEB_DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'data', 'web')
-_IP_DATA_FILE = os.path.join(_WEB_DATA_DIR, 'ip.json')
+# 登录日志相关：IP访问记录以 session_manager 的内存数据为准，由其后台线程写回磁盘
 
 def get_login_logs():
     """获取登录日志数据"""
     try:
-        if os.path.exists(_IP_DATA_FILE):
-            with open(_IP_DATA_FILE, 'r', encoding='utf-8') as f:
-                ip_data = json.load(f)
-            
-            logs = []
-            for ip, data in ip_data.items():
-                logs.append({
-                    'ip': ip,
-                    'first_access': data.get('first_access', ''),
-                    'last_access': data.get('last_access', ''),
-                    'token_success_count': data.get('token_success_count', 0),
-                    'token_fail_count': data.get('token_fail_count', 0),
-                    'password_success_count': data.get('password_success_count', 0),
-                    'password_fail_count': data.get('password_fail_count', 0),
-                    'is_banned': data.get('is_banned', False),
-                    'ban_time': data.get('ban_time', ''),
-                    'device_info': data.get('device_info', {}),
-                    'password_fail_times': data.get('password_fail_times', []),
-                    'token_fail_times': data.get('token_fail_times', []),
-                })
-            
-            # 按最后访问时间排序
-            logs.sort(key=lambda x: x['last_access'] or '', reverse=True)
-            return logs
-        return []
+        from web.tools.session_manager import ip_access_data
+        logs = []
+        for ip, data in list(ip_access_data.items()):
+            logs.append({
+                'ip': ip,
+                'first_access': data.get('first_access', ''),
+                'last_access': data.get('last_access', ''),
+                'token_success_count': data.get('token_success_count', 0),
+                'token_fail_count': data.get('token_fail_count', 0),
+                'password_success_count': data.get('password_success_count', 0),
+                'password_fail_count': data.get('password_fail_count', 0),
+                'is_banned': data.get('is_banned', False),
+                'ban_time': data.get('ban_time', ''),
+                'device_info': data.get('device_info', {}),
+                'password_fail_times': list(data.get('password_fail_times', [])),
+                'token_fail_times': list(data.get('token_fail_times', [])),
+            })
+        
+        # 按最后访问时间排序
+        logs.sort(key=lambda x: x['last_access'] or '', reverse=True)
+        return logs
     except Exception as e:
         return []
 
 def unban_ip(ip_address):
     """解封IP"""
     try:
-        if os.path.exists(_IP_DATA_FILE):
-            with open(_IP_DATA_FILE, 'r', encoding='utf-8') as f:
-                ip_data = json.load(f)
-            
-            if ip_address in ip_data:
-                ip_data[ip_address]['is_banned'] = False
-                ip_data[ip_address]['ban_time'] = None
-                ip_data[ip_address]['password_fail_times'] = []
-                ip_data[ip_address]['token_fail_times'] = []
-                ip_data[ip_address]['password_fail_count'] = 0
-                ip_data[ip_address]['token_fail_count'] = 0
-                
-                with open(_IP_DATA_FILE, 'w', encoding='utf-8') as f:
-                    json.dump(ip_data, f, ensure_ascii=False, indent=2)
-                return True
-        return False
+        from web.tools.session_manager import unban_ip_record
+        return unban_ip_record(ip_address)
     except:
         return False
 
 def delete_ip_record(ip_address):
     """删除IP记录"""
     try:
-        if os.path.exists(_IP_DATA_FILE):
-            with open(_IP_DATA_FILE, 'r', encoding='utf-8') as f:
-                ip_data = json.load(f)
-            
-            if ip_address in ip_data:
-                del ip_data[ip_address]
-                
-                with open(_IP_DATA_FILE, 'w', encoding='utf-8') as f:
-                    json.dump(ip_data, f, ensure_ascii=False, indent=2)
-                return True
-        return False
+        from web.tools import session_manager
+        return session_manager.delete_ip_record(ip_address)
     except:
         return False
@@ -1,5 +1,6 @@
 from datetime import datetime
 from flask import request, jsonify
+from web.tools.log_handler import serialize_entry
 
 message_logs = None
 framework_logs = None
@@ -9,7 +10,6 @@ add_error_log = None
 
 _LOGS_MAP = {}
 _DEFAULT_LIMIT = 100
-_TABLE_CHECK_SQL = "SELECT COUNT(*) as count FROM information_schema.tables WHERE table_schema = DATABASE() AND table_name = %s"
 _LOG_TYPES = frozenset(('plugin', 'framework', 'error'))
 
 def set_log_queues(message, framework, error):
@@ -31,7 +31,7 @@ def handle_get_logs(log_type):
     start = (page - 1) * page_size
     
     return jsonify({
-        'logs': logs[start:start + page_size], 'total': len(logs),
+        'logs': [serialize_entry(e) for e in logs[start:start + page_size]], 'total': len(logs),
         'page': page, 'page_size': page_size, 'total_pages': (len(logs) + page_size - 1) // page_size
     })
 
@@ -56,26 +56,22 @@ def get_today_logs_from_db(log_type, limit=None):
             return []
         
         limit = limit or LOG_DB_CONFIG.get('initial_load_count', _DEFAULT_LIMIT)
-        today = datetime.now().strftime('%Y%m%d')
-        prefix = LOG_DB_CONFIG.get('table_prefix', 'Mlog_')
+        today = datetime.now().date()
         
         try:
             from pymysql.cursors import DictCursor
+            from function.log_db import day_log_exists, get_day_log_source
             cursor = conn.cursor(DictCursor)
             
+            table_type = 'message' if log_type == 'plugin' else log_type
+            if not day_log_exists(cursor, table_type, today):
+                return []
+            source = get_day_log_source(table_type, today)
             if log_type == 'plugin':
-                table_name = f'{prefix}{today}_message'
-                cursor.execute(_TABLE_CHECK_SQL, (table_name,))
-                if cursor.fetchone()['count'] == 0:
-                    return []
-                cursor.execute(f"SELECT timestamp, content, user_id, group_id, plugin_name FROM {table_name} WHERE type = 'plugin' ORDER BY timestamp DESC LIMIT %s", (limit,))
+                cursor.execute(f"SELECT timestamp, content, user_id, group_id, plugin_name FROM {source} WHERE type = 'plugin' ORDER BY timestamp DESC LIMIT %s", (limit,))
             else:
-                table_name = f'{prefix}{today}_{log_type}'
-                cursor.execute(_TABLE_CHECK_SQL, (table_name,))
-                if cursor.fetchone()['count'] == 0:
-                    return []
                 cols = 'timestamp, content, traceback, resp_obj, send_payload, raw_message' if log_type == 'error' else 'timestamp, content'
-                cursor.execute(f"SELECT {cols} FROM {table_name} ORDER BY timestamp DESC LIMIT %s", (limit,))
+                cursor.execute(f"SELECT {cols} FROM {source} ORDER BY timestamp DESC LIMIT %s", (limit,))
             
             result = []
             for log in cursor.fetchall():
@@ -108,18 +104,16 @@ def get_today_message_logs_from_db(limit=None):
             return []
         
         limit = limit or LOG_DB_CONFIG.get('initial_load_count', _DEFAULT_LIMIT)
-        today = datetime.now().strftime('%Y%m%d')
-        prefix = LOG_DB_CONFIG.get('table_prefix', 'Mlog_')
-        table_name = f'{prefix}{today}_message'
+        today = datetime.now().date()
         
         try:
             from pymysql.cursors import DictCursor
+            from function.log_db import day_log_exists, get_day_log_source
             cursor = conn.cursor(DictCursor)
-            cursor.execute(_TABLE_CHECK_SQL, (table_name,))
-            if cursor.fetchone()['count'] == 0:
+            if not day_log_exists(cursor, 'message', today):
                 return []
             
-            cursor.execute(f"SELECT timestamp, user_id, group_id, content FROM {table_name} WHERE type = 'received' AND user_id != 'ZFC2G' AND user_id != 'ZFC2C' ORDER BY timestamp DESC LIMIT %s", (limit,))
+            cursor.execute(f"SELECT timestamp, user_id, group_id, content FROM {get_day_log_source('message', today)} WHERE type = 'received' AND user_id != 'ZFC2G' AND user_id != 'ZFC2C' ORDER BY timestamp DESC LIMIT %s", (limit,))
             return [{'timestamp': _format_timestamp(log['timestamp']), 'content': f"收到消息: {log['content']}" if log['content'] else '',
                      'user_id': log['user_id'] or '', 'group_id': log['group_id'] or 'c2c', 'message': log['content'] or ''} for log in cursor.fetchall()]
         finally:
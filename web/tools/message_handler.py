@@ -1,15 +1,17 @@
-import os, sys, time
+import os, sys
 from datetime import datetime, timedelta
 from flask import request, jsonify
 
-_nickname_cache = {}
-_CACHE_TIMEOUT = 86400
 _PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 def _ensure_path():
     if _PROJECT_ROOT not in sys.path:
         sys.path.insert(0, _PROJECT_ROOT)
 
+_ensure_path()
+from function.bounded_cache import get_cache
+_nickname_cache = get_cache('nickname')
+
 def get_chat_avatar(chat_id, chat_type, appid):
     return f"https://q.qlogo.cn/qqapp/{appid}/{chat_id}/100" if chat_type == 'user' else (chat_id[0].upper() if chat_id else 'G')
 
@@ -24,11 +26,11 @@ def get_user_nickname(user_id):
         return f"用户{user_id[-6:]}"
 
 def get_user_nicknames_batch(user_ids):
-    current_time, result, users_to_fetch = time.time(), {}, []
+    result, users_to_fetch = {}, []
     
     for uid in user_ids:
-        if uid in _nickname_cache and current_time - _nickname_cache[uid]['timestamp'] < _CACHE_TIMEOUT:
-            result[uid] = _nickname_cache[uid]['nickname']
+        if (nickname := _nickname_cache.get(uid)) is not None:
+            result[uid] = nickname
         else:
             users_to_fetch.append(uid)
     
@@ -49,7 +51,7 @@ def get_user_nicknames_batch(user_ids):
                     uid, name = (row.get('user_id'), row.get('name')) if isinstance(row, dict) else (row[0], row[1])
                     if uid and name:
                         result[uid] = name
-                        _nickname_cache[uid] = {'nickname': name, 'timestamp': current_time}
+                        _nickname_cache.set(uid, name)
             finally:
                 cursor.close()
                 pool.release_connection(conn)
@@ -60,7 +62,7 @@ def get_user_nicknames_batch(user_ids):
         if uid not in result:
             nickname = f"用户{uid[-6:]}"
             result[uid] = nickname
-            _nickname_cache[uid] = {'nickname': nickname, 'timestamp': current_time}
+            _nickname_cache.set(uid, nickname)
     return result
 
 def handle_get_chats(LOG_DB_CONFIG, appid):
@@ -111,18 +113,70 @@ def handle_get_chats(LOG_DB_CONFIG, appid):
     except Exception as e:
         return jsonify({'success': False, 'message': f'获取聊天列表失败: {e}'})
 
+_HISTORY_COLUMNS = "user_id, group_id, content, timestamp, type, id"
+_CURSOR_TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+def _parse_history_cursor(value):
+    """聊天记录游标格式为 '时间|id'，解析为 (datetime, id)，无效时返回 None"""
+    try:
+        ts, msg_id = str(value).rsplit('|', 1)
+        return datetime.strptime(ts, _CURSOR_TIME_FORMAT), int(msg_id)
+    except (ValueError, TypeError):
+        return None
+
+def _history_conditions(chat_type, chat_id):
+    """每个条件单独查询，分别命中 (group_id, timestamp) / (user_id, timestamp) 索引，避免 OR 条件退化为全表扫描"""
+    if chat_type == 'group':
+        # 机器人发到群里的消息(user_id = ZFC2G)同样以群号记录在 group_id
+        return [("group_id = %s", [chat_id])]
+    return [("user_id = %s AND group_id = 'c2c'", [chat_id]), ("user_id = %s AND group_id = 'ZFC2C'", [chat_id])]
+
+def _query_chat_history(cursor, tables, conditions, range_start, after, before, limit):
+    """按 (timestamp, id) 游标查询并在 Python 中归并，返回按时间升序的最多 limit + 1 条消息
+
+    after 取游标之后最早的消息（增量刷新），否则取 before 之前（未指定则为最新）的最近消息。
+    """
+    from function.log_db import get_log_table_name
+    ascending = after is not None
+    order = 'ASC' if ascending else 'DESC'
+    # 按天分表的表名按日期定长排序，游标当天之外的表不可能有符合条件的消息；单表模式下表名与日期无关，不受影响
+    if after:
+        tables = [t for t in tables if t >= get_log_table_name('message', after[0])]
+    if before:
+        tables = [t for t in tables if t <= get_log_table_name('message', before[0])]
+    rows = []
+    # 按天分表时 tables 为新到旧，增量刷新需要从旧到新
+    for table in (reversed(tables) if ascending else tables):
+        for cond, params in conditions:
+            sql, args = f"SELECT {_HISTORY_COLUMNS} FROM `{table}` WHERE {cond} AND timestamp >= %s", params + [range_start]
+            if after:
+                sql += " AND timestamp >= %s AND (timestamp > %s OR id > %s)"
+                args += [after[0], after[0], after[1]]
+            if before:
+                sql += " AND timestamp <= %s AND (timestamp < %s OR id < %s)"
+                args += [before[0], before[0], before[1]]
+            cursor.execute(f"{sql} ORDER BY timestamp {order}, id {order} LIMIT %s", args + [limit + 1])
+            rows.extend(cursor.fetchall())
+        # 后续的表整体更旧（增量时更新），已凑够一页就无需继续
+        if len(rows) > limit:
+            break
+    rows.sort(key=lambda m: (m['timestamp'], m['id']), reverse=not ascending)
+    rows = rows[:limit + 1]
+    return rows if ascending else rows[::-1]
+
 def handle_get_chat_history(LOG_DB_CONFIG, appid):
     try:
         data = request.get_json()
         chat_type, chat_id = data.get('chat_type'), data.get('chat_id')
-        show_all, since_id = data.get('show_all', False), data.get('since_id')
+        show_all = data.get('show_all', False)
+        after, before = _parse_history_cursor(data.get('after')), _parse_history_cursor(data.get('before'))
         days_range = 365 if show_all else min(data.get('days_range', 1), 30)
         
         if not chat_type or not chat_id:
             return jsonify({'success': False, 'message': '缺少必要参数'})
         
         _ensure_path()
-        from function.log_db import LogDatabasePool
+        from function.log_db import LogDatabasePool, get_log_tables_in_range
         from pymysql.cursors import DictCursor
         
         pool = LogDatabasePool()
@@ -131,36 +185,17 @@ def handle_get_chat_history(LOG_DB_CONFIG, appid):
         
         try:
             cursor = conn.cursor(DictCursor)
-            prefix = LOG_DB_CONFIG.get('table_prefix', 'Mlog_')
+            today = datetime.now().date()
+            range_start = today - timedelta(days=days_range - 1)
+            tables = get_log_tables_in_range(cursor, 'message', range_start, today)
             
-            existing_tables = []
-            for i in range(days_range):
-                table_name = f"{prefix}{(datetime.now() - timedelta(days=i)).strftime('%Y%m%d')}_message"
-                cursor.execute("SELECT COUNT(*) as count FROM information_schema.tables WHERE table_schema = DATABASE() AND table_name = %s", (table_name,))
-                if cursor.fetchone()['count'] > 0:
-                    existing_tables.append(table_name)
-            
-            if not existing_tables:
+            if not tables:
                 return jsonify({'success': True, 'data': {'messages': [], 'chat_info': {'chat_id': chat_id, 'chat_type': chat_type, 'avatar': get_chat_avatar(chat_id, chat_type, appid)}, 'no_history': True}})
             
-            if chat_type == 'group':
-                base_cond, params = "(group_id = %s AND group_id != 'c2c') OR (user_id = 'ZFC2G' AND group_id = %s)", [chat_id, chat_id]
-            else:
-                base_cond, params = "(user_id = %s AND group_id = 'c2c') OR (user_id = %s AND group_id = 'ZFC2C')", [chat_id, chat_id]
-            
-            where_cond = f"({base_cond}) AND id > %s" if since_id else base_cond
-            if since_id:
-                params.append(since_id)
-            
-            union_parts, all_params = [], []
-            for t in existing_tables:
-                union_parts.append(f"SELECT user_id, group_id, content, timestamp, type, id FROM {t} WHERE {where_cond}")
-                all_params.extend(params)
-            
-            msg_limit = 50 if since_id else (500 if show_all else 200)
-            order = 'ASC' if since_id else 'DESC'
-            cursor.execute(f"SELECT * FROM ({' UNION ALL '.join(union_parts)} ORDER BY id {order} LIMIT {msg_limit}) AS m ORDER BY id ASC", all_params)
-            messages = cursor.fetchall()
+            msg_limit = 50 if after else (100 if before else (500 if show_all else 200))
+            messages = _query_chat_history(cursor, tables, _history_conditions(chat_type, chat_id), range_start.isoformat(), after, before, msg_limit)
+            has_more = len(messages) > msg_limit
+            messages = messages[:msg_limit] if after else messages[-msg_limit:]
             
             user_ids = {m['user_id'] for m in messages if m.get('type') != 'plugin' and not ((chat_type == 'group' and m['user_id'] == 'ZFC2G') or (chat_type == 'user' and m['group_id'] == 'ZFC2C'))}
             nicknames = get_user_nicknames_batch(list(user_ids)) if user_ids else {}
@@ -174,11 +209,13 @@ def handle_get_chat_history(LOG_DB_CONFIG, appid):
                     'nickname': '机器人' if is_self else nicknames.get(m['user_id'], f"用户{m['user_id'][-6:]}"),
                     'content': m['content'], 'timestamp': m['timestamp'].strftime(ts_fmt) if m['timestamp'] else '',
                     'avatar': get_chat_avatar('robot' if is_self else m['user_id'], 'user', appid),
-                    'is_self': is_self, 'id': m.get('id')
+                    'is_self': is_self, 'id': m.get('id'),
+                    'cursor': f"{m['timestamp'].strftime(_CURSOR_TIME_FORMAT)}|{m['id']}" if m['timestamp'] else None
                 })
             
             return jsonify({'success': True, 'data': {'messages': msg_list, 'chat_info': {'chat_id': chat_id, 'chat_type': chat_type, 'avatar': get_chat_avatar(chat_id, chat_type, appid)},
-                'is_incremental': bool(since_id), 'has_more': len(msg_list) == msg_limit if since_id else False}})
+                'is_incremental': bool(after), 'is_older': bool(before), 'has_more': has_more if after else False,
+                'has_more_before': has_more if not after else None}})
         finally:
             cursor.close()
             pool.release_connection(conn)
@@ -1,4 +1,4 @@
-import os, json, time, uuid, base64, hashlib, hmac, functools
+import os, json, time, uuid, base64, hashlib, hmac, functools, threading, atexit
 from datetime import datetime
 from flask import request, render_template
 
@@ -8,7 +8,8 @@ _last_session_cleanup = 0
 _last_ip_cleanup = 0
 
 _WEB_DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'data', 'web')
-_IP_DATA_FILE = os.path.join(_WEB_DATA_DIR, 'ip.json')
+_IP_DATA_FILE = os.path.join(_WEB_DATA_DIR, 'ip.jsonl')
+_LEGACY_IP_DATA_FILE = os.path.join(_WEB_DATA_DIR, 'ip.json')
 _SESSION_DATA_FILE = os.path.join(_WEB_DATA_DIR, 'sessions.json')
 _COOKIE_SECRET = 'elaina_cookie_secret_key_2024_v1'
 _BAN_DURATION = 86400
@@ -18,6 +19,16 @@ _PASSWORD_FAIL_WINDOW = 86400
 _PASSWORD_SUCCESS_WINDOW = 2592000
 _MAX_SESSIONS = 10
 _MAX_FAIL_COUNT = 5
+_MAX_IP_HISTORY = 50            # 每个IP保留的成功/失败时间记录上限
+_FLUSH_INTERVAL = 5             # 内存中的IP/会话变更落盘间隔(秒)
+_COMPACT_MIN_LINES = 1000       # ip.jsonl 行数超过该值且超过存活IP数的4倍时压缩重写
+
+_state_lock = threading.Lock()   # 保护脏标记
+_flush_lock = threading.Lock()   # 串行化文件写入
+_dirty_ips = set()
+_sessions_dirty = False
+_ip_log_lines = 0
+_flusher_started = False
 
 os.makedirs(_WEB_DATA_DIR, exist_ok=True)
 
@@ -68,17 +79,116 @@ def extract_device_info(req):
         'last_update': datetime.now().isoformat(), 'device_type': device_type, 'browser': browser
     }
 
+# ==================== 持久化（内存为准，定期写回） ====================
+# ip.jsonl 每行是某个IP的完整记录 {"ip": ..., "data": {...}} 或删除标记 {"ip": ..., "deleted": true}，
+# 读取时后出现的行覆盖先前的行；只追加有变化的IP，行数膨胀后写临时文件再原子替换完成压缩。
+# sessions.json 只有少量会话，有变化时整体写临时文件再原子替换。
+
+def _atomic_write(file_path, text):
+    tmp_path = file_path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, file_path)
+
+def _ip_line(ip):
+    data = ip_access_data.get(ip)
+    record = {'ip': ip, 'data': data} if data is not None else {'ip': ip, 'deleted': True}
+    return json.dumps(record, ensure_ascii=False) + '\n'
+
 def load_ip_data():
-    global ip_access_data
-    ip_access_data = safe_file_operation('read', _IP_DATA_FILE, default_return={})
+    global _ip_log_lines
+    data, lines = {}, 0
+    if os.path.exists(_IP_DATA_FILE):
+        with open(_IP_DATA_FILE, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue  # 异常退出时可能留下不完整的最后一行
+                lines += 1
+                if record.get('deleted'):
+                    data.pop(record.get('ip'), None)
+                elif record.get('ip'):
+                    data[record['ip']] = record.get('data') or {}
+    elif os.path.exists(_LEGACY_IP_DATA_FILE):
+        # 旧版 ip.json 整体迁移为 jsonl，原文件保留为 .bak
+        data = safe_file_operation('read', _LEGACY_IP_DATA_FILE, default_return={}) or {}
+    ip_access_data.clear()
+    ip_access_data.update(data)
+    _ip_log_lines = lines
+    if not os.path.exists(_IP_DATA_FILE) and data:
+        _compact_ip_log()
+        os.replace(_LEGACY_IP_DATA_FILE, _LEGACY_IP_DATA_FILE + '.bak')
+
+def _compact_ip_log():
+    global _ip_log_lines
+    with _state_lock:
+        _dirty_ips.clear()
+    _atomic_write(_IP_DATA_FILE, ''.join(_ip_line(ip) for ip in list(ip_access_data)))
+    _ip_log_lines = len(ip_access_data)
+
+def _mark_ip_dirty(ip):
+    with _state_lock:
+        _dirty_ips.add(ip)
+    _ensure_flusher()
+
+def _mark_sessions_dirty():
+    global _sessions_dirty
+    with _state_lock:
+        _sessions_dirty = True
+    _ensure_flusher()
+
+def flush_state():
+    """把有变化的IP记录追加到 ip.jsonl、有变化的会话写回 sessions.json"""
+    global _sessions_dirty, _ip_log_lines
+    with _flush_lock:
+        with _state_lock:
+            dirty_ips = list(_dirty_ips)
+            _dirty_ips.clear()
+            sessions_dirty, _sessions_dirty = _sessions_dirty, False
+        try:
+            if dirty_ips:
+                if _ip_log_lines + len(dirty_ips) > max(_COMPACT_MIN_LINES, len(ip_access_data) * 4):
+                    _compact_ip_log()
+                else:
+                    with open(_IP_DATA_FILE, 'a', encoding='utf-8') as f:
+                        f.write(''.join(_ip_line(ip) for ip in dirty_ips))
+                    _ip_log_lines += len(dirty_ips)
+            if sessions_dirty:
+                _write_session_data()
+        except Exception:
+            # 写入失败（或序列化时数据正被修改）则保留脏标记，下个周期重试
+            with _state_lock:
+                _dirty_ips.update(dirty_ips)
+                _sessions_dirty = _sessions_dirty or sessions_dirty
+
+def _flush_loop():
+    while True:
+        time.sleep(_FLUSH_INTERVAL)
+        flush_state()
+
+def _ensure_flusher():
+    global _flusher_started
+    if not _flusher_started:
+        with _state_lock:
+            if _flusher_started:
+                return
+            _flusher_started = True
+        threading.Thread(target=_flush_loop, daemon=True, name="WebStateFlusher").start()
+        atexit.register(flush_state)
 
 def save_ip_data():
-    safe_file_operation('write', _IP_DATA_FILE, ip_access_data)
+    """立即压缩写回全部IP记录"""
+    with _flush_lock:
+        _compact_ip_log()
 
 def _cleanup_old_times(ip, field, window):
     if ip in ip_access_data:
         now = datetime.now()
-        ip_access_data[ip][field] = [t for t in ip_access_data[ip][field] if (now - datetime.fromisoformat(t)).total_seconds() < window]
+        times = [t for t in ip_access_data[ip].get(field, []) if (now - datetime.fromisoformat(t)).total_seconds() < window]
+        ip_access_data[ip][field] = times[-_MAX_IP_HISTORY:]
 
 def record_ip_access(ip_address, access_type='token_success', device_info=None):
     now = datetime.now()
@@ -125,7 +235,7 @@ def record_ip_access(ip_address, access_type='token_success', device_info=None):
             ip_data['is_banned'] = True
             ip_data['ban_time'] = now_iso
     
-    save_ip_data()
+    _mark_ip_dirty(ip_address)
 
 def is_ip_banned(ip_address):
     ip_data = ip_access_data.get(ip_address)
@@ -139,7 +249,7 @@ def is_ip_banned(ip_address):
             ip_data['is_banned'] = False
             ip_data['ban_time'] = None
             ip_data['password_fail_times'] = []
-            save_ip_data()
+            _mark_ip_dirty(ip_address)
             return False
         return True
     except:
@@ -152,20 +262,37 @@ def cleanup_expired_ip_bans():
         return
     _last_ip_cleanup = now
     now_dt = datetime.now()
-    cleaned = 0
     for ip, data in list(ip_access_data.items()):
+        before = len(data.get('password_fail_times', []))
         _cleanup_old_times(ip, 'password_fail_times', _PASSWORD_FAIL_WINDOW)
+        changed = len(data['password_fail_times']) != before
         if data.get('is_banned') and (ban_time := data.get('ban_time')):
             try:
                 if (now_dt - datetime.fromisoformat(ban_time)).total_seconds() >= _BAN_DURATION:
                     data['is_banned'] = False
                     data['ban_time'] = None
                     data['password_fail_times'] = []
-                    cleaned += 1
+                    changed = True
             except:
                 pass
-    if cleaned:
-        save_ip_data()
+        if changed:
+            _mark_ip_dirty(ip)
+
+def unban_ip_record(ip_address):
+    """解封IP并清空失败记录"""
+    ip_data = ip_access_data.get(ip_address)
+    if ip_data is None:
+        return False
+    ip_data.update({'is_banned': False, 'ban_time': None, 'password_fail_times': [], 'token_fail_times': [],
+                    'password_fail_count': 0, 'token_fail_count': 0})
+    _mark_ip_dirty(ip_address)
+    return True
+
+def delete_ip_record(ip_address):
+    if ip_access_data.pop(ip_address, None) is None:
+        return False
+    _mark_ip_dirty(ip_address)
+    return True
 
 def load_session_data():
     global valid_sessions
@@ -180,11 +307,14 @@ def load_session_data():
                     valid_sessions[token] = info
 
 def save_session_data():
+    """标记会话已变更，由后台线程稍后写回"""
+    _mark_sessions_dirty()
+
+def _write_session_data():
     data = {token: {'created': info['created'].isoformat(), 'expires': info['expires'].isoformat(),
                     'ip': info.get('ip', ''), 'user_agent': info.get('user_agent', '')}
-            for token, info in valid_sessions.items()}
-    with open(_SESSION_DATA_FILE, 'w', encoding='utf-8') as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+            for token, info in list(valid_sessions.items())}
+    _atomic_write(_SESSION_DATA_FILE, json.dumps(data, ensure_ascii=False, indent=2))
 
 def cleanup_expired_sessions():
     global _last_session_cleanup
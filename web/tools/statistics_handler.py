@@ -1,4 +1,4 @@
-import os, sys, time, uuid, threading, concurrent.futures
+import os, sys, json, time, uuid, threading, concurrent.futures
 from datetime import datetime, timedelta
 from flask import request
 
@@ -8,9 +8,14 @@ today_data_cache = None
 today_cache_time = 0
 statistics_tasks = {}
 task_results = {}
+_backfill_job = None
+_backfill_lock = threading.Lock()
 
 _TODAY_CACHE_DURATION = 600
 _PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+_BACKFILL_DAYS = 30
+_BACKFILL_WORKERS = 3           # DAU补全同时生成的天数（每天内部还会并行3个统计查询）
+_BACKFILL_STATE_FILE = os.path.join(_PROJECT_ROOT, 'data', 'web', 'dau_backfill.json')
 _DEFAULT_EVENT_STATS = {'group_join_count': 0, 'group_leave_count': 0, 'friend_add_count': 0, 'friend_remove_count': 0}
 
 def _ensure_path():
@@ -48,19 +53,10 @@ def get_statistics_data(force_refresh=False, add_error_log=None):
 def load_historical_dau_data_optimized(add_error_log=None):
     try:
         dau, today = _get_dau_analytics(), datetime.now()
-        
-        def load_day(i):
-            try:
-                if data := dau.load_dau_data(d := today - timedelta(days=i)):
-                    data['display_date'] = d.strftime('%m-%d')
-                    return data
-            except:
-                pass
-            return None
-        
-        with concurrent.futures.ThreadPoolExecutor(max_workers=8) as ex:
-            results = [r for f in concurrent.futures.as_completed({ex.submit(load_day, i): i for i in range(1, 31)}) if (r := f.result(timeout=5))]
-        results.sort(key=lambda x: x.get('date', ''))
+        # 近30天一次范围查询取回，不再逐天查询
+        results = list(dau.load_dau_range(today - timedelta(days=30), today - timedelta(days=1)).values())
+        for data in results:
+            data['display_date'] = data.get('date', '')[5:]
         return results
     except Exception as e:
         if add_error_log:
@@ -102,52 +98,133 @@ def get_today_dau_data(force_refresh=False, add_error_log=None):
             add_error_log(f"获取今日DAU数据失败: {e}")
         return {'message_stats': {}, 'user_stats': {}, 'command_stats': [], 'event_stats': _DEFAULT_EVENT_STATS.copy(), 'error': str(e)}
 
+def _dau_needs_backfill(data):
+    # 没有数据，或者是空记录（只有事件统计，没有消息统计）
+    if not data:
+        return True
+    ms = data.get('message_stats', {})
+    return ms.get('total_messages', 0) == 0 and not ms.get('top_groups') and not ms.get('top_users')
+
+def _find_missing_dau_dates(dau, today):
+    saved = dau.load_dau_range(today - timedelta(days=_BACKFILL_DAYS), today - timedelta(days=1))
+    dates = [(today - timedelta(days=i)).strftime('%Y-%m-%d') for i in range(_BACKFILL_DAYS, 0, -1)]
+    return [d for d in dates if _dau_needs_backfill(saved.get(d))]
+
+def _load_backfill_checkpoint():
+    try:
+        with open(_BACKFILL_STATE_FILE, 'r', encoding='utf-8') as f:
+            state = json.load(f)
+        return state if state.get('pending') else None
+    except:
+        return None
+
+def _save_backfill_checkpoint(job):
+    try:
+        os.makedirs(os.path.dirname(_BACKFILL_STATE_FILE), exist_ok=True)
+        tmp_path = _BACKFILL_STATE_FILE + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({k: job[k] for k in ('pending', 'generated', 'failed', 'total', 'started_at')}, f, ensure_ascii=False)
+        os.replace(tmp_path, _BACKFILL_STATE_FILE)
+    except:
+        pass
+
+def _clear_backfill_checkpoint():
+    try:
+        os.remove(_BACKFILL_STATE_FILE)
+    except OSError:
+        pass
+
+def _generate_dau_day(dau, date_str):
+    try:
+        return dau.manual_generate_dau(datetime.strptime(date_str, '%Y-%m-%d'))
+    except:
+        return False
+
+def _run_dau_backfill(job):
+    global historical_cache_loaded
+    dau = _get_dau_analytics()
+    try:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=_BACKFILL_WORKERS, thread_name_prefix="DAUBackfill") as ex:
+            futures = {ex.submit(_generate_dau_day, dau, d): d for d in list(job['pending'])}
+            for future in concurrent.futures.as_completed(futures):
+                date_str = futures[future]
+                with _backfill_lock:
+                    job['pending'].remove(date_str)
+                    job['generated' if future.result() else 'failed'].append(date_str)
+                    _save_backfill_checkpoint(job)
+        _clear_backfill_checkpoint()
+        status = 'completed'
+    except Exception as e:
+        job['error'] = str(e)
+        status = 'failed'
+    with _backfill_lock:
+        job.update(status=status, end_time=time.time())
+    historical_cache_loaded = False
+
+def _backfill_summary(job):
+    gen, fail = sorted(job['generated']), sorted(job['failed'])
+    done = len(gen) + len(fail)
+    summary = {'status': job['status'], 'progress': round(done / job['total'] * 100, 1) if job['total'] else 100,
+               'processed': done, 'total_missing': job['total'], 'pending_count': len(job['pending']),
+               'generated_count': len(gen), 'failed_count': len(fail), 'generated_dates': gen, 'failed_dates': fail,
+               'resumed': job.get('resumed', False), 'elapsed_time': job.get('end_time', time.time()) - job['start_time']}
+    if job['status'] == 'running':
+        summary['message'] = f"正在补全DAU数据 {done}/{job['total']}"
+    elif job['status'] == 'completed':
+        summary['message'] = f"检测到{job['total']}天的DAU数据缺失或无效，成功生成{len(gen)}天，失败{len(fail)}天"
+    else:
+        summary['message'] = f"补全DAU数据中断: {job.get('error', '未知错误')}，可重新补全以继续"
+    return summary
+
 def complete_dau_data():
+    """启动（或继续）近30天DAU补全任务，立即返回任务进度
+
+    缺失日期由一次范围查询得出，最多 _BACKFILL_WORKERS 天并行生成；
+    每完成一天写入检查点，进程重启后再次发起时从未完成的日期继续。
+    """
+    global _backfill_job
     try:
-        dau, today = _get_dau_analytics(), datetime.now()
-        missing = []
-        for i in range(1, 31):
-            d = today - timedelta(days=i)
-            data = dau.load_dau_data(d)
-            # 如果没有数据，或者数据无效（total_messages 为 0 但 message_stats_detail 为空）
-            if not data:
-                missing.append(d)
-            elif data.get('message_stats', {}).get('total_messages', 0) == 0:
-                # 检查是否是空记录（只有事件统计，没有消息统计）
-                ms = data.get('message_stats', {})
-                if not ms.get('top_groups') and not ms.get('top_users'):
-                    missing.append(d)
-        
-        if not missing:
-            return {'generated_count': 0, 'failed_count': 0, 'total_missing': 0, 'generated_dates': [], 'failed_dates': [], 'message': '近30天DAU数据完整，无需补全'}
-        
-        gen, fail = [], []
-        for d in missing:
-            try:
-                (gen if dau.manual_generate_dau(d) else fail).append(d.strftime('%Y-%m-%d'))
-            except:
-                fail.append(d.strftime('%Y-%m-%d'))
-        
-        return {'generated_count': len(gen), 'failed_count': len(fail), 'total_missing': len(missing),
-                'generated_dates': gen, 'failed_dates': fail,
-                'message': f'检测到{len(missing)}天的DAU数据缺失或无效，成功生成{len(gen)}天，失败{len(fail)}天'}
+        with _backfill_lock:
+            if _backfill_job and _backfill_job['status'] == 'running':
+                return _backfill_summary(_backfill_job)
+            now = time.time()
+            if checkpoint := _load_backfill_checkpoint():
+                job = {'pending': checkpoint['pending'], 'generated': checkpoint.get('generated', []),
+                       'failed': checkpoint.get('failed', []), 'resumed': True}
+                job['total'] = len(job['pending']) + len(job['generated']) + len(job['failed'])
+            else:
+                missing = _find_missing_dau_dates(_get_dau_analytics(), datetime.now())
+                if not missing:
+                    return {'status': 'completed', 'progress': 100, 'processed': 0, 'total_missing': 0, 'pending_count': 0,
+                            'generated_count': 0, 'failed_count': 0, 'generated_dates': [], 'failed_dates': [],
+                            'message': f'近{_BACKFILL_DAYS}天DAU数据完整，无需补全'}
+                job = {'pending': missing, 'generated': [], 'failed': [], 'total': len(missing), 'resumed': False}
+            job.update(status='running', start_time=now, started_at=checkpoint.get('started_at', now) if checkpoint else now)
+            _save_backfill_checkpoint(job)
+            _backfill_job = job
+            threading.Thread(target=_run_dau_backfill, args=(job,), daemon=True, name="DAUBackfill").start()
+            return _backfill_summary(job)
     except Exception as e:
         raise Exception(f"补全DAU数据失败: {e}")
 
+def get_dau_backfill_status():
+    with _backfill_lock:
+        if _backfill_job:
+            return _backfill_summary(_backfill_job)
+    checkpoint = _load_backfill_checkpoint()
+    return {'status': 'interrupted' if checkpoint else 'idle', 'pending_count': len(checkpoint['pending']) if checkpoint else 0,
+            'message': '上次补全未完成，可重新补全以继续' if checkpoint else '没有进行中的补全任务'}
+
 def get_available_dau_dates(add_error_log=None):
     try:
         dau, today = _get_dau_analytics(), datetime.now().date()
+        # 一次范围查询取出近31天有记录的日期
         dates = []
-        for i in range(31):
-            d = today - timedelta(days=i)
-            if d >= today - timedelta(days=30):
-                try:
-                    if dau.load_dau_data(datetime.combine(d, datetime.min.time())):
-                        is_today = d == today
-                        dates.append({'value': 'today' if is_today else d.strftime('%Y-%m-%d'), 'date': d.strftime('%Y-%m-%d'),
-                                      'display': "今日数据" if is_today else f"{d.strftime('%m-%d')} ({d.strftime('%Y-%m-%d')})", 'is_today': is_today})
-                except:
-                    continue
+        for date_str in dau.get_dau_dates(today - timedelta(days=30), today):
+            d = datetime.strptime(date_str, '%Y-%m-%d').date()
+            is_today = d == today
+            dates.append({'value': 'today' if is_today else date_str, 'date': date_str,
+                          'display': "今日数据" if is_today else f"{d.strftime('%m-%d')} ({date_str})", 'is_today': is_today})
         
         if not any(x['is_today'] for x in dates):
             dates.append({'value': 'today', 'date': today.strftime('%Y-%m-%d'), 'display': '今日数据', 'is_today': True})
@@ -248,6 +325,25 @@ def handle_get_all_statistics_tasks(api_success_response):
 def handle_complete_dau(api_success_response):
     return api_success_response(result=complete_dau_data())
 
+def handle_get_dau_backfill_status(api_success_response):
+    return api_success_response(result=get_dau_backfill_status())
+
+def handle_start_nickname_backfill(api_success_response):
+    _ensure_path()
+    from function.nickname_backfill import start_nickname_backfill
+    started, status = start_nickname_backfill()
+    return api_success_response(result=status, started=started)
+
+def handle_stop_nickname_backfill(api_success_response):
+    _ensure_path()
+    from function.nickname_backfill import stop_nickname_backfill, get_nickname_backfill_status
+    return api_success_response(result=get_nickname_backfill_status(), stopping=stop_nickname_backfill())
+
+def handle_get_nickname_backfill_status(api_success_response):
+    _ensure_path()
+    from function.nickname_backfill import get_nickname_backfill_status
+    return api_success_response(result=get_nickname_backfill_status())
+
 def handle_get_user_nickname(user_id, api_success_response):
     return api_success_response(nickname=fetch_user_nickname(user_id), user_id=user_id)
 
@@ -46,10 +46,60 @@ def handle_get_system_status():
             except:
                 pass
         
-        return jsonify({'success': True, 'websocket_available': ws_available, 'websocket_enabled': ws_enabled, 'process_id': pid, 'config_source': 'config.py'})
+        try:
+            from function.ingest_pipeline import get_ingest_stats
+            ingest_stats = get_ingest_stats()
+        except:
+            ingest_stats = None
+        
+        try:
+            from function.db_pool import get_pool_stats
+            db_pool_stats = get_pool_stats()
+        except:
+            db_pool_stats = None
+        
+        try:
+            from function.send_dispatcher import get_send_queue_stats
+            send_queue_stats = get_send_queue_stats()
+        except:
+            send_queue_stats = None
+        
+        try:
+            from function.httpx_pool import get_http_pool_stats
+            http_pool_stats = get_http_pool_stats()
+        except:
+            http_pool_stats = None
+        
+        try:
+            from function.bounded_cache import get_cache_stats
+            cache_stats = get_cache_stats()
+        except:
+            cache_stats = None
+        
+        return jsonify({'success': True, 'websocket_available': ws_available, 'websocket_enabled': ws_enabled, 'process_id': pid,
+                        'ingest_pipeline': ingest_stats, 'db_pool': db_pool_stats, 'send_queue': send_queue_stats, 'http_pool': http_pool_stats, 'caches': cache_stats, 'config_source': 'config.py'})
     except Exception as e:
         return jsonify({'success': False, 'websocket_available': False, 'error': str(e), 'config_source': 'fallback'})
 
+def handle_get_delayed_tasks():
+    try:
+        from function.delayed_tasks import get_delayed_tasks, get_delayed_task_stats
+        return jsonify({'success': True, 'tasks': get_delayed_tasks(), 'stats': get_delayed_task_stats()})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+def handle_cancel_delayed_task():
+    try:
+        from function.delayed_tasks import cancel_delayed_task
+        task_id = (request.get_json(silent=True) or {}).get('id')
+        if not task_id:
+            return jsonify({'success': False, 'error': '缺少任务ID'}), 400
+        if not cancel_delayed_task(task_id):
+            return jsonify({'success': False, 'error': '任务不存在或已执行'}), 404
+        return jsonify({'success': True})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
 def handle_restart_bot():
     try:
         data = request.get_json(silent=True) or {}
@@ -1,11 +1,17 @@
-import os, gc, time, psutil, platform
+import os, gc, time, psutil, platform, threading
 from datetime import datetime, timedelta
+from functools import lru_cache
 
 START_TIME = datetime.now()
 add_error_log = None
 
-_last_gc_time = 0
 _GC_INTERVAL = 30
+_SAMPLE_INTERVAL = 5            # 系统指标采样间隔(秒)
+_DISK_SCAN_INTERVAL = 60        # 框架目录占用重新统计间隔(秒)
+_OBJECTS_COUNT_INTERVAL = 60    # gc 对象计数间隔(秒)，len(gc.get_objects()) 开销与对象数成正比
+_HOT_FILE_WINDOW = 600          # 最近修改过的文件视为活跃文件，每次统计都重新 stat（日志等持续追加的文件）
+_FULL_RESCAN_INTERVAL = 3600    # 定期丢弃增量缓存完整重算一次，兜底原地改写的旧文件
+_SCAN_YIELD_DIRS = 200          # 每统计这么多个目录让出一次，eventlet 下避免长时间占用事件循环
 _FRAMEWORK_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 _IS_WINDOWS = platform.system() == 'Windows'
 _IS_LINUX = platform.system() == 'Linux'
@@ -20,12 +26,18 @@ def set_error_log_func(func):
 
 def get_websocket_status():
     try:
-        from function.ws_client import get_client
-        client = get_client("qq_bot")
-        return "连接成功" if client and hasattr(client, 'connected') and client.connected else "连接失败"
+        from function.ws_client import get_shard_clients
+        clients = get_shard_clients("qq_bot")
+        if not clients:
+            return "连接失败"
+        connected = sum(1 for c in clients if c.connected)
+        if len(clients) == 1:
+            return "连接成功" if connected else "连接失败"
+        return f"连接成功 ({connected}/{len(clients)})" if connected == len(clients) else f"部分连接 ({connected}/{len(clients)})"
     except:
         return "连接失败"
 
+@lru_cache(maxsize=1)
 def get_cpu_model():
     try:
         if _IS_WINDOWS:
@@ -43,44 +55,179 @@ def get_cpu_model():
         pass
     return "未知处理器"
 
-def get_disk_info():
+class _DirSizeCache:
+    """增量目录占用统计：目录 mtime 未变时复用上次的文件大小，只递归子目录并重新 stat 活跃文件
+
+    目录内新增、删除、重命名文件都会更新目录 mtime，因此只有原地追加写入的文件需要单独跟踪；
+    上次统计时修改时间在 _HOT_FILE_WINDOW 内的文件记为活跃文件，每次统计都重新取大小。
+    """
+    __slots__ = ('_entries', '_visited')
+
+    def __init__(self):
+        self._entries = {}   # 目录路径 -> (mtime, 冷文件总大小, {活跃文件路径: 大小}, 子目录列表)
+        self._visited = 0
+
+    def scan(self, root):
+        """返回 (总大小, {一级子目录名: 大小})"""
+        entries, breakdown = {}, {}
+        total = self._scan_dir(root, time.time(), entries, breakdown)
+        self._entries = entries
+        return total, breakdown
+
+    def _scan_dir(self, path, now, entries, breakdown=None):
+        self._visited += 1
+        if self._visited % _SCAN_YIELD_DIRS == 0:
+            time.sleep(0)
+        try:
+            mtime = os.stat(path).st_mtime
+        except OSError:
+            return 0
+        cached = self._entries.get(path)
+        if cached and cached[0] == mtime:
+            cold, hot = cached[1], {}
+            for file_path in cached[2]:
+                try:
+                    st = os.stat(file_path)
+                except OSError:
+                    continue
+                if now - st.st_mtime < _HOT_FILE_WINDOW:
+                    hot[file_path] = st.st_size
+                else:
+                    cold += st.st_size
+            subdirs = cached[3]
+        else:
+            cold, hot, subdirs = 0, {}, []
+            try:
+                with os.scandir(path) as it:
+                    for entry in it:
+                        try:
+                            if entry.is_dir(follow_symlinks=False):
+                                subdirs.append(entry.path)
+                            elif entry.is_file():
+                                st = entry.stat()
+                                if now - st.st_mtime < _HOT_FILE_WINDOW:
+                                    hot[entry.path] = st.st_size
+                                else:
+                                    cold += st.st_size
+                        except OSError:
+                            continue
+            except OSError:
+                return 0
+        entries[path] = (mtime, cold, hot, subdirs)
+        total = cold + sum(hot.values())
+        for sub in subdirs:
+            sub_size = self._scan_dir(sub, now, entries)
+            if breakdown is not None:
+                breakdown[os.path.basename(sub)] = sub_size
+            total += sub_size
+        return total
+
+def _disk_usage_fallback():
+    return {'total': 100*1024**3, 'used': 50*1024**3, 'free': 50*1024**3, 'percent': 50.0, 'framework_usage': 1024**3}
+
+def _fallback_system_info():
+    return {
+        'cpu_percent': 5.0, 'framework_cpu_percent': 1.0, 'cpu_cores': 4, 'cpu_model': '未知处理器',
+        'memory_percent': 50.0, 'memory_used': 400.0, 'memory_total': 8192.0, 'total_memory': 8192.0,
+        'system_memory_total_bytes': 8192.0 * 1024 * 1024, 'framework_memory_percent': 5.0, 'framework_memory_total': 400.0,
+        'gc_counts': [0, 0, 0], 'objects_count': 1000,
+        'disk_info': _disk_usage_fallback(),
+        'uptime': 3600, 'system_uptime': 86400,
+        'start_time': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'boot_time': (datetime.now() - timedelta(days=1)).strftime('%Y-%m-%d %H:%M:%S'),
+        'system_version': 'Windows 10 64-bit'
+    }
+
+def get_cache_stats():
     try:
-        disk = psutil.disk_usage(os.path.abspath(os.getcwd()))
-        framework_size = sum(os.path.getsize(os.path.join(r, f)) for r, _, files in os.walk(_FRAMEWORK_ROOT) for f in files if os.path.isfile(os.path.join(r, f)))
-        return {'total': float(disk.total), 'used': float(disk.used), 'free': float(disk.free), 'percent': float(disk.percent), 'framework_usage': float(framework_size)}
+        from function.bounded_cache import get_cache_stats as _get_cache_stats
+        return _get_cache_stats()
     except:
-        return {'total': 100*1024**3, 'used': 50*1024**3, 'free': 50*1024**3, 'percent': 50.0, 'framework_usage': 1024**3}
+        return {}
 
-def get_system_info():
-    global _last_gc_time
-    
-    try:
-        process, now = psutil.Process(os.getpid()), time.time()
-        
-        if now - _last_gc_time >= _GC_INTERVAL:
-            gc.collect(0)
-            _last_gc_time = now
-        
-        mem = process.memory_info()
+class SystemMetricsSampler:
+    """后台系统指标采样：按各自间隔刷新 CPU/内存、gc 对象数与框架目录占用，状态接口只读取最新快照"""
+    __slots__ = ('_process', '_snapshot', '_disk_cache', '_framework_usage', '_top_level_usage',
+                 '_objects_count', '_last_disk_scan', '_last_full_scan', '_last_objects_count', '_last_gc', '_thread')
+    _instance = None
+    _init_lock = threading.Lock()
+
+    @classmethod
+    def get_instance(cls):
+        if cls._instance is None:
+            with cls._init_lock:
+                if cls._instance is None:
+                    cls._instance = cls()
+        return cls._instance
+
+    def __init__(self):
+        self._process = psutil.Process(os.getpid())
+        self._disk_cache = _DirSizeCache()
+        self._framework_usage = 0.0
+        self._top_level_usage = {}
+        self._objects_count = len(gc.get_objects())
+        self._last_disk_scan = self._last_full_scan = self._last_objects_count = self._last_gc = 0.0
+        # cpu_percent(None) 返回与上次调用之间的占用率，先调用一次建立基准，之后采样不再阻塞
+        self._process.cpu_percent(None)
+        psutil.cpu_percent(None)
+        self._snapshot = self._sample()
+        self._thread = threading.Thread(target=self._run, daemon=True, name="SystemMetricsSampler")
+        self._thread.start()
+
+    @property
+    def snapshot(self):
+        return self._snapshot
+
+    def _run(self):
+        while True:
+            now = time.time()
+            try:
+                if now - self._last_gc >= _GC_INTERVAL:
+                    gc.collect(0)
+                    self._last_gc = now
+                if now - self._last_objects_count >= _OBJECTS_COUNT_INTERVAL:
+                    self._objects_count = len(gc.get_objects())
+                    self._last_objects_count = now
+                if now - self._last_disk_scan >= _DISK_SCAN_INTERVAL:
+                    self._scan_framework_dir()
+                    self._last_disk_scan = time.time()
+                self._snapshot = self._sample()
+            except Exception as e:
+                if add_error_log:
+                    add_error_log(f"采样系统信息失败: {e}")
+            time.sleep(_SAMPLE_INTERVAL)
+
+    def _scan_framework_dir(self):
+        now = time.time()
+        if now - self._last_full_scan >= _FULL_RESCAN_INTERVAL:
+            self._disk_cache = _DirSizeCache()
+            self._last_full_scan = now
+        total, breakdown = self._disk_cache.scan(_FRAMEWORK_ROOT)
+        self._framework_usage = float(total)
+        self._top_level_usage = breakdown
+
+    def _sample(self):
+        mem = self._process.memory_info()
         rss_mb = mem.rss / 1024 / 1024
         sys_mem = psutil.virtual_memory()
         sys_mem_total_mb = sys_mem.total / 1024 / 1024
-        
         try:
             cpu_cores = psutil.cpu_count(logical=True)
-            cpu_pct = max(process.cpu_percent(interval=0.05), 1.0)
-            sys_cpu_pct = max(psutil.cpu_percent(interval=0.05), 5.0)
+            cpu_pct = max(self._process.cpu_percent(None), 1.0)
+            sys_cpu_pct = max(psutil.cpu_percent(None), 5.0)
         except:
             cpu_cores, cpu_pct, sys_cpu_pct = 1, 1.0, 5.0
-        
-        app_uptime = int((datetime.now() - START_TIME).total_seconds())
-        
         try:
             boot = datetime.fromtimestamp(psutil.boot_time())
-            sys_uptime, boot_str = int((datetime.now() - boot).total_seconds()), boot.strftime('%Y-%m-%d %H:%M:%S')
+            boot_str = boot.strftime('%Y-%m-%d %H:%M:%S')
         except:
-            sys_uptime, boot_str = app_uptime, datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        
+            boot, boot_str = START_TIME, START_TIME.strftime('%Y-%m-%d %H:%M:%S')
+        try:
+            disk = psutil.disk_usage(os.path.abspath(os.getcwd()))
+            disk_info = {'total': float(disk.total), 'used': float(disk.used), 'free': float(disk.free), 'percent': float(disk.percent),
+                         'framework_usage': self._framework_usage, 'framework_breakdown': dict(self._top_level_usage)}
+        except:
+            disk_info = _disk_usage_fallback()
         return {
             'cpu_percent': float(sys_cpu_pct), 'framework_cpu_percent': float(cpu_pct),
             'cpu_cores': cpu_cores, 'cpu_model': get_cpu_model(),
@@ -89,23 +236,28 @@ def get_system_info():
             'system_memory_total_bytes': float(sys_mem.total),
             'framework_memory_percent': float((rss_mb / sys_mem_total_mb) * 100 if sys_mem_total_mb > 0 else 5.0),
             'framework_memory_total': float(rss_mb),
-            'gc_counts': list(gc.get_count()), 'objects_count': len(gc.get_objects()),
-            'disk_info': get_disk_info(),
-            'uptime': app_uptime, 'system_uptime': sys_uptime,
-            'start_time': START_TIME.strftime('%Y-%m-%d %H:%M:%S'), 'boot_time': boot_str,
-            'system_version': platform.platform()
+            'gc_counts': list(gc.get_count()), 'objects_count': self._objects_count,
+            'disk_info': disk_info,
+            'boot': boot, 'boot_time': boot_str,
+            'system_version': platform.platform(),
+            'caches': get_cache_stats(),
+            'sampled_at': time.time(),
         }
+
+def get_disk_info():
+    return get_system_info()['disk_info']
+
+def get_system_info():
+    """返回后台采样的最新快照（首次调用时启动采样线程），只补充运行时长等随时间变化的字段"""
+    try:
+        info = dict(SystemMetricsSampler.get_instance().snapshot)
+        now = datetime.now()
+        boot = info.pop('boot')
+        info['uptime'] = int((now - START_TIME).total_seconds())
+        info['system_uptime'] = int((now - boot).total_seconds())
+        info['start_time'] = START_TIME.strftime('%Y-%m-%d %H:%M:%S')
+        return info
     except Exception as e:
         if add_error_log:
             add_error_log(f"获取系统信息失败: {e}")
-        return {
-            'cpu_percent': 5.0, 'framework_cpu_percent': 1.0, 'cpu_cores': 4, 'cpu_model': '未知处理器',
-            'memory_percent': 50.0, 'memory_used': 400.0, 'memory_total': 8192.0, 'total_memory': 8192.0,
-            'system_memory_total_bytes': 8192.0 * 1024 * 1024, 'framework_memory_percent': 5.0, 'framework_memory_total': 400.0,
-            'gc_counts': [0, 0, 0], 'objects_count': 1000,
-            'disk_info': {'total': 100*1024**3, 'used': 50*1024**3, 'free': 50*1024**3, 'percent': 50.0, 'framework_usage': 1024**3},
-            'uptime': 3600, 'system_uptime': 86400,
-            'start_time': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-            'boot_time': (datetime.now() - timedelta(days=1)).strftime('%Y-%m-%d %H:%M:%S'),
-            'system_version': 'Windows 10 64-bit'
-        }
+        return _fallback_system_info()